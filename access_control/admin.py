@@ -1,12 +1,34 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
 from django.utils.html import format_html
 from .models import (
     AdminProfile,
     CountryPermission,
     ADGroup,
     ADUser,
+    ADSyncJob,
+    ADSyncState,
     SystemDefaultConfig
 )
+from .search import search_ad_groups, search_ad_users
+
+
+class DirectorySearchMixin:
+    """
+    Busca do admin pelo search_document (índice de trigramas no PostgreSQL,
+    tolerante a erros de digitação) em vez de ILIKE '%termo%' em cada campo
+    de search_fields. Sem ordenação escolhida na listagem, os resultados vêm
+    por relevância. Termos com '=' (DNs) usam a busca padrão do admin.
+    """
+
+    directory_search = None
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term or '=' in term:
+            return super().get_search_results(request, queryset, search_term)
+        ranked = ORDER_VAR not in request.GET
+        return self.directory_search(queryset, term, ranked=ranked), False
 
 
 @admin.register(AdminProfile)
@@ -157,9 +179,11 @@ class CountryPermissionAdmin(admin.ModelAdmin):
 
 
 @admin.register(ADGroup)
-class ADGroupAdmin(admin.ModelAdmin):
+class ADGroupAdmin(DirectorySearchMixin, admin.ModelAdmin):
     """Admin para grupos do AD."""
     
+    directory_search = staticmethod(search_ad_groups)
+    
     list_display = [
         'name',
         'country_display',
@@ -188,6 +212,7 @@ class ADGroupAdmin(admin.ModelAdmin):
     
     readonly_fields = [
         'last_sync',
+        'removed_at',
         'created_at'
     ]
     
@@ -214,7 +239,8 @@ class ADGroupAdmin(admin.ModelAdmin):
         ('Status e Sincronização', {
             'fields': (
                 'is_active',
-                'last_sync'
+                'last_sync',
+                'removed_at'
             )
         }),
         ('Auditoria', {
@@ -230,9 +256,11 @@ class ADGroupAdmin(admin.ModelAdmin):
 
 
 @admin.register(ADUser)
-class ADUserAdmin(admin.ModelAdmin):
+class ADUserAdmin(DirectorySearchMixin, admin.ModelAdmin):
     """Admin para usuários do AD."""
     
+    directory_search = staticmethod(search_ad_users)
+    
     list_display = [
         'display_name',
         'username',
@@ -268,6 +296,7 @@ class ADUserAdmin(admin.ModelAdmin):
     
     readonly_fields = [
         'last_sync',
+        'removed_at',
         'created_at'
     ]
     
@@ -309,7 +338,8 @@ class ADUserAdmin(admin.ModelAdmin):
         ('Status e Sincronização', {
             'fields': (
                 'is_active',
-                'last_sync'
+                'last_sync',
+                'removed_at'
             )
         }),
         ('Auditoria', {
@@ -376,3 +406,52 @@ class SystemDefaultConfigAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         """Não permite deletar a configuração padrão."""
         return False
+
+
+@admin.register(ADSyncState)
+class ADSyncStateAdmin(admin.ModelAdmin):
+    """Admin para o estado da sincronização incremental do AD."""
+    
+    list_display = [
+        'country_code',
+        'server_name',
+        'highest_usn',
+        'last_full_sync',
+        'last_incremental_sync'
+    ]
+    
+    readonly_fields = ['updated_at']
+
+
+@admin.register(ADSyncJob)
+class ADSyncJobAdmin(admin.ModelAdmin):
+    """Admin para os jobs de sincronização do AD."""
+    
+    list_display = [
+        'id',
+        'country_code',
+        'job_type',
+        'status',
+        'rows_processed',
+        'created_at',
+        'started_at',
+        'finished_at'
+    ]
+    
+    list_filter = [
+        'status',
+        'job_type',
+        'country_code'
+    ]
+    
+    readonly_fields = [
+        'rows_processed',
+        'progress_message',
+        'result',
+        'error',
+        'worker',
+        'created_at',
+        'started_at',
+        'finished_at',
+        'updated_at'
+    ]
@@ -7,8 +7,12 @@ class AccessControlConfig(AppConfig):
     verbose_name = 'Controle de Acesso'
     
     def ready(self):
-        """Importa signals quando o app estiver pronto."""
+        """Importa signals e registra as métricas de sincronização (/metrics/)."""
         try:
             import access_control.signals  # noqa
         except ImportError:
-            pass
\ No newline at end of file
+            pass
+
+        from core.metrics import register_collector
+        from .jobs import sync_job_metrics
+        register_collector(sync_job_metrics)
\ No newline at end of file
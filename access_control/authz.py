@@ -0,0 +1,179 @@
+"""
+Contexto de autorização dos administradores.
+
+Carrega o AdminProfile e a CountryPermission do usuário UMA vez por request
+(uma query com select_related).
+
+Com um cache em memória compartilhado entre os processos (Redis/Memcached,
+ver CACHES) o resultado também fica no cache do Django, numa entrada
+versionada por usuário. Salvar ou apagar qualquer um dos dois modelos troca
+a versão (ver access_control.signals), invalidando a entrada em todos os
+workers. Com outro backend (LocMemCache é por processo: um admin revogado
+continuaria com acesso nos demais workers; DatabaseCache custaria mais
+queries que a própria leitura) só vale o contexto do request.
+
+Usage:
+    authz = get_authz(request)          # ou request.authz (middleware)
+    if authz.is_global_admin: ...
+    perm = authz.country_permissions    # CountryPermission ou None
+"""
+
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import AdminProfile, CountryPermission
+
+# Tempo (segundos) que o contexto fica no cache
+AUTHZ_CACHE_TIMEOUT = getattr(settings, 'AUTHZ_CACHE_TIMEOUT', 300)
+
+# Backends em memória compartilhados entre os processos
+SHARED_CACHE_BACKENDS = (
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+)
+
+# Cache do contexto entre requests: só com um backend de SHARED_CACHE_BACKENDS
+AUTHZ_CACHE_ENABLED = getattr(
+    settings, 'AUTHZ_CACHE_ENABLED',
+    settings.CACHES.get('default', {}).get('BACKEND') in SHARED_CACHE_BACKENDS
+)
+
+
+def _version_key(user_id):
+    return f'authz:version:{user_id}'
+
+
+def _entry_key(user_id, version):
+    return f'authz:{user_id}:{version}'
+
+
+def _dump(obj):
+    """Serializa apenas as colunas do objeto (sem relações em cache)."""
+    if obj is None:
+        return None
+    return [getattr(obj, field.attname) for field in obj._meta.concrete_fields]
+
+
+def _load(model, values):
+    """Reconstrói a instância como se viesse do banco (save() faz UPDATE)."""
+    if values is None:
+        return None
+    field_names = [field.attname for field in model._meta.concrete_fields]
+    return model.from_db('default', field_names, values)
+
+
+class AuthorizationContext:
+    """Perfil de admin e permissões de país de um usuário."""
+
+    def __init__(self, admin_profile=None, country_permissions=None):
+        self.admin_profile = admin_profile
+        self.country_permissions = country_permissions
+
+    @property
+    def is_admin(self):
+        return self.admin_profile is not None
+
+    @property
+    def is_global_admin(self):
+        return self.is_admin and self.admin_profile.is_global_admin()
+
+    @property
+    def is_country_admin(self):
+        return self.is_admin and self.admin_profile.is_country_admin()
+
+    @property
+    def country_code(self):
+        return self.admin_profile.country_code if self.is_admin else None
+
+    def has_country_permission(self, permission):
+        """
+        Verifica uma flag de CountryPermission (ex.: 'can_sync_ad_groups').
+
+        Returns:
+            bool: False se o admin não tem permissões de país configuradas
+        """
+        return bool(self.country_permissions and getattr(self.country_permissions, permission))
+
+
+def _query_context(user_id):
+    """Lê o perfil e as permissões de país do banco (1 query)."""
+    admin_profile = (AdminProfile.objects
+                     .select_related('country_permissions')
+                     .filter(user_id=user_id)
+                     .first())
+    country_permissions = None
+    if admin_profile is not None:
+        try:
+            country_permissions = admin_profile.country_permissions
+        except CountryPermission.DoesNotExist:
+            pass
+    return admin_profile, country_permissions
+
+
+def _cached_context(user_id):
+    """Lê o contexto do cache compartilhado ou do banco, gravando-o no cache."""
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(_version_key(user_id), version, None)
+        version = cache.get(_version_key(user_id), version)
+
+    key = _entry_key(user_id, version)
+    cached = cache.get(key)
+    if cached is not None:
+        profile_values, permission_values = cached
+        return _load(AdminProfile, profile_values), _load(CountryPermission, permission_values)
+
+    admin_profile, country_permissions = _query_context(user_id)
+    cache.set(key, (_dump(admin_profile), _dump(country_permissions)), AUTHZ_CACHE_TIMEOUT)
+    return admin_profile, country_permissions
+
+
+def load_authorization_context(user):
+    """
+    Lê o contexto do cache compartilhado (se AUTHZ_CACHE_ENABLED) ou do banco.
+
+    Args:
+        user (User): Usuário autenticado
+
+    Returns:
+        AuthorizationContext: Contexto do usuário
+    """
+    if AUTHZ_CACHE_ENABLED:
+        admin_profile, country_permissions = _cached_context(user.pk)
+    else:
+        admin_profile, country_permissions = _query_context(user.pk)
+
+    # Preenche o cache de relações: user.admin_profile e
+    # admin_profile.country_permissions não geram novas queries nas views
+    user.admin_profile = admin_profile
+    if admin_profile is not None:
+        admin_profile.country_permissions = country_permissions
+
+    return AuthorizationContext(admin_profile, country_permissions)
+
+
+def get_authz(request):
+    """
+    Contexto de autorização do request, carregado uma única vez.
+
+    Returns:
+        AuthorizationContext: Vazio (sem perfil) para usuários anônimos
+    """
+    authz = getattr(request, '_authz', None)
+    if authz is None:
+        if request.user.is_authenticated:
+            authz = load_authorization_context(request.user)
+        else:
+            authz = AuthorizationContext()
+        request._authz = authz
+    return authz
+
+
+def invalidate_authorization_context(user_id):
+    """Troca a versão do usuário: entradas antigas deixam de ser lidas."""
+    if AUTHZ_CACHE_ENABLED:
+        cache.set(_version_key(user_id), uuid.uuid4().hex, None)
@@ -0,0 +1,207 @@
+"""
+Representação compacta das permissões (can_*) como máscara de bits.
+
+- PermissionSet: inteiro imutável com operações de conjunto (união, máscara, teste);
+- PermissionSetField: coluna inteira que devolve PermissionSet e oferece os
+  lookups `__has_all` e `__has_any`, compilados para `(coluna & máscara)` no SQL;
+- PermissionQuerySet: `.with_permission('can_view_contracts')` e afins.
+
+Custo no banco: `(coluna & máscara) = máscara` não usa índice B-tree. O
+banco aplica a máscara linha a linha às linhas que os outros filtros já
+selecionaram, ou seja, uma varredura da partição do país. Por isso os
+lookups sempre vêm depois de active_in(country_code): na tela de permissões
+o índice aduser_active_name_idx entrega as linhas do país em ordem e a
+máscara só descarta linhas até completar a página. Uma máscara rara percorre
+o país inteiro. Não há índice de expressão por máscara, porque o filtro
+?has= aceita qualquer combinação das permissões. Uma permissão consultada
+sozinha e com frequência usa a flag booleana com índice parcial
+(ex.: can_login, aduser_can_login_idx).
+
+Exemplo:
+    ADUser.objects.filter(country_code='BR').with_permission('can_login', 'can_view_contracts')
+    ADUser.objects.filter(Q(can_login=True) | Q(effective_permissions__has_all='can_login'))
+"""
+
+from django.db import models
+from django.db.models import Lookup
+
+# Ordem fixa: a posição define o bit de cada permissão (não reordenar)
+PERMISSION_FIELDS = [
+    'can_login',
+    'can_register_suppliers',
+    'can_handle_complaints',
+    'can_view_dashboards',
+    'can_view_contracts',
+    'can_manage_contracts',
+]
+
+PERMISSION_BITS = {field: 1 << index for index, field in enumerate(PERMISSION_FIELDS)}
+
+ALL_PERMISSIONS = sum(PERMISSION_BITS.values())
+
+
+class PermissionSet(int):
+    """
+    Conjunto de permissões armazenado num único inteiro.
+
+    Usage:
+        perms = PermissionSet.from_names('can_login', 'can_view_contracts')
+        perms | group.permission_bits       # união
+        perms & PermissionSet.from_names('can_login')   # máscara
+        perms.test('can_login')             # ou 'can_login' in perms
+    """
+
+    def __new__(cls, value=0):
+        return super().__new__(cls, int(value) & ALL_PERMISSIONS)
+
+    @classmethod
+    def from_names(cls, *names):
+        """Cria o conjunto a partir dos nomes das permissões ('can_login', ...)."""
+        value = 0
+        for name in names:
+            try:
+                value |= PERMISSION_BITS[name]
+            except KeyError:
+                raise ValueError(f"Permissão desconhecida: {name}")
+        return cls(value)
+
+    @classmethod
+    def from_fields(cls, obj):
+        """Cria o conjunto a partir das flags can_* de um objeto ou dicionário."""
+        value = 0
+        for field, bit in PERMISSION_BITS.items():
+            flag = obj.get(field) if isinstance(obj, dict) else getattr(obj, field)
+            if flag:
+                value |= bit
+        return cls(value)
+
+    @classmethod
+    def coerce(cls, value):
+        """Aceita PermissionSet, int, nome ou lista de nomes."""
+        if isinstance(value, str):
+            return cls.from_names(value)
+        if isinstance(value, int):
+            return cls(value)
+        return cls.from_names(*value)
+
+    @classmethod
+    def union_of(cls, sets):
+        """União (OR) de vários conjuntos."""
+        value = 0
+        for item in sets:
+            value |= item
+        return cls(value)
+
+    def union(self, *others):
+        return PermissionSet.union_of((self, *others))
+
+    def mask(self, other):
+        return PermissionSet(self & PermissionSet.coerce(other))
+
+    def test(self, *names):
+        """True se contém todas as permissões informadas."""
+        required = PermissionSet.from_names(*names)
+        return self & required == required
+
+    def test_any(self, *names):
+        """True se contém pelo menos uma das permissões informadas."""
+        return bool(self & PermissionSet.from_names(*names))
+
+    def __contains__(self, name):
+        return self.test(name)
+
+    def __or__(self, other):
+        return PermissionSet(int(self) | int(other))
+
+    __ror__ = __or__
+
+    def __and__(self, other):
+        return PermissionSet(int(self) & int(other))
+
+    __rand__ = __and__
+
+    def names(self):
+        """Lista os nomes das permissões contidas."""
+        return [field for field, bit in PERMISSION_BITS.items() if self & bit]
+
+    def to_dict(self):
+        """Retorna {'can_login': bool, ...} (formato de get_effective_permissions)."""
+        return {field: bool(self & bit) for field, bit in PERMISSION_BITS.items()}
+
+    def __repr__(self):
+        return f"PermissionSet({', '.join(self.names())})"
+
+
+class PermissionSetField(models.PositiveIntegerField):
+    """Coluna inteira com as permissões; valores lidos do banco viram PermissionSet."""
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return PermissionSet(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, PermissionSet):
+            return value
+        return PermissionSet.coerce(value)
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        return int(PermissionSet.coerce(value))
+
+
+class _PermissionLookup(Lookup):
+    """Base dos lookups bit a bit; o lado direito aceita nomes ou máscara."""
+
+    def get_db_prep_lookup(self, value, connection):
+        return '%s', [int(PermissionSet.coerce(value))]
+
+    def _operands(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return lhs, list(lhs_params), rhs, list(rhs_params)
+
+
+@PermissionSetField.register_lookup
+class HasAllPermissions(_PermissionLookup):
+    """`campo__has_all=...`: (campo & máscara) = máscara (sem índice; ver o módulo)"""
+    lookup_name = 'has_all'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params, rhs, rhs_params = self._operands(compiler, connection)
+        return f'({lhs} & {rhs}) = {rhs}', lhs_params + rhs_params + rhs_params
+
+
+@PermissionSetField.register_lookup
+class HasAnyPermission(_PermissionLookup):
+    """`campo__has_any=...`: (campo & máscara) <> 0 (sem índice; ver o módulo)"""
+    lookup_name = 'has_any'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params, rhs, rhs_params = self._operands(compiler, connection)
+        return f'({lhs} & {rhs}) <> 0', lhs_params + rhs_params
+
+
+class PermissionQuerySet(models.QuerySet):
+    """
+    QuerySet com filtros de permissão compilados para SQL bit a bit.
+    O modelo define em `permission_set_field` qual coluna é consultada.
+    Combine sempre com um filtro indexado (active_in): os filtros de
+    permissão percorrem as linhas do país.
+    """
+
+    def _permission_field(self):
+        return self.model.permission_set_field
+
+    def with_permission(self, *names):
+        """Registros que possuem TODAS as permissões informadas."""
+        return self.filter(**{f'{self._permission_field()}__has_all': PermissionSet.from_names(*names)})
+
+    def with_any_permission(self, *names):
+        """Registros que possuem PELO MENOS UMA das permissões informadas."""
+        return self.filter(**{f'{self._permission_field()}__has_any': PermissionSet.from_names(*names)})
+
+    def without_permission(self, *names):
+        """Registros que NÃO possuem nenhuma das permissões informadas."""
+        return self.exclude(**{f'{self._permission_field()}__has_any': PermissionSet.from_names(*names)})
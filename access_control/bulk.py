@@ -0,0 +1,327 @@
+"""
+Reconciliação em lote (bulk upsert) de objetos sincronizados do AD.
+
+Em vez de um update_or_create por entrada (2-3 queries por linha), cada lote:
+1. carrega as linhas existentes numa única query (por DN ou chave natural);
+2. calcula as diferenças em Python;
+3. grava apenas o necessário com bulk_create / bulk_update, atualizando
+   somente os campos que realmente mudaram.
+
+O DN é único na tabela inteira: um DN que já pertence a outro país é
+recusado (contador 'conflicts'), nunca atualizado nem movido de país. Os
+INSERTs usam ON CONFLICT DO NOTHING, então um DN gravado por outro país
+entre a leitura e a escrita também vira conflito, e só as linhas realmente
+inseridas contam como criadas.
+
+Objetos que sumiram do AD são encontrados por diferença de conjuntos entre
+os DNs lidos numa varredura completa e os existentes no banco
+(deactivate_missing) e desativados com um UPDATE por bloco.
+"""
+
+import logging
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ADGroup, ADUser
+from .search import build_search_document
+
+logger = logging.getLogger(__name__)
+
+# Linhas por statement nos bulk_create/bulk_update
+BULK_BATCH_SIZE = 1000
+
+# Fração máxima dos objetos do país que uma varredura pode dar como removidos;
+# acima disso a desativação é suspensa (base de busca errada, AD incompleto)
+AD_SYNC_MAX_REMOVED_RATIO = getattr(settings, 'AD_SYNC_MAX_REMOVED_RATIO', 0.5)
+
+
+def empty_result():
+    """Retorna o dicionário de contadores de uma reconciliação."""
+    return {'created': 0, 'updated': 0, 'unchanged': 0, 'deactivated': 0, 'removed': 0, 'conflicts': 0}
+
+
+def merge_results(total, partial):
+    """Soma os contadores de `partial` em `total` (in-place) e retorna `total`."""
+    for key, value in partial.items():
+        total[key] = total.get(key, 0) + value
+    return total
+
+
+def bulk_reconcile(model, country_code, rows, fields, natural_key):
+    """
+    Reconcilia um lote de entradas do AD com a tabela `model`.
+    Objetos marcados como removidos do AD que reaparecem no lote voltam a
+    valer (removed_at é limpo).
+
+    Args:
+        model: ADUser ou ADGroup
+        country_code (str): País dono das entradas
+        rows (list[dict]): Entradas do lote; cada uma com 'distinguished_name'
+            e todos os campos listados em `fields`
+        fields (list[str]): Campos sincronizados (comparados e atualizados)
+        natural_key (str): Campo único por país ('username' ou 'name'), usado
+            para reencontrar objetos que mudaram de DN (movidos/renomeados)
+
+    Returns:
+        dict: {'created': int, 'updated': int, 'unchanged': int, 'deactivated': int,
+               'conflicts': int} — `conflicts`: DNs que já pertencem a outro país
+    """
+    result = empty_result()
+    if not rows:
+        return result
+
+    # Entradas repetidas no lote: vale a última
+    rows = list({row['distinguished_name']: row for row in rows}.values())
+
+    dns = [row['distinguished_name'] for row in rows]
+    keys = [row[natural_key] for row in rows if row.get(natural_key)]
+
+    # 1 query: existentes por DN ou pela chave natural (objeto movido de OU)
+    existing = model.objects.filter(
+        Q(distinguished_name__in=dns) |
+        Q(country_code=country_code, **{f'{natural_key}__in': keys})
+    ).only('pk', 'country_code', 'distinguished_name', 'removed_at', *fields, *model.search_document_fields)
+
+    by_dn = {}
+    by_key = {}
+    foreign_dns = set()
+    for obj in existing:
+        if obj.country_code != country_code:
+            foreign_dns.add(obj.distinguished_name)
+            continue
+        by_dn[obj.distinguished_name] = obj
+        by_key[getattr(obj, natural_key)] = obj
+
+    # Campos de texto que alimentam o search_document (todos sincronizados)
+    document_fields = model.search_document_fields
+
+    now = timezone.now()
+    to_create = []
+    to_update = []
+    changed_fields = set()
+
+    for row in rows:
+        # DN de outro país (mesma floresta em dois diretórios): não é nosso
+        if row['distinguished_name'] in foreign_dns:
+            result['conflicts'] += 1
+            continue
+
+        obj = by_dn.get(row['distinguished_name']) or by_key.get(row.get(natural_key))
+
+        if obj is None:
+            obj = model(country_code=country_code, last_sync=now, **row)
+            obj.search_document = build_search_document(obj, document_fields)
+            to_create.append(obj)
+            continue
+
+        diff = [f for f in ['distinguished_name', *fields] if getattr(obj, f) != row[f]]
+        if obj.removed_at is not None:
+            obj.removed_at = None
+            diff.append('removed_at')
+        if not diff:
+            result['unchanged'] += 1
+            continue
+
+        if 'is_active' in diff and obj.is_active and not row['is_active']:
+            result['deactivated'] += 1
+        else:
+            result['updated'] += 1
+
+        for f in diff:
+            if f in row:
+                setattr(obj, f, row[f])
+        if set(diff) & set(document_fields):
+            obj.search_document = build_search_document(obj, document_fields)
+            diff.append('search_document')
+        obj.last_sync = now
+        changed_fields.update(diff)
+        to_update.append(obj)
+
+    if to_create:
+        created = _bulk_insert(model, country_code, to_create)
+        result['created'] += created
+        result['conflicts'] += len(to_create) - created
+
+    if result['conflicts']:
+        logger.warning(
+            f"⚠️ {model._meta.verbose_name_plural} ({country_code}): {result['conflicts']} DN(s) "
+            f"já pertencem a outro país e foram ignorados"
+        )
+
+    if to_update:
+        model.objects.bulk_update(
+            to_update,
+            sorted(changed_fields | {'last_sync'}),
+            batch_size=BULK_BATCH_SIZE
+        )
+
+    return result
+
+
+def _bulk_insert(model, country_code, objs):
+    """
+    Insere os novos objetos com ON CONFLICT DO NOTHING (distinguished_name).
+
+    Um DN inserido por outro país entre a leitura e a escrita continua dele.
+    (Sincronizações do mesmo país não rodam ao mesmo tempo: access_control.jobs.)
+
+    Returns:
+        int: Quantidade de linhas inseridas para `country_code`
+    """
+    model.objects.bulk_create(objs, batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
+    created = 0
+    dns = [obj.distinguished_name for obj in objs]
+    for start in range(0, len(dns), BULK_BATCH_SIZE):
+        created += model.objects.filter(
+            country_code=country_code,
+            distinguished_name__in=dns[start:start + BULK_BATCH_SIZE],
+        ).count()
+    return created
+
+
+def deactivate_missing(model, country_code, seen_dns, max_ratio=None):
+    """
+    Marca como removidos do AD os objetos do país cujo DN não veio na varredura.
+
+    A diferença é calculada em memória (1 leitura em streaming de pk + DN) e os
+    removidos são desativados com um UPDATE por bloco de BULK_BATCH_SIZE.
+    Só deve ser chamada após uma varredura COMPLETA e bem-sucedida.
+
+    Args:
+        model: ADUser ou ADGroup
+        country_code (str): País da varredura
+        seen_dns (iterable[str]): DNs retornados pelo AD
+        max_ratio (float): Fração máxima removível (padrão: AD_SYNC_MAX_REMOVED_RATIO)
+
+    Returns:
+        dict: {'removed': int, 'dns': [str], 'skipped': bool} — `skipped`
+            quando a trava de segurança suspendeu a desativação
+    """
+    if max_ratio is None:
+        max_ratio = AD_SYNC_MAX_REMOVED_RATIO
+    seen = {dn.lower() for dn in seen_dns}
+
+    present = 0
+    missing = []
+    rows = (model.objects
+            .filter(country_code=country_code, removed_at__isnull=True)
+            .values_list('pk', 'distinguished_name')
+            .iterator(chunk_size=BULK_BATCH_SIZE))
+    for pk, dn in rows:
+        present += 1
+        if dn.lower() not in seen:
+            missing.append((pk, dn))
+
+    if not missing:
+        return {'removed': 0, 'dns': [], 'skipped': False}
+
+    if not seen or len(missing) > present * max_ratio:
+        logger.warning(
+            f"⚠️ {model._meta.verbose_name_plural} ({country_code}): {len(missing)} de {present} "
+            f"ausentes na varredura; desativação suspensa (limite {max_ratio:.0%})"
+        )
+        return {'removed': 0, 'dns': [], 'skipped': True}
+
+    now = timezone.now()
+    removed = 0
+    for start in range(0, len(missing), BULK_BATCH_SIZE):
+        chunk = [pk for pk, _ in missing[start:start + BULK_BATCH_SIZE]]
+        removed += model.objects.filter(pk__in=chunk, removed_at__isnull=True).update(
+            is_active=False, removed_at=now, last_sync=now
+        )
+
+    return {'removed': removed, 'dns': [dn for _, dn in missing], 'skipped': False}
+
+
+def reconcile_memberships(country_code, memberships, cache=None):
+    """
+    Reconcilia a tabela intermediária ADUser.groups com as associações lidas do AD.
+
+    Chamada a cada lote de grupos da sincronização: só os grupos do lote e os
+    seus membros passam pela memória. Os DNs dos membros são mapeados para ids
+    de ADUser com queries em lote, e o resultado fica no `cache` da
+    sincronização (um usuário costuma estar em vários grupos). A diferença
+    entre os pares desejados e os existentes é aplicada com
+    bulk_create(ignore_conflicts=True) e DELETEs em lote, sem chamar
+    `add()`/`remove()` por linha.
+
+    Membros que não são usuários sincronizados (grupos aninhados, contatos,
+    usuários de outra base) são ignorados.
+
+    Args:
+        country_code (str): País dos grupos
+        memberships (dict): {dn_do_grupo: [dn_do_membro, ...]}; apenas os
+            grupos presentes aqui têm suas associações ajustadas
+        cache (DNCache): DN do membro -> id do ADUser (False se não for
+            usuário sincronizado), compartilhado entre os lotes
+
+    Returns:
+        dict: {'added': int, 'removed': int, 'user_ids': set} — `user_ids`
+            são os usuários cuja associação mudou
+    """
+    from ldap_advanced_utils import DNCache
+
+    Membership = ADUser.groups.through
+    result = {'added': 0, 'removed': 0, 'user_ids': set()}
+    cache = cache if cache is not None else DNCache()
+
+    group_ids = {}
+    group_dns = list(memberships)
+    for start in range(0, len(group_dns), BULK_BATCH_SIZE):
+        group_ids.update(
+            (dn.lower(), pk) for dn, pk in
+            ADGroup.objects.filter(country_code=country_code, distinguished_name__in=group_dns[start:start + BULK_BATCH_SIZE])
+            .values_list('distinguished_name', 'pk')
+        )
+
+    # O AD grava em `member` o DN canônico do objeto, igual ao distinguishedName
+    # sincronizado: a busca exata usa o índice único da coluna
+    pending = list({dn for member_dns in memberships.values() for dn in member_dns if cache.get(dn) is None})
+    for start in range(0, len(pending), BULK_BATCH_SIZE):
+        chunk = pending[start:start + BULK_BATCH_SIZE]
+        found = dict(
+            ADUser.objects.filter(country_code=country_code, distinguished_name__in=chunk)
+            .values_list('distinguished_name', 'pk')
+        )
+        for dn in chunk:
+            cache.set(dn, found.get(dn, False))
+
+    desired = set()
+    synced_group_ids = set()
+    for group_dn, member_dns in memberships.items():
+        group_id = group_ids.get(group_dn.lower())
+        if group_id is None:
+            continue
+        synced_group_ids.add(group_id)
+        for member_dn in member_dns:
+            user_id = cache.get(member_dn)
+            if user_id:
+                desired.add((user_id, group_id))
+
+    existing = {}
+    for pk, user_id, group_id in (Membership.objects
+                                  .filter(adgroup_id__in=synced_group_ids)
+                                  .values_list('pk', 'aduser_id', 'adgroup_id')
+                                  .iterator(chunk_size=BULK_BATCH_SIZE)):
+        existing[(user_id, group_id)] = pk
+
+    to_add = desired - existing.keys()
+    if to_add:
+        Membership.objects.bulk_create(
+            [Membership(aduser_id=user_id, adgroup_id=group_id) for user_id, group_id in to_add],
+            batch_size=BULK_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        result['added'] = len(to_add)
+        result['user_ids'].update(user_id for user_id, _ in to_add)
+
+    stale = {pair: pk for pair, pk in existing.items() if pair not in desired}
+    result['user_ids'].update(user_id for user_id, _ in stale)
+    stale_ids = list(stale.values())
+    for start in range(0, len(stale_ids), BULK_BATCH_SIZE):
+        deleted, _ = Membership.objects.filter(pk__in=stale_ids[start:start + BULK_BATCH_SIZE]).delete()
+        result['removed'] += deleted
+
+    return result
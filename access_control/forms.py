@@ -10,6 +10,7 @@ from django.utils.translation import gettext_lazy as _
 from accounts.models import User
 from .models import AdminProfile, CountryPermission, SystemDefaultConfig, COUNTRY_CHOICES
 from adminpanel.models import LdapDirectory
+from adminpanel.encryption import encrypt_text
 
 
 # ============================================
@@ -600,14 +601,12 @@ class SystemDefaultConfigForm(forms.ModelForm):
         # Processar senha AD se fornecida
         ad_password = self.cleaned_data.get('ad_bind_password_input')
         if ad_password:
-            # TODO: Criptografar a senha antes de salvar
-            instance.ad_bind_password = ad_password
+            instance.ad_bind_password = encrypt_text(ad_password)
         
         # Processar senha SMTP se fornecida
         smtp_password = self.cleaned_data.get('smtp_password_input')
         if smtp_password:
-            # TODO: Criptografar a senha antes de salvar
-            instance.smtp_password = smtp_password
+            instance.smtp_password = encrypt_text(smtp_password)
         
         if commit:
             instance.save()
@@ -0,0 +1,335 @@
+"""
+Fila de jobs de sincronização do AD (sem broker externo).
+
+Os jobs ficam na tabela ADSyncJob. As views apenas enfileiram; o comando
+`python manage.py run_sync_worker` retira os jobs pendentes com
+SELECT ... FOR UPDATE SKIP LOCKED (vários workers podem rodar em paralelo)
+e executa a sincronização fora do ciclo HTTP.
+
+Cada país tem no máximo um job pendente e um em execução (constraints
+parciais de ADSyncJob): novos pedidos são mesclados no job pendente
+('users' + 'groups' vira 'all'; `full` só é acrescentado) e um job só é
+reservado quando não há outro do mesmo país em execução.
+"""
+
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from adminpanel.models import LdapDirectory
+from core.metrics import Gauge
+from .models import ADSyncJob
+from .sync import sync_country_groups, sync_country_users
+
+logger = logging.getLogger(__name__)
+
+# Job "running" sem atualização há mais tempo que isto é considerado órfão
+STALE_JOB_TIMEOUT = timedelta(minutes=30)
+
+# Janela de jobs encerrados lida a cada coleta de métricas (sync_job_metrics)
+AD_SYNC_METRICS_WINDOW = timedelta(days=getattr(settings, 'AD_SYNC_METRICS_WINDOW_DAYS', 7))
+
+
+def default_worker_name():
+    """Identificação do worker (host:pid) gravada no job."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _covers(job, job_type, full):
+    """True se o job já faz tudo o que foi pedido."""
+    return job.job_type in ('all', job_type) and (job.full or not full)
+
+
+def enqueue_sync(country_code, job_type='all', full=False, requested_by=None):
+    """
+    Enfileira uma sincronização para o país.
+
+    Se já existe um job pendente do país, o pedido é mesclado nele (tipo e
+    `full`). Um job em execução que já cobre o pedido é reaproveitado; caso
+    contrário, o novo job fica pendente até ele terminar.
+
+    Args:
+        country_code (str): Código do país
+        job_type (str): 'users', 'groups' ou 'all'
+        full (bool): Força ressincronização completa de usuários
+        requested_by (User): Quem solicitou
+
+    Returns:
+        tuple: (job: ADSyncJob, created: bool)
+    """
+    try:
+        return _enqueue(country_code, job_type, full, requested_by)
+    except IntegrityError:
+        # Outro processo criou o job pendente entre a leitura e o INSERT
+        return _enqueue(country_code, job_type, full, requested_by)
+
+
+def _enqueue(country_code, job_type, full, requested_by):
+    with transaction.atomic():
+        active = {
+            job.status: job
+            for job in ADSyncJob.objects.select_for_update().filter(
+                country_code=country_code, status__in=['pending', 'running']
+            )
+        }
+
+        pending = active.get('pending')
+        if pending:
+            if not _covers(pending, job_type, full):
+                pending.job_type = pending.job_type if pending.job_type == job_type else 'all'
+                pending.full = pending.full or full
+                pending.save(update_fields=['job_type', 'full', 'updated_at'])
+                logger.info(f"📥 Job #{pending.pk} ampliado: {country_code} ({pending.job_type}, full={pending.full})")
+            return pending, False
+
+        running = active.get('running')
+        if running and _covers(running, job_type, full):
+            return running, False
+
+        job = ADSyncJob.objects.create(
+            country_code=country_code,
+            job_type=job_type,
+            full=full,
+            requested_by=requested_by,
+        )
+    logger.info(f"📥 Job de sincronização enfileirado: #{job.pk} {country_code} ({job_type})")
+    return job, True
+
+
+def claim_next_job(worker_name=None):
+    """
+    Reserva o próximo job pendente (FIFO) para este worker.
+
+    Países com job em execução são pulados: o pendente espera o atual terminar.
+
+    Returns:
+        ADSyncJob: Job marcado como 'running', ou None se não houver job disponível
+    """
+    running = ADSyncJob.objects.filter(status='running').values('country_code')
+    try:
+        with transaction.atomic():
+            queryset = (ADSyncJob.objects
+                        .filter(status='pending')
+                        .exclude(country_code__in=running)
+                        .order_by('created_at'))
+            if connection.features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            else:
+                queryset = queryset.select_for_update()
+
+            job = queryset.first()
+            if job is None:
+                return None
+
+            job.status = 'running'
+            job.started_at = timezone.now()
+            job.worker = worker_name or default_worker_name()
+            job.progress_message = 'Iniciando...'
+            job.save(update_fields=['status', 'started_at', 'worker', 'progress_message', 'updated_at'])
+    except IntegrityError:
+        # Outro worker começou um job do mesmo país ao mesmo tempo
+        return None
+    return job
+
+
+def claim_job(job, worker_name=None):
+    """
+    Reserva um job específico, se ele ainda estiver pendente.
+
+    Returns:
+        bool: False se outro worker já o reservou ou se o país tem outro job em execução
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            claimed = ADSyncJob.objects.filter(pk=job.pk, status='pending').update(
+                status='running',
+                started_at=now,
+                worker=worker_name or default_worker_name(),
+                progress_message='Iniciando...',
+                updated_at=now
+            )
+    except IntegrityError:
+        return False
+    if claimed:
+        job.refresh_from_db()
+    return bool(claimed)
+
+
+def fail_stale_jobs(timeout=STALE_JOB_TIMEOUT):
+    """
+    Marca como falhos os jobs 'running' sem atualização recente (worker morto).
+
+    Returns:
+        int: Quantidade de jobs marcados
+    """
+    return ADSyncJob.objects.filter(
+        status='running',
+        updated_at__lt=timezone.now() - timeout
+    ).update(
+        status='failed',
+        error='Worker interrompido durante a execução.',
+        finished_at=timezone.now()
+    )
+
+
+def _report_progress(job, stage, offset, result):
+    """Grava o progresso do job (1 UPDATE por lote; também serve de heartbeat)."""
+    processed = offset + result['created'] + result['updated'] + result['unchanged']
+    ADSyncJob.objects.filter(pk=job.pk, status='running').update(
+        rows_processed=processed,
+        progress_message=f"{stage}: {processed} registros processados",
+        updated_at=timezone.now()
+    )
+    job.rows_processed = processed
+
+
+def run_job(job):
+    """
+    Executa um job já reservado por `claim_next_job`.
+
+    Returns:
+        ADSyncJob: O job atualizado com status final, resultado e duração
+    """
+    try:
+        ldap_config = LdapDirectory.objects.get(country_code=job.country_code, is_active=True)
+        results = {}
+
+        if job.job_type in ('users', 'all'):
+            results['users'] = sync_country_users(
+                ldap_config,
+                full=job.full,
+                progress=lambda r: _report_progress(job, 'Usuários', 0, r)
+            )
+
+        if job.job_type in ('groups', 'all'):
+            offset = job.rows_processed
+            results['groups'] = sync_country_groups(
+                ldap_config,
+                progress=lambda r: _report_progress(job, 'Grupos', offset, r)
+            )
+
+        job.status = 'success'
+        job.result = results
+        job.progress_message = 'Concluído'
+        logger.info(f"✅ Job #{job.pk} concluído ({job.country_code})")
+
+    except LdapDirectory.DoesNotExist:
+        job.status = 'failed'
+        job.error = 'Active Directory não configurado para este país.'
+        logger.error(f"❌ Job #{job.pk}: AD não configurado ({job.country_code})")
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+        logger.error(f"❌ Job #{job.pk} falhou ({job.country_code}): {str(e)}")
+
+    job.finished_at = timezone.now()
+    saved = ADSyncJob.objects.filter(pk=job.pk, status='running').update(
+        status=job.status,
+        result=job.result,
+        error=job.error,
+        progress_message=job.progress_message,
+        rows_processed=job.rows_processed,
+        finished_at=job.finished_at,
+        updated_at=job.finished_at
+    )
+    if not saved:
+        # fail_stale_jobs já encerrou o job: não sobrescreve o status gravado
+        logger.warning(f"⚠️ Job #{job.pk} já havia sido encerrado ({job.country_code}); resultado descartado")
+        job.refresh_from_db()
+    return job
+
+
+def run_pending_jobs(worker_name=None, limit=None):
+    """
+    Executa jobs pendentes até a fila esvaziar (ou até `limit` jobs).
+
+    Returns:
+        int: Quantidade de jobs executados
+    """
+    executed = 0
+    while limit is None or executed < limit:
+        job = claim_next_job(worker_name)
+        if job is None:
+            break
+        run_job(job)
+        executed += 1
+    return executed
+
+
+def sync_job_metrics():
+    """
+    Métricas das sincronizações lidas de ADSyncJob no momento da coleta
+    (coletor de core.metrics, registrado em AccessControlConfig.ready).
+
+    Os jobs rodam no run_sync_worker, que não atende /metrics/: como o
+    resultado de cada job fica no banco, qualquer processo web expõe os
+    mesmos valores. Custa 3 queries por coleta, limitadas aos jobs
+    encerrados em AD_SYNC_METRICS_WINDOW (índice em finished_at) e aos
+    pendentes/em execução: o custo não cresce com o histórico da tabela.
+    Um país sem job encerrado na janela não tem séries ad_sync_last_*.
+
+    Returns:
+        list[Metric]: Métricas montadas a partir da tabela
+    """
+    jobs_recent = Gauge(
+        'ad_sync_jobs_recent', f'Jobs de sincronização encerrados nos últimos {AD_SYNC_METRICS_WINDOW.days} dias',
+        ['country', 'job_type', 'status']
+    )
+    last_finished = Gauge(
+        'ad_sync_last_finished_timestamp_seconds', 'Horário (epoch) do último job encerrado',
+        ['country', 'job_type', 'status']
+    )
+    last_duration = Gauge(
+        'ad_sync_last_duration_seconds', 'Duração do último job concluído', ['country', 'job_type']
+    )
+    last_rows = Gauge(
+        'ad_sync_last_rows', 'Entradas do AD processadas na última sincronização concluída',
+        ['country', 'kind', 'mode']
+    )
+    active = Gauge('ad_sync_jobs_active', 'Jobs pendentes e em execução', ['country', 'status'])
+
+    latest_success = []
+    for row in (ADSyncJob.objects
+                .filter(status__in=['success', 'failed'],
+                        finished_at__gte=timezone.now() - AD_SYNC_METRICS_WINDOW)
+                .values('country_code', 'job_type', 'status')
+                .annotate(total=Count('pk'), last=Max('finished_at'))):
+        labels = {'country': row['country_code'], 'job_type': row['job_type'], 'status': row['status']}
+        jobs_recent.set(row['total'], **labels)
+        last_finished.set(row['last'].timestamp(), **labels)
+        if row['status'] == 'success':
+            latest_success.append(Q(country_code=row['country_code'], job_type=row['job_type'], finished_at=row['last']))
+
+    # Resultado do job concluído mais recente de cada país/tipo
+    kinds = {}
+    if latest_success:
+        jobs = (ADSyncJob.objects
+                .filter(reduce(or_, latest_success), status='success')
+                .order_by('finished_at')
+                .only('country_code', 'job_type', 'result', 'started_at', 'finished_at'))
+        for job in jobs:
+            last_duration.set(job.duration or 0.0, country=job.country_code, job_type=job.job_type)
+            for kind, result in (job.result or {}).items():
+                # Um job 'all' e um 'users' informam o mesmo tipo: vale o mais recente
+                kinds[(job.country_code, kind)] = result
+    for (country_code, kind), result in kinds.items():
+        rows = sum(result.get(key, 0) for key in ('created', 'updated', 'unchanged'))
+        last_rows.set(rows, country=country_code, kind=kind, mode=result.get('mode', 'full'))
+
+    for row in (ADSyncJob.objects
+                .filter(status__in=['pending', 'running'])
+                .values('country_code', 'status')
+                .annotate(total=Count('pk'))):
+        active.set(row['total'], country=row['country_code'], status=row['status'])
+
+    return [jobs_recent, last_finished, last_duration, last_rows, active]
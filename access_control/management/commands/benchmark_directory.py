@@ -0,0 +1,237 @@
+"""
+Mede login, sincronização completa e resolução de membros contra um AD
+simulado em memória (adminpanel.ldap_standin), sem precisar de um DC.
+
+Uso: python manage.py benchmark_directory [--sizes 1000,10000,100000] [--logins 200] [--group-size 5000] [--country UY]
+
+Para cada tamanho, gera um diretório com N usuários, 1 grupo a cada 100
+usuários e um grupo grande (--group-size membros, lido com ranged
+retrieval) e mede:
+- login: MultiCountryLDAPBackend.authenticate (bind + busca + usuário local);
+- leitura: iter_ad_users (só LDAP) e sync_country_users/sync_country_groups
+  completos (LDAP + banco);
+- membros: get_group_members do grupo grande, com cache frio e quente.
+
+Depois da sincronização de grupos, as associações gravadas no banco são
+comparadas com as geradas (inclusive as do grupo grande, acima de
+MaxValRange); divergências fazem o comando terminar com erro.
+
+Tudo roda numa transação desfeita ao final, num país sem AD configurado
+(ou --country): a configuração, os usuários e o estado de sincronização
+criados são descartados. As latências incluem o custo do MOCK_SYNC do
+ldap3 (busca em Python): compare execuções entre si, não com um DC real.
+"""
+
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from accounts.backends import MultiCountryLDAPBackend
+from access_control.models import ADGroup, ADUser
+from access_control.sync import sync_country_groups, sync_country_users
+from adminpanel.ldap_pool import close_pool
+from adminpanel.ldap_standin import STANDIN_PASSWORD, StandInDirectory
+from adminpanel.models import LdapDirectory
+from ldap_advanced_utils import DNCache, get_group_members, iter_ad_users
+
+BENCH_SERVER = 'bench-dc.invalid'
+BENCH_BASE_DN = 'DC=bench,DC=local'
+
+
+class _Rollback(Exception):
+    """Desfaz a transação do benchmark."""
+
+
+def _timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark de login, sincronização e membros de grupo contra um AD simulado'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=str,
+            default='1000,10000,100000',
+            help='Quantidades de usuários, separadas por vírgula (padrão: 1000,10000,100000)',
+        )
+        parser.add_argument(
+            '--logins',
+            type=int,
+            default=200,
+            help='Logins medidos por tamanho (padrão: 200)',
+        )
+        parser.add_argument(
+            '--group-size',
+            type=int,
+            default=5000,
+            help='Membros do grupo grande (padrão: 5000, limitado ao total de usuários)',
+        )
+        parser.add_argument(
+            '--country',
+            type=str,
+            help='País usado no benchmark (padrão: o primeiro sem AD configurado)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--sizes deve ser uma lista de inteiros, ex.: 1000,10000')
+
+        country_code = options.get('country') or self._free_country()
+        self.mismatches = []
+        self.stdout.write(self.style.SUCCESS(f"🚀 Benchmark do diretório (país {country_code})"))
+
+        for size in sizes:
+            self.stdout.write('')
+            self.stdout.write(self.style.MIGRATE_HEADING(f"📦 {size} usuários"))
+            try:
+                with transaction.atomic():
+                    self._run(country_code, size, options['logins'], min(options['group_size'], size))
+                    raise _Rollback()
+            except _Rollback:
+                pass
+            finally:
+                close_pool(country_code)
+
+        self.stdout.write('')
+        if self.mismatches:
+            raise CommandError(
+                f"Associações divergentes do diretório simulado: {', '.join(self.mismatches)}"
+            )
+        self.stdout.write(self.style.SUCCESS('✅ Benchmark concluído (dados descartados)'))
+
+    def _free_country(self):
+        """Primeiro país sem AD e sem usuários sincronizados."""
+        used = set(LdapDirectory.objects.values_list('country_code', flat=True))
+        used.update(ADUser.objects.values_list('country_code', flat=True).distinct())
+        for code, _ in LdapDirectory._meta.get_field('country_code').choices:
+            if code not in used:
+                return code
+        raise CommandError('Todos os países têm AD configurado; informe --country.')
+
+    def _run(self, country_code, size, logins, group_size):
+        directory, _ = LdapDirectory.objects.update_or_create(
+            country_code=country_code,
+            defaults={
+                'name': 'Benchmark',
+                'ldap_server': BENCH_SERVER,
+                'port': 389,
+                'backup_servers': '',
+                'base_dn': BENCH_BASE_DN,
+                'user_search_base': '',
+                'search_filter': '(sAMAccountName={username})',
+                'use_ssl': False,
+                'use_tls': False,
+                'is_active': True,
+            },
+        )
+
+        standin = StandInDirectory(directory.get_connection_string(), BENCH_BASE_DN)
+        _, elapsed = _timed(standin.populate, size, big_group_size=group_size)
+        self.stdout.write(f"   Diretório simulado gerado em {elapsed:.1f}s")
+
+        directory.bind_user_dn = standin.service_dn
+        directory.set_password(STANDIN_PASSWORD)
+        directory.save()
+
+        with standin.installed():
+            self._bench_login(directory, standin, logins)
+            self._bench_sync(directory, size)
+            self._check_memberships(directory, standin, size)
+            self._bench_members(directory, standin.group_dns[0], group_size)
+
+    def _bench_login(self, directory, standin, logins):
+        backend = MultiCountryLDAPBackend()
+        usernames = random.Random(7).choices(standin.usernames, k=logins)
+        latencies = []
+        failures = 0
+        started = time.perf_counter()
+        for username in usernames:
+            user, elapsed = _timed(
+                backend.authenticate, None,
+                username=username, password=STANDIN_PASSWORD, country_code=directory.country_code,
+            )
+            latencies.append(elapsed * 1000)
+            failures += user is None
+        total = time.perf_counter() - started
+
+        latencies.sort()
+        self._line(
+            'Login',
+            f"{logins} logins ({failures} falhas) | p50 {_percentile(latencies, 0.5):.2f} ms, "
+            f"p95 {_percentile(latencies, 0.95):.2f} ms, p99 {_percentile(latencies, 0.99):.2f} ms",
+            logins, total, 'logins',
+        )
+
+    def _bench_sync(self, directory, size):
+        count, elapsed = _timed(lambda: sum(1 for _ in iter_ad_users(directory)))
+        self._line('Leitura de usuários (LDAP)', f"{count} entradas", count, elapsed, 'entradas')
+
+        result, elapsed = _timed(sync_country_users, directory, full=True)
+        self._line(
+            'Sincronização completa de usuários',
+            f"{result['created']} criados, {result['updated']} atualizados",
+            size, elapsed, 'usuários',
+        )
+
+        result, elapsed = _timed(sync_country_users, directory, full=True)
+        self._line(
+            'Ressincronização completa (sem mudanças)',
+            f"{result['unchanged']} inalterados",
+            size, elapsed, 'usuários',
+        )
+
+        result, elapsed = _timed(sync_country_groups, directory)
+        self._line(
+            'Sincronização de grupos',
+            f"{result['created']} grupos, {result['members_added']} associações",
+            result['members_added'], elapsed, 'associações',
+        )
+
+    def _check_memberships(self, directory, standin, size):
+        """Compara as associações sincronizadas com as do diretório simulado."""
+        synced = dict(
+            ADGroup.objects.filter(country_code=directory.country_code)
+            .annotate(members=Count('users'))
+            .values_list('distinguished_name', 'members')
+        )
+        wrong = [
+            group_dn for group_dn in standin.group_dns
+            if synced.get(group_dn) != len(standin.member_dns(group_dn))
+        ]
+        if wrong:
+            self.mismatches.append(f"{size} usuários: {len(wrong)} grupo(s)")
+            for group_dn in wrong[:5]:
+                self.stdout.write(self.style.ERROR(
+                    f"   ❌ {group_dn}: {synced.get(group_dn, 0)} associações, "
+                    f"esperado {len(standin.member_dns(group_dn))}"
+                ))
+        else:
+            self.stdout.write(f"   ✅ Associações conferidas: {len(standin.group_dns)} grupos")
+
+    def _bench_members(self, directory, group_dn, group_size):
+        cache = DNCache()
+        members, elapsed = _timed(get_group_members, directory, group_dn, cache)
+        self._line('Membros do grupo (cache frio)', f"{len(members)}/{group_size} resolvidos", len(members), elapsed, 'membros')
+
+        members, elapsed = _timed(get_group_members, directory, group_dn, cache)
+        self._line('Membros do grupo (cache quente)', f"{len(members)}/{group_size} resolvidos", len(members), elapsed, 'membros')
+
+    def _line(self, label, details, count, elapsed, unit):
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(f"   {label:<42} {elapsed:8.2f}s  {rate:10.0f} {unit}/s  | {details}")
@@ -0,0 +1,199 @@
+"""
+Compara os planos de execução das consultas principais do painel com e sem
+os índices compostos/parciais de access_control (migration 0008).
+
+Uso: python manage.py benchmark_query_plans [--rows 100000] [--countries 10] [--analyze]
+
+Tudo roda dentro de uma transação desfeita ao final: a massa de teste é
+descartada e os índices removidos para o "antes" voltam a existir.
+No PostgreSQL, --analyze usa EXPLAIN ANALYZE (tempos reais). A busca por
+trigramas (migration 0009) também é medida, mas seu índice não é removido.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Q
+
+from access_control.models import ADGroup, ADUser, AdminProfile
+from access_control.search import build_search_document, search_ad_users
+
+# Índices comparados (modelo, nome em Meta.indexes)
+BENCHMARK_INDEXES = [
+    (ADUser, 'aduser_active_name_idx'),
+    (ADUser, 'aduser_can_login_idx'),
+    (ADGroup, 'adgroup_active_name_idx'),
+    (ADGroup, 'adgroup_can_login_idx'),
+    (AdminProfile, 'adminprofile_level_idx'),
+]
+
+FIXTURE_PREFIX = 'bench-'
+
+
+class _Rollback(Exception):
+    """Desfaz a transação do benchmark."""
+
+
+def _queries(country_code):
+    """Consultas medidas (nome, QuerySet)."""
+    cursor_users = ADUser.objects.active_in(country_code).order_by('display_name', 'id')
+    return [
+        ('Usuários ativos do país (1ª página)', cursor_users[:51]),
+        ('Usuários ativos do país (página seguinte)',
+         cursor_users.filter(Q(display_name__gt='User 050000') |
+                             Q(display_name='User 050000', id__gt=0))[:51]),
+        ('Grupos ativos do país (1ª página)',
+         ADGroup.objects.active_in(country_code).order_by('name', 'id')[:51]),
+        ('Grupos com login no país',
+         ADGroup.objects.filter(country_code=country_code, can_login=True).values('id')),
+        ('Usuários com login individual no país',
+         ADUser.objects.filter(country_code=country_code, can_login=True).values('id')),
+        ('Busca de usuários com erro de digitação (por relevância)',
+         search_ad_users(ADUser.objects.active_in(country_code), 'usr 04321', ranked=True)[:20]),
+        ('Admins de país ativos',
+         AdminProfile.objects.filter(access_level='country_admin', is_active=True)
+         .values('country_code').annotate(total=Count('id'))),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Mostra os planos de execução das consultas por país antes e depois dos índices'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=100000,
+            help='Usuários do AD na massa de teste (padrão: 100000)',
+        )
+        parser.add_argument(
+            '--countries',
+            type=int,
+            default=10,
+            help='Países entre os quais a massa é distribuída (padrão: 10)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Execuções de cada consulta para a média de tempo (padrão: 5)',
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Usa EXPLAIN ANALYZE (apenas PostgreSQL)',
+        )
+
+    def handle(self, *args, **options):
+        countries = [code for code, _ in ADUser._meta.get_field('country_code').choices][:options['countries']]
+        country_code = countries[0]
+        explain_options = {}
+        if options['analyze'] and connection.vendor == 'postgresql':
+            explain_options = {'analyze': True, 'buffers': True}
+
+        try:
+            with transaction.atomic():
+                self.stdout.write(f"📦 Criando massa de teste: {options['rows']} usuários em {len(countries)} países...")
+                self._build_fixture(options['rows'], countries)
+                self._analyze_tables()
+
+                results = {}
+                self._toggle_indexes(drop=True)
+                self._analyze_tables()
+                results['antes'] = self._run(country_code, options['repeat'], explain_options)
+
+                self._toggle_indexes(drop=False)
+                self._analyze_tables()
+                results['depois'] = self._run(country_code, options['repeat'], explain_options)
+
+                self._report(results)
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+        self.stdout.write(self.style.SUCCESS('✅ Benchmark concluído (massa de teste descartada)'))
+
+    def _toggle_indexes(self, drop):
+        """
+        Remove/recria os índices dentro da transação atual. O SQL é executado
+        direto (sem o context manager do schema editor, que no SQLite não
+        pode ser aberto dentro de atomic()).
+        """
+        schema_editor = connection.schema_editor(atomic=False)
+        for model, name in BENCHMARK_INDEXES:
+            index = next(index for index in model._meta.indexes if index.name == name)
+            sql = index.remove_sql(model, schema_editor) if drop else index.create_sql(model, schema_editor)
+            schema_editor.execute(sql)
+
+    def _build_fixture(self, rows, countries):
+        """Usuários, grupos e associações distribuídos entre os países."""
+        groups_per_country = max(1, rows // len(countries) // 50)
+        groups = [
+            ADGroup(
+                country_code=code,
+                name=f'{FIXTURE_PREFIX}Group {n:05d}',
+                distinguished_name=f'CN={FIXTURE_PREFIX}{code}-{n},OU=Bench',
+                is_active=n % 10 != 0,
+                can_login=n % 5 == 0,
+            )
+            for code in countries for n in range(groups_per_country)
+        ]
+        users = [
+            ADUser(
+                country_code=countries[n % len(countries)],
+                username=f'{FIXTURE_PREFIX}{n}',
+                display_name=f'User {n:06d}',
+                distinguished_name=f'CN={FIXTURE_PREFIX}{n},OU=Bench',
+                is_active=n % 20 != 0,
+                can_login=n % 100 == 0,
+            )
+            for n in range(rows)
+        ]
+        # bulk_create não passa pelo save(): monta o texto de busca aqui
+        for obj in [*groups, *users]:
+            obj.search_document = build_search_document(obj, obj.search_document_fields)
+        ADGroup.objects.bulk_create(groups, batch_size=1000)
+        ADUser.objects.bulk_create(users, batch_size=2000)
+
+        group_ids = {}
+        for pk, code in ADGroup.objects.filter(name__startswith=FIXTURE_PREFIX).values_list('pk', 'country_code'):
+            group_ids.setdefault(code, []).append(pk)
+        Membership = ADUser.groups.through
+        memberships = []
+        users = ADUser.objects.filter(username__startswith=FIXTURE_PREFIX).values_list('pk', 'country_code')
+        for index, (pk, code) in enumerate(users.iterator(chunk_size=5000)):
+            ids = group_ids[code]
+            memberships.append(Membership(aduser_id=pk, adgroup_id=ids[index % len(ids)]))
+            if len(memberships) >= 5000:
+                Membership.objects.bulk_create(memberships)
+                memberships = []
+        Membership.objects.bulk_create(memberships)
+
+    def _analyze_tables(self):
+        """Atualiza as estatísticas do planner após mudar dados/índices."""
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def _run(self, country_code, repeat, explain_options):
+        results = []
+        for label, queryset in _queries(country_code):
+            plan = queryset.explain(**explain_options)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                list(queryset)
+            elapsed = (time.perf_counter() - started) / repeat * 1000
+            results.append((label, plan, elapsed))
+        return results
+
+    def _report(self, results):
+        for (label, before_plan, before_ms), (_, after_plan, after_ms) in zip(results['antes'], results['depois']):
+            self.stdout.write('')
+            self.stdout.write(self.style.MIGRATE_HEADING(f'📊 {label}'))
+            self.stdout.write(f'   Antes:  {before_ms:8.2f} ms')
+            self.stdout.write(self._indent(before_plan))
+            self.stdout.write(f'   Depois: {after_ms:8.2f} ms')
+            self.stdout.write(self._indent(after_plan))
+
+    def _indent(self, plan):
+        return '\n'.join(f'      {line}' for line in plan.splitlines())
@@ -0,0 +1,89 @@
+"""
+Apaga usuários e grupos removidos do AD há mais de N dias.
+Uso: python manage.py purge_removed_directory_objects [--days 90] [--batch-size 1000] [--countries BR,AR] [--dry-run]
+
+A sincronização apenas desativa (removed_at) o que sumiu do AD; este comando
+remove de vez essas linhas em lotes, cada um na sua transação, para que as
+tabelas acompanhem o tamanho do diretório. Contas apenas desabilitadas no AD
+(is_active=False sem removed_at) nunca são apagadas. As permissões locais
+das linhas apagadas se perdem: se o objeto voltar ao AD, volta sem elas.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from access_control.models import ADGroup, ADUser
+
+# Dias que um objeto removido do AD é mantido antes do expurgo
+AD_REMOVED_RETENTION_DAYS = getattr(settings, 'AD_REMOVED_RETENTION_DAYS', 90)
+
+
+class Command(BaseCommand):
+    help = 'Apaga usuários e grupos removidos do AD há mais de N dias'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=AD_REMOVED_RETENTION_DAYS,
+            help=f'Dias desde a remoção do AD (padrão: {AD_REMOVED_RETENTION_DAYS})',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Linhas apagadas por transação (padrão: 1000)',
+        )
+        parser.add_argument(
+            '--countries',
+            type=str,
+            help='Códigos de país separados por vírgula (padrão: todos)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Apenas conta, sem apagar',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        dry_run = options['dry_run']
+        mode = ' (dry-run)' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"🧹 Expurgo de objetos removidos do AD antes de {cutoff:%Y-%m-%d %H:%M}{mode}"
+        ))
+
+        countries = None
+        if options.get('countries'):
+            countries = [code.strip().upper() for code in options['countries'].split(',') if code.strip()]
+
+        # Usuários primeiro: as associações com os grupos saem junto
+        for model in (ADUser, ADGroup):
+            queryset = model.objects.filter(removed_at__lt=cutoff)
+            if countries:
+                queryset = queryset.filter(country_code__in=countries)
+
+            if dry_run:
+                total = queryset.count()
+            else:
+                total = self._purge(queryset, options['batch_size'])
+            action = 'seriam apagados' if dry_run else 'apagados'
+            self.stdout.write(f"   {model._meta.verbose_name_plural}: {total} {action}")
+
+        self.stdout.write(self.style.SUCCESS('✅ Expurgo concluído' + mode))
+
+    def _purge(self, queryset, batch_size):
+        """Apaga em lotes por pk; cada lote numa transação curta."""
+        total = 0
+        while True:
+            with transaction.atomic():
+                pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                queryset.model.objects.filter(pk__in=pks).delete()
+            total += len(pks)
+        return total
@@ -0,0 +1,89 @@
+"""
+Worker da fila de sincronização do AD.
+Uso: python manage.py run_sync_worker [--once] [--poll-interval 5] [--concurrency 8]
+
+Com --concurrency > 1 os jobs pendentes (por exemplo, os enfileirados pela
+sincronização global) rodam em paralelo, com o limite por DC de
+access_control.orchestrator.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from access_control.jobs import claim_next_job, default_worker_name, fail_stale_jobs, run_job
+from access_control.orchestrator import run_queue_in_parallel
+
+
+class Command(BaseCommand):
+    help = 'Executa os jobs de sincronização do AD enfileirados no banco'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Processa os jobs pendentes e termina (útil em cron)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Segundos entre consultas à fila quando ela está vazia (padrão: 5)',
+        )
+        parser.add_argument(
+            '--worker-name',
+            type=str,
+            help='Identificação do worker (padrão: host:pid)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Jobs executados ao mesmo tempo (padrão: 1)',
+        )
+
+    def handle(self, *args, **options):
+        worker_name = options.get('worker_name') or default_worker_name()
+        once = options['once']
+        poll_interval = options['poll_interval']
+        concurrency = options['concurrency']
+
+        self.stdout.write(self.style.SUCCESS(f"🚀 Worker de sincronização iniciado: {worker_name}"))
+
+        try:
+            while True:
+                close_old_connections()
+
+                stale = fail_stale_jobs()
+                if stale:
+                    self.stdout.write(self.style.WARNING(f"⚠️  {stale} job(s) órfão(s) marcados como falhos"))
+
+                if concurrency > 1:
+                    executed = run_queue_in_parallel(worker_name, max_workers=concurrency, on_finish=self._report_job)
+                    if not executed:
+                        if once:
+                            break
+                        time.sleep(poll_interval)
+                    continue
+
+                job = claim_next_job(worker_name)
+                if job is None:
+                    if once:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                self.stdout.write(f"🔄 Job #{job.pk}: {job.country_code} ({job.get_job_type_display()})")
+                self._report_job(run_job(job))
+
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING("\n⏹️  Worker interrompido."))
+
+    def _report_job(self, job):
+        if job.status == 'success':
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Job #{job.pk} concluído em {job.duration:.1f}s - {job.rows_processed} registros"
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(f"❌ Job #{job.pk} falhou: {job.error}"))
@@ -0,0 +1,89 @@
+"""
+Sincroniza o AD de todos os países com diretório ativo, em paralelo.
+Uso: python manage.py sync_all_directories [--type all] [--full] [--countries BR,AR] [--max-workers 8] [--per-server 2]
+
+Pensado para a varredura noturna (cron). Cada país vira um ADSyncJob, como
+numa sincronização manual; países com job já em execução são pulados.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from access_control.jobs import default_worker_name
+from access_control.orchestrator import sync_all_directories
+
+
+class Command(BaseCommand):
+    help = 'Sincroniza o AD de todos os países em paralelo'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--type',
+            choices=['users', 'groups', 'all'],
+            default='all',
+            help='O que sincronizar (padrão: all)',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Força ressincronização completa de usuários',
+        )
+        parser.add_argument(
+            '--countries',
+            type=str,
+            help='Códigos de país separados por vírgula (padrão: todos)',
+        )
+        parser.add_argument(
+            '--max-workers',
+            type=int,
+            help='Países sincronizados ao mesmo tempo (padrão: AD_SYNC_MAX_WORKERS)',
+        )
+        parser.add_argument(
+            '--per-server',
+            type=int,
+            help='Sincronizações simultâneas por DC (padrão: AD_SYNC_PER_SERVER_LIMIT)',
+        )
+
+    def handle(self, *args, **options):
+        countries = None
+        if options.get('countries'):
+            countries = [code.strip().upper() for code in options['countries'].split(',') if code.strip()]
+
+        worker_name = default_worker_name()
+        self.stdout.write(self.style.SUCCESS(f"🚀 Sincronização global iniciada: {worker_name}"))
+
+        summary = sync_all_directories(
+            job_type=options['type'],
+            full=options['full'],
+            countries=countries,
+            max_workers=options.get('max_workers'),
+            per_server_limit=options.get('per_server'),
+            worker_name=worker_name,
+            on_finish=self._report_job,
+        )
+
+        for job in summary['skipped']:
+            self.stdout.write(self.style.WARNING(f"⏭️  {job.country_code}: job #{job.pk} já em andamento em {job.worker or 'outro worker'}"))
+
+        self.stdout.write('')
+        for kind, counters in summary['totals'].items():
+            details = ', '.join(f"{key}={value}" for key, value in counters.items())
+            self.stdout.write(f"📊 {kind}: {details}")
+
+        slowest = summary['slowest']
+        if slowest:
+            self.stdout.write(f"🐢 Mais lento: {slowest.country_code} ({slowest.duration or 0:.1f}s)")
+        self.stdout.write(
+            f"⏱️  Tempo total: {summary['elapsed']:.1f}s (soma dos países: {summary['sequential']:.1f}s)"
+        )
+
+        if summary['failed']:
+            raise CommandError(f"{len(summary['failed'])} país(es) com falha na sincronização.")
+        self.stdout.write(self.style.SUCCESS(f"✅ {len(summary['succeeded'])} país(es) sincronizados"))
+
+    def _report_job(self, job):
+        if job.status == 'success':
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {job.country_code}: job #{job.pk} em {job.duration or 0:.1f}s - {job.rows_processed} registros"
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(f"❌ {job.country_code}: job #{job.pk} falhou: {job.error}"))
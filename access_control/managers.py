@@ -0,0 +1,34 @@
+"""
+QuerySets/managers com escopo de país.
+
+Quase todas as consultas do painel filtram por (country_code, is_active);
+concentrar esses filtros aqui mantém as views alinhadas com os índices
+declarados nos modelos (ver Meta.indexes).
+
+Usage:
+    ADUser.objects.active_in('BR').order_by('display_name', 'id')
+    ADGroup.objects.active_in('BR').with_permission('can_login')
+"""
+
+from django.db import models
+
+from .bitset import PermissionQuerySet
+
+
+class CountryQuerySet(models.QuerySet):
+    """Filtros por país para modelos com `country_code` e `is_active`."""
+
+    def for_country(self, country_code):
+        """Registros do país (ativos ou não)."""
+        return self.filter(country_code=country_code)
+
+    def active(self):
+        return self.filter(is_active=True)
+
+    def active_in(self, country_code):
+        """Registros ativos do país (usa os índices parciais de ativos)."""
+        return self.filter(country_code=country_code, is_active=True)
+
+
+class DirectoryQuerySet(CountryQuerySet, PermissionQuerySet):
+    """QuerySet de ADUser/ADGroup: escopo de país + filtros de permissão."""
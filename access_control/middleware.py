@@ -0,0 +1,18 @@
+"""
+Middleware do contexto de autorização dos administradores.
+"""
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from .authz import get_authz
+
+
+class AuthorizationContextMiddleware(MiddlewareMixin):
+    """
+    Disponibiliza `request.authz` (AdminProfile + CountryPermission do usuário).
+    O contexto só é carregado se alguma view/decorator o utilizar.
+    Deve vir depois do AuthenticationMiddleware.
+    """
+    
+    def process_request(self, request):
+        request.authz = SimpleLazyObject(lambda: get_authz(request))
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.7 on 2026-10-17 12:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_control', '0002_remove_adgroup_can_create_suppliers_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ADSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country_code', models.CharField(choices=[('BR', '🇧🇷 Brasil'), ('AR', '🇦🇷 Argentina'), ('MX', '🇲🇽 México'), ('DE', '🇩🇪 Alemanha'), ('IT', '🇮🇹 Itália'), ('CN', '🇨🇳 China'), ('US', '🇺🇸 Estados Unidos'), ('ES', '🇪🇸 Espanha'), ('FR', '🇫🇷 França'), ('GB', '🇬🇧 Reino Unido'), ('JP', '🇯🇵 Japão'), ('IN', '🇮🇳 Índia'), ('CA', '🇨🇦 Canadá'), ('AU', '🇦🇺 Austrália'), ('CL', '🇨🇱 Chile'), ('CO', '🇨🇴 Colômbia'), ('PE', '🇵🇪 Peru'), ('UY', '🇺🇾 Uruguai'), ('PY', '🇵🇾 Paraguai'), ('PT', '🇵🇹 Portugal'), ('NL', '🇳🇱 Holanda'), ('BE', '🇧🇪 Bélgica'), ('CH', '🇨🇭 Suíça'), ('AT', '🇦🇹 Áustria'), ('PL', '🇵🇱 Polônia'), ('CZ', '🇨🇿 República Tcheca'), ('RU', '🇷🇺 Rússia'), ('ZA', '🇿🇦 África do Sul'), ('EG', '🇪🇬 Egito'), ('KR', '🇰🇷 Coreia do Sul'), ('TH', '🇹🇭 Tailândia'), ('VN', '🇻🇳 Vietnã'), ('ID', '🇮🇩 Indonésia'), ('MY', '🇲🇾 Malásia'), ('SG', '🇸🇬 Singapura'), ('TR', '🇹🇷 Turquia'), ('SA', '🇸🇦 Arábia Saudita'), ('AE', '🇦🇪 Emirados Árabes')], max_length=2, unique=True, verbose_name='País')),
+                ('server_name', models.CharField(blank=True, default='', max_length=500, verbose_name='Controlador de Domínio')),
+                ('highest_usn', models.BigIntegerField(default=0, verbose_name='Último USN Sincronizado')),
+                ('last_full_sync', models.DateTimeField(blank=True, null=True, verbose_name='Última Sincronização Completa')),
+                ('last_incremental_sync', models.DateTimeField(blank=True, null=True, verbose_name='Última Sincronização Incremental')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado Em')),
+            ],
+            options={
+                'verbose_name': 'Estado de Sincronização do AD',
+                'verbose_name_plural': 'Estados de Sincronização do AD',
+                'ordering': ['country_code'],
+            },
+        ),
+    ]
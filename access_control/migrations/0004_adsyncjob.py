@@ -0,0 +1,42 @@
+# Generated by Django 5.0.7 on 2026-10-17 12:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_control', '0003_adsyncstate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ADSyncJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country_code', models.CharField(choices=[('BR', '🇧🇷 Brasil'), ('AR', '🇦🇷 Argentina'), ('MX', '🇲🇽 México'), ('DE', '🇩🇪 Alemanha'), ('IT', '🇮🇹 Itália'), ('CN', '🇨🇳 China'), ('US', '🇺🇸 Estados Unidos'), ('ES', '🇪🇸 Espanha'), ('FR', '🇫🇷 França'), ('GB', '🇬🇧 Reino Unido'), ('JP', '🇯🇵 Japão'), ('IN', '🇮🇳 Índia'), ('CA', '🇨🇦 Canadá'), ('AU', '🇦🇺 Austrália'), ('CL', '🇨🇱 Chile'), ('CO', '🇨🇴 Colômbia'), ('PE', '🇵🇪 Peru'), ('UY', '🇺🇾 Uruguai'), ('PY', '🇵🇾 Paraguai'), ('PT', '🇵🇹 Portugal'), ('NL', '🇳🇱 Holanda'), ('BE', '🇧🇪 Bélgica'), ('CH', '🇨🇭 Suíça'), ('AT', '🇦🇹 Áustria'), ('PL', '🇵🇱 Polônia'), ('CZ', '🇨🇿 República Tcheca'), ('RU', '🇷🇺 Rússia'), ('ZA', '🇿🇦 África do Sul'), ('EG', '🇪🇬 Egito'), ('KR', '🇰🇷 Coreia do Sul'), ('TH', '🇹🇭 Tailândia'), ('VN', '🇻🇳 Vietnã'), ('ID', '🇮🇩 Indonésia'), ('MY', '🇲🇾 Malásia'), ('SG', '🇸🇬 Singapura'), ('TR', '🇹🇷 Turquia'), ('SA', '🇸🇦 Arábia Saudita'), ('AE', '🇦🇪 Emirados Árabes')], max_length=2, verbose_name='País')),
+                ('job_type', models.CharField(choices=[('users', 'Usuários'), ('groups', 'Grupos'), ('all', 'Usuários e Grupos')], default='all', max_length=10, verbose_name='Tipo')),
+                ('full', models.BooleanField(default=False, verbose_name='Ressincronização Completa')),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('running', 'Em Execução'), ('success', 'Concluído'), ('failed', 'Falhou')], default='pending', max_length=10, verbose_name='Status')),
+                ('progress_message', models.CharField(blank=True, default='', max_length=255, verbose_name='Progresso')),
+                ('rows_processed', models.IntegerField(default=0, verbose_name='Linhas Processadas')),
+                ('result', models.JSONField(blank=True, default=dict, verbose_name='Resultado')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Erro')),
+                ('worker', models.CharField(blank=True, default='', max_length=100, verbose_name='Worker')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado Em')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Iniciado Em')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finalizado Em')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado Em')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ad_sync_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Solicitado Por')),
+            ],
+            options={
+                'verbose_name': 'Job de Sincronização do AD',
+                'verbose_name_plural': 'Jobs de Sincronização do AD',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='adsyncjob_status_created_idx'), models.Index(fields=['country_code', '-created_at'], name='adsyncjob_country_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.7 on 2026-10-17 12:44
+
+from django.db import migrations, models
+
+PERMISSION_FIELDS = [
+    'can_login',
+    'can_register_suppliers',
+    'can_handle_complaints',
+    'can_view_dashboards',
+    'can_view_contracts',
+    'can_manage_contracts',
+]
+
+
+def populate_effective_permissions(apps, schema_editor):
+    """Calcula a máscara inicial a partir das permissões atuais."""
+    ADUser = apps.get_model('access_control', 'ADUser')
+    Membership = ADUser.groups.through
+
+    group_masks = {}
+    rows = Membership.objects.values_list('aduser_id', *[f'adgroup__{f}' for f in PERMISSION_FIELDS])
+    for user_id, *flags in rows.iterator():
+        mask = group_masks.get(user_id, 0)
+        for index, flag in enumerate(flags):
+            if flag:
+                mask |= 1 << index
+        group_masks[user_id] = mask
+
+    to_update = []
+    for user in ADUser.objects.only('pk', 'has_individual_permissions', *PERMISSION_FIELDS).iterator():
+        if user.has_individual_permissions:
+            mask = sum(1 << index for index, f in enumerate(PERMISSION_FIELDS) if getattr(user, f))
+        else:
+            mask = group_masks.get(user.pk, 0)
+        if mask:
+            user.effective_permissions = mask
+            to_update.append(user)
+
+    ADUser.objects.bulk_update(to_update, ['effective_permissions'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_control', '0004_adsyncjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aduser',
+            name='effective_permissions',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Permissões Efetivas'),
+        ),
+        migrations.RunPython(populate_effective_permissions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.7 on 2026-10-17 12:45
+
+import access_control.bitset
+from django.db import migrations
+from django.db.models import Case, IntegerField, Value, When
+
+PERMISSION_FIELDS = [
+    'can_login',
+    'can_register_suppliers',
+    'can_handle_complaints',
+    'can_view_dashboards',
+    'can_view_contracts',
+    'can_manage_contracts',
+]
+
+
+def populate_permission_bits(apps, schema_editor):
+    """Preenche permission_bits a partir das flags can_* (1 UPDATE por tabela)."""
+    bits = None
+    for index, field in enumerate(PERMISSION_FIELDS):
+        term = Case(When(**{field: True}, then=Value(1 << index)), default=Value(0), output_field=IntegerField())
+        bits = term if bits is None else bits + term
+
+    for model_name in ('ADGroup', 'ADUser'):
+        apps.get_model('access_control', model_name).objects.update(permission_bits=bits)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_control', '0005_aduser_effective_permissions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adgroup',
+            name='permission_bits',
+            field=access_control.bitset.PermissionSetField(default=0, editable=False, verbose_name='Permissões (bits)'),
+        ),
+        migrations.AddField(
+            model_name='aduser',
+            name='permission_bits',
+            field=access_control.bitset.PermissionSetField(default=0, editable=False, verbose_name='Permissões Individuais (bits)'),
+        ),
+        migrations.AlterField(
+            model_name='aduser',
+            name='effective_permissions',
+            field=access_control.bitset.PermissionSetField(default=0, editable=False, verbose_name='Permissões Efetivas'),
+        ),
+        migrations.RunPython(populate_permission_bits, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.7 on 2026-10-17 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_control', '0006_permission_bits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CountryStats',
+            fields=[
+                ('country_code', models.CharField(choices=[('BR', '🇧🇷 Brasil'), ('AR', '🇦🇷 Argentina'), ('MX', '🇲🇽 México'), ('DE', '🇩🇪 Alemanha'), ('IT', '🇮🇹 Itália'), ('CN', '🇨🇳 China'), ('US', '🇺🇸 Estados Unidos'), ('ES', '🇪🇸 Espanha'), ('FR', '🇫🇷 França'), ('GB', '🇬🇧 Reino Unido'), ('JP', '🇯🇵 Japão'), ('IN', '🇮🇳 Índia'), ('CA', '🇨🇦 Canadá'), ('AU', '🇦🇺 Austrália'), ('CL', '🇨🇱 Chile'), ('CO', '🇨🇴 Colômbia'), ('PE', '🇵🇪 Peru'), ('UY', '🇺🇾 Uruguai'), ('PY', '🇵🇾 Paraguai'), ('PT', '🇵🇹 Portugal'), ('NL', '🇳🇱 Holanda'), ('BE', '🇧🇪 Bélgica'), ('CH', '🇨🇭 Suíça'), ('AT', '🇦🇹 Áustria'), ('PL', '🇵🇱 Polônia'), ('CZ', '🇨🇿 República Tcheca'), ('RU', '🇷🇺 Rússia'), ('ZA', '🇿🇦 África do Sul'), ('EG', '🇪🇬 Egito'), ('KR', '🇰🇷 Coreia do Sul'), ('TH', '🇹🇭 Tailândia'), ('VN', '🇻🇳 Vietnã'), ('ID', '🇮🇩 Indonésia'), ('MY', '🇲🇾 Malásia'), ('SG', '🇸🇬 Singapura'), ('TR', '🇹🇷 Turquia'), ('SA', '🇸🇦 Arábia Saudita'), ('AE', '🇦🇪 Emirados Árabes')], max_length=5, primary_key=True, serialize=False, verbose_name='País')),
+                ('ad_users_count', models.PositiveIntegerField(default=0, verbose_name='Usuários do AD')),
+                ('ad_groups_count', models.PositiveIntegerField(default=0, verbose_name='Grupos do AD')),
+                ('groups_with_supplier_perm', models.PositiveIntegerField(default=0, verbose_name='Grupos com Permissão')),
+                ('users_with_supplier_perm', models.PositiveIntegerField(default=0, verbose_name='Usuários com Permissão')),
+                ('local_users_count', models.PositiveIntegerField(default=0, verbose_name='Usuários Locais')),
+                ('local_groups_count', models.PositiveIntegerField(default=0, verbose_name='Grupos Locais')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado Em')),
+            ],
+            options={
+                'verbose_name': 'Estatística do País',
+                'verbose_name_plural': 'Estatísticas dos Países',
+                'ordering': ['country_code'],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.7 on 2026-10-17 12:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_control', '0007_countrystats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adgroup',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['country_code', 'name', 'id'], name='adgroup_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adgroup',
+            index=models.Index(condition=models.Q(('can_login', True)), fields=['country_code', 'id'], name='adgroup_can_login_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adminprofile',
+            index=models.Index(fields=['access_level', 'is_active', 'country_code'], name='adminprofile_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aduser',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['country_code', 'display_name', 'id'], name='aduser_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aduser',
+            index=models.Index(condition=models.Q(('can_login', True)), fields=['country_code', 'id'], name='aduser_can_login_idx'),
+        ),
+        # Associação grupo -> membros: o índice único existente começa por
+        # aduser_id; este cobre "membros do grupo X" sem visitar a tabela.
+        migrations.RunSQL(
+            sql='CREATE INDEX aduser_groups_group_user_idx '
+                'ON access_control_aduser_groups (adgroup_id, aduser_id)',
+            reverse_sql='DROP INDEX aduser_groups_group_user_idx',
+        ),
+    ]
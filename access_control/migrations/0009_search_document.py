@@ -0,0 +1,82 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:20
+
+import unicodedata
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+AD_USER_SEARCH_FIELDS = [
+    'display_name', 'username', 'email', 'department',
+    'first_name', 'last_name', 'title',
+]
+AD_GROUP_SEARCH_FIELDS = ['name', 'description']
+
+
+# Cópia de access_control.search no momento desta migração: o texto gravado
+# aqui não pode mudar se o código do app mudar depois
+def build_search_document(obj, fields):
+    text = ' '.join(str(getattr(obj, field) or '') for field in fields)
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+# Índices GIN de trigramas (apenas PostgreSQL)
+TRIGRAM_INDEXES = [
+    ('adgroup_search_trgm_idx', 'access_control_adgroup'),
+    ('aduser_search_trgm_idx', 'access_control_aduser'),
+]
+
+
+def populate_search_document(apps, schema_editor):
+    """Preenche search_document das linhas existentes (em lotes)."""
+    for model_name, fields in (('ADGroup', AD_GROUP_SEARCH_FIELDS), ('ADUser', AD_USER_SEARCH_FIELDS)):
+        model = apps.get_model('access_control', model_name)
+        batch = []
+        for obj in model.objects.only('pk', *fields).iterator(chunk_size=2000):
+            obj.search_document = build_search_document(obj, fields)
+            batch.append(obj)
+            if len(batch) >= 2000:
+                model.objects.bulk_update(batch, ['search_document'])
+                batch = []
+        model.objects.bulk_update(batch, ['search_document'])
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (search_document gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_control', '0008_directory_indexes'),
+    ]
+
+    operations = [
+        # CREATE EXTENSION pg_trgm (ignorado fora do PostgreSQL)
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='adgroup',
+            name='search_document',
+            field=models.TextField(default='', editable=False, verbose_name='Texto de Busca'),
+        ),
+        migrations.AddField(
+            model_name='aduser',
+            name='search_document',
+            field=models.TextField(default='', editable=False, verbose_name='Texto de Busca'),
+        ),
+        migrations.RunPython(populate_search_document, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_control', '0009_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adgroup',
+            name='removed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Removido do AD Em'),
+        ),
+        migrations.AddField(
+            model_name='aduser',
+            name='removed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Removido do AD Em'),
+        ),
+        migrations.AddIndex(
+            model_name='adgroup',
+            index=models.Index(condition=models.Q(('removed_at__isnull', False)), fields=['removed_at'], name='adgroup_removed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aduser',
+            index=models.Index(condition=models.Q(('removed_at__isnull', False)), fields=['removed_at'], name='aduser_removed_idx'),
+        ),
+    ]
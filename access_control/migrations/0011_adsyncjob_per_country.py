@@ -0,0 +1,41 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:38
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fail_duplicate_jobs(apps, schema_editor):
+    """Mantém só o job pendente/em execução mais antigo de cada país."""
+    ADSyncJob = apps.get_model('access_control', 'ADSyncJob')
+    keep = {}
+    duplicates = []
+    for job in ADSyncJob.objects.filter(status__in=['pending', 'running']).order_by('created_at', 'pk'):
+        key = (job.country_code, job.status)
+        if key in keep:
+            duplicates.append(job.pk)
+        else:
+            keep[key] = job.pk
+    ADSyncJob.objects.filter(pk__in=duplicates).update(
+        status='failed',
+        error='Job duplicado descartado na migração.',
+        finished_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_control', '0010_removed_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='adsyncjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('country_code',), name='adsyncjob_one_pending_per_country'),
+        ),
+        migrations.AddConstraint(
+            model_name='adsyncjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'running')), fields=('country_code',), name='adsyncjob_one_running_per_country'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-17 14:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_control', '0011_adsyncjob_per_country'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adsyncjob',
+            index=models.Index(fields=['finished_at'], name='adsyncjob_finished_idx'),
+        ),
+    ]
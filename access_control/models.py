@@ -2,6 +2,11 @@ from django.db import models
 from django.conf import settings
 from django.core.exceptions import ValidationError
 
+from adminpanel.encryption import decrypt_text
+from .bitset import PERMISSION_FIELDS, PermissionSet, PermissionSetField
+from .managers import CountryQuerySet, DirectoryQuerySet
+from .search import AD_GROUP_SEARCH_FIELDS, AD_USER_SEARCH_FIELDS, build_search_document
+
 
 # Choices para países
 COUNTRY_CHOICES = [
@@ -101,10 +106,16 @@ class AdminProfile(models.Model):
     # Status
     is_active = models.BooleanField(default=True, verbose_name='Ativo')
     
+    objects = CountryQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Perfil de Administrador'
         verbose_name_plural = 'Perfis de Administradores'
         ordering = ['access_level', 'country_code', 'user__first_name']
+        indexes = [
+            # Admins ativos por nível/país (dashboard global, listagens)
+            models.Index(fields=['access_level', 'is_active', 'country_code'], name='adminprofile_level_idx'),
+        ]
     
     def __str__(self):
         country = f" - {self.get_country_code_display()}" if self.country_code else " (Global)"
@@ -368,9 +379,49 @@ class SystemDefaultConfig(models.Model):
         """Retorna ou cria a configuração padrão."""
         config, created = cls.objects.get_or_create(pk=1)
         return config
+    
+    def get_ad_bind_password(self):
+        """Senha do bind AD descriptografada (valores antigos em texto plano são aceitos)."""
+        return decrypt_text(self.ad_bind_password)
+    
+    def get_smtp_password(self):
+        """Senha SMTP descriptografada (valores antigos em texto plano são aceitos)."""
+        return decrypt_text(self.smtp_password)
+
+
+class PermissionBitsMixin:
+    """
+    Mantém `permission_bits` igual às flags can_* a cada save(),
+    inclusive quando o save usa update_fields.
+    """
+
+    def save(self, *args, **kwargs):
+        if not set(PERMISSION_FIELDS) & self.get_deferred_fields():
+            self.permission_bits = PermissionSet.from_fields(self)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and set(update_fields) & set(PERMISSION_FIELDS):
+                kwargs['update_fields'] = {*update_fields, 'permission_bits'}
+        super().save(*args, **kwargs)
 
 
-class ADGroup(models.Model):
+class SearchDocumentMixin:
+    """
+    Mantém `search_document` (texto normalizado dos `search_document_fields`)
+    a cada save(), inclusive quando o save usa update_fields.
+    """
+
+    search_document_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not set(self.search_document_fields) & self.get_deferred_fields():
+            self.search_document = build_search_document(self, self.search_document_fields)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and set(update_fields) & set(self.search_document_fields):
+                kwargs['update_fields'] = {*update_fields, 'search_document'}
+        super().save(*args, **kwargs)
+
+
+class ADGroup(SearchDocumentMixin, PermissionBitsMixin, models.Model):
     """Grupos sincronizados do Active Directory"""
     country_code = models.CharField(max_length=2, choices=COUNTRY_CHOICES)
     name = models.CharField(max_length=200, default='')
@@ -389,22 +440,59 @@ class ADGroup(models.Model):
     can_view_contracts = models.BooleanField(default=False, verbose_name='Pode Visualizar Contratos')
     can_manage_contracts = models.BooleanField(default=False, verbose_name='Pode Gerenciar Contratos')
     
+    # As mesmas permissões numa única coluna (mantida pelo save)
+    permission_bits = PermissionSetField(default=0, editable=False, verbose_name='Permissões (bits)')
+    
+    # Nome e descrição normalizados para busca (ver access_control.search)
+    search_document = models.TextField(default='', editable=False, verbose_name='Texto de Busca')
+    
     # Auditoria
     last_sync = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Quando deixou de existir no AD (limpo se reaparecer); base do expurgo
+    removed_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name='Removido do AD Em')
+    
+    objects = DirectoryQuerySet.as_manager()
+    
+    # Coluna consultada por with_permission()
+    permission_set_field = 'permission_bits'
+    
+    # Campos que compõem o search_document
+    search_document_fields = AD_GROUP_SEARCH_FIELDS
+    
     class Meta:
         verbose_name = "Grupo do AD"
         verbose_name_plural = "Grupos do AD"
         ordering = ['country_code', 'name']
         unique_together = ['country_code', 'name']
+        indexes = [
+            # Grupos ativos do país em ordem de nome (chave do cursor na tela de permissões)
+            models.Index(
+                fields=['country_code', 'name', 'id'],
+                condition=models.Q(is_active=True),
+                name='adgroup_active_name_idx',
+            ),
+            # Grupos com login liberado (JOIN com ADUser.groups e contadores)
+            models.Index(
+                fields=['country_code', 'id'],
+                condition=models.Q(can_login=True),
+                name='adgroup_can_login_idx',
+            ),
+            # Removidos do AD (expurgo)
+            models.Index(
+                fields=['removed_at'],
+                condition=models.Q(removed_at__isnull=False),
+                name='adgroup_removed_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.country_code} - {self.name}"
 
 
-class ADUser(models.Model):
+class ADUser(SearchDocumentMixin, PermissionBitsMixin, models.Model):
     """Usuários sincronizados do Active Directory"""
     country_code = models.CharField(max_length=2, choices=COUNTRY_CHOICES)
     username = models.CharField(max_length=150, default='')
@@ -433,16 +521,56 @@ class ADUser(models.Model):
     # Flag que indica se este usuário tem permissões individuais configuradas
     has_individual_permissions = models.BooleanField(default=False, verbose_name='Tem permissões individuais')
     
+    # Permissões individuais numa única coluna (mantida pelo save)
+    permission_bits = PermissionSetField(default=0, editable=False, verbose_name='Permissões Individuais (bits)')
+    
+    # Permissões efetivas materializadas (ver access_control.permissions)
+    effective_permissions = PermissionSetField(default=0, editable=False, verbose_name='Permissões Efetivas')
+    
+    # Campos de texto normalizados para busca (ver access_control.search)
+    search_document = models.TextField(default='', editable=False, verbose_name='Texto de Busca')
+    
     # Auditoria
     last_sync = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Quando deixou de existir no AD (limpo se reaparecer); base do expurgo
+    removed_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name='Removido do AD Em')
+    
+    objects = DirectoryQuerySet.as_manager()
+    
+    # Coluna consultada por with_permission()
+    permission_set_field = 'effective_permissions'
+    
+    # Campos que compõem o search_document
+    search_document_fields = AD_USER_SEARCH_FIELDS
+    
     class Meta:
         verbose_name = "Usuário do AD"
         verbose_name_plural = "Usuários do AD"
         ordering = ['country_code', 'display_name']
         unique_together = ['country_code', 'username']
+        indexes = [
+            # Usuários ativos do país em ordem de nome (chave do cursor na tela de permissões)
+            models.Index(
+                fields=['country_code', 'display_name', 'id'],
+                condition=models.Q(is_active=True),
+                name='aduser_active_name_idx',
+            ),
+            # Usuários com login individual liberado
+            models.Index(
+                fields=['country_code', 'id'],
+                condition=models.Q(can_login=True),
+                name='aduser_can_login_idx',
+            ),
+            # Removidos do AD (expurgo)
+            models.Index(
+                fields=['removed_at'],
+                condition=models.Q(removed_at__isnull=False),
+                name='aduser_removed_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.country_code} - {self.display_name or self.username}"
@@ -456,39 +584,183 @@ class ADUser(models.Model):
         """
         Retorna as permissões efetivas do usuário.
         Se tem permissões individuais, usa elas. Senão, usa as permissões dos grupos.
+        
+        Lê a máscara materializada em `effective_permissions`, mantida
+        atualizada por access_control.permissions (sem consultar os grupos).
         """
-        if self.has_individual_permissions:
-            return {
-                'can_login': self.can_login,
-                'can_register_suppliers': self.can_register_suppliers,
-                'can_handle_complaints': self.can_handle_complaints,
-                'can_view_dashboards': self.can_view_dashboards,
-                'can_view_contracts': self.can_view_contracts,
-                'can_manage_contracts': self.can_manage_contracts,
-            }
+        return PermissionSet(self.effective_permissions).to_dict()
+    
+    def has_effective_permission(self, *permissions):
+        """
+        Verifica permissões efetivas (ex.: 'can_login').
         
-        # Combina permissões de todos os grupos (OR lógico)
-        perms = {
-            'can_login': False,
-            'can_register_suppliers': False,
-            'can_handle_complaints': False,
-            'can_view_dashboards': False,
-            'can_view_contracts': False,
-            'can_manage_contracts': False,
+        Returns:
+            bool: True se o usuário tem todas as permissões informadas
+        """
+        return PermissionSet(self.effective_permissions).test(*permissions)
+
+
+class ADSyncState(models.Model):
+    """
+    Estado da sincronização incremental de usuários do AD por país.
+    Guarda a marca d'água (highestCommittedUSN) do DC usado na última sincronização.
+    """
+    country_code = models.CharField(max_length=2, choices=COUNTRY_CHOICES, unique=True, verbose_name='País')
+    
+    # O uSNChanged é local a cada DC: se o DC mudar, a marca d'água é descartada
+    server_name = models.CharField(max_length=500, blank=True, default='', verbose_name='Controlador de Domínio')
+    highest_usn = models.BigIntegerField(default=0, verbose_name='Último USN Sincronizado')
+    
+    last_full_sync = models.DateTimeField(null=True, blank=True, verbose_name='Última Sincronização Completa')
+    last_incremental_sync = models.DateTimeField(null=True, blank=True, verbose_name='Última Sincronização Incremental')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Atualizado Em')
+    
+    class Meta:
+        verbose_name = 'Estado de Sincronização do AD'
+        verbose_name_plural = 'Estados de Sincronização do AD'
+        ordering = ['country_code']
+    
+    def __str__(self):
+        return f"{self.country_code} - USN {self.highest_usn}"
+    
+    def can_sync_incrementally(self, server_name):
+        """Verifica se a marca d'água salva vale para o DC atual."""
+        return bool(self.highest_usn) and self.server_name == server_name
+
+
+class ADSyncJob(models.Model):
+    """
+    Job de sincronização do AD executado em segundo plano.
+    A fila fica no próprio banco; o comando `run_sync_worker` consome os jobs pendentes.
+
+    Cada país tem no máximo um job pendente e um em execução (constraints
+    parciais): pedidos repetidos são mesclados no job pendente e as
+    sincronizações de um mesmo país nunca rodam em paralelo.
+    """
+    
+    JOB_TYPE_CHOICES = [
+        ('users', 'Usuários'),
+        ('groups', 'Grupos'),
+        ('all', 'Usuários e Grupos'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pendente'),
+        ('running', 'Em Execução'),
+        ('success', 'Concluído'),
+        ('failed', 'Falhou'),
+    ]
+    
+    country_code = models.CharField(max_length=2, choices=COUNTRY_CHOICES, verbose_name='País')
+    job_type = models.CharField(max_length=10, choices=JOB_TYPE_CHOICES, default='all', verbose_name='Tipo')
+    full = models.BooleanField(default=False, verbose_name='Ressincronização Completa')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='Status')
+    
+    # Progresso
+    progress_message = models.CharField(max_length=255, blank=True, default='', verbose_name='Progresso')
+    rows_processed = models.IntegerField(default=0, verbose_name='Linhas Processadas')
+    result = models.JSONField(default=dict, blank=True, verbose_name='Resultado')
+    error = models.TextField(blank=True, default='', verbose_name='Erro')
+    worker = models.CharField(max_length=100, blank=True, default='', verbose_name='Worker')
+    
+    # Auditoria
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ad_sync_jobs',
+        verbose_name='Solicitado Por'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Criado Em')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Iniciado Em')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Finalizado Em')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Atualizado Em')
+    
+    class Meta:
+        verbose_name = 'Job de Sincronização do AD'
+        verbose_name_plural = 'Jobs de Sincronização do AD'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='adsyncjob_status_created_idx'),
+            models.Index(fields=['country_code', '-created_at'], name='adsyncjob_country_created_idx'),
+            # Jobs encerrados recentes (access_control.jobs.sync_job_metrics)
+            models.Index(fields=['finished_at'], name='adsyncjob_finished_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['country_code'],
+                condition=models.Q(status='pending'),
+                name='adsyncjob_one_pending_per_country',
+            ),
+            models.UniqueConstraint(
+                fields=['country_code'],
+                condition=models.Q(status='running'),
+                name='adsyncjob_one_running_per_country',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.country_code} - {self.get_job_type_display()} ({self.get_status_display()})"
+    
+    @property
+    def duration(self):
+        """Duração em segundos (até agora, se ainda estiver em execução)."""
+        if not self.started_at:
+            return None
+        from django.utils import timezone
+        end = self.finished_at or timezone.now()
+        return (end - self.started_at).total_seconds()
+    
+    def is_finished(self):
+        return self.status in ('success', 'failed')
+    
+    def to_dict(self):
+        """Representação usada pelo endpoint de status (JSON)."""
+        return {
+            'id': self.pk,
+            'country_code': self.country_code,
+            'job_type': self.job_type,
+            'full': self.full,
+            'status': self.status,
+            'status_display': self.get_status_display(),
+            'progress_message': self.progress_message,
+            'rows_processed': self.rows_processed,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'duration': self.duration,
         }
-        
-        for group in self.groups.all():
-            if group.can_login:
-                perms['can_login'] = True
-            if group.can_register_suppliers:
-                perms['can_register_suppliers'] = True
-            if group.can_handle_complaints:
-                perms['can_handle_complaints'] = True
-            if group.can_view_dashboards:
-                perms['can_view_dashboards'] = True
-            if group.can_view_contracts:
-                perms['can_view_contracts'] = True
-            if group.can_manage_contracts:
-                perms['can_manage_contracts'] = True
-        
-        return perms
+
+
+class CountryStats(models.Model):
+    """
+    Contadores consolidados (rollup) exibidos no dashboard do Admin de País.
+    Mantidos pela sincronização do AD e pelas telas de permissão
+    (ver access_control.stats); o dashboard faz uma única leitura por chave.
+    """
+    country_code = models.CharField(max_length=5, choices=COUNTRY_CHOICES, primary_key=True, verbose_name='País')
+    
+    # Active Directory (apenas registros ativos)
+    ad_users_count = models.PositiveIntegerField(default=0, verbose_name='Usuários do AD')
+    ad_groups_count = models.PositiveIntegerField(default=0, verbose_name='Grupos do AD')
+    
+    # Grupos/usuários com login liberado na tela de permissões de fornecedores
+    groups_with_supplier_perm = models.PositiveIntegerField(default=0, verbose_name='Grupos com Permissão')
+    users_with_supplier_perm = models.PositiveIntegerField(default=0, verbose_name='Usuários com Permissão')
+    
+    # Usuários e grupos locais (Django)
+    local_users_count = models.PositiveIntegerField(default=0, verbose_name='Usuários Locais')
+    local_groups_count = models.PositiveIntegerField(default=0, verbose_name='Grupos Locais')
+    
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Atualizado Em')
+    
+    class Meta:
+        verbose_name = 'Estatística do País'
+        verbose_name_plural = 'Estatísticas dos Países'
+        ordering = ['country_code']
+    
+    def __str__(self):
+        return f"{self.country_code} - {self.ad_users_count} usuários / {self.ad_groups_count} grupos"
@@ -0,0 +1,286 @@
+"""
+Sincronização do AD de vários países em paralelo.
+
+A I/O do LDAP é bloqueante, então cada job roda numa thread de um pool
+limitado (AD_SYNC_MAX_WORKERS). Para não sobrecarregar um controlador de
+domínio compartilhado, no máximo AD_SYNC_PER_SERVER_LIMIT jobs rodam ao mesmo
+tempo contra o mesmo DC principal (LdapDirectory.get_connection_string());
+os demais aguardam na fila local, sem ocupar thread, enquanto jobs de outros
+DCs seguem.
+
+Os jobs continuam sendo registros ADSyncJob (progresso, resultado e erros
+aparecem como numa sincronização manual). Cada thread usa a sua própria
+conexão com o banco e a fecha ao terminar.
+
+Usage:
+    summary = sync_all_directories(job_type='all', full=False)
+    run_queue_in_parallel(worker_name)  # worker: esvazia a fila em paralelo
+"""
+
+import logging
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from adminpanel.models import LdapDirectory
+from .jobs import claim_job, claim_next_job, default_worker_name, enqueue_sync, run_job
+from .models import ADSyncJob
+
+logger = logging.getLogger(__name__)
+
+# Jobs executados ao mesmo tempo (threads)
+AD_SYNC_MAX_WORKERS = getattr(settings, 'AD_SYNC_MAX_WORKERS', 8)
+
+# Jobs simultâneos contra o mesmo controlador de domínio
+AD_SYNC_PER_SERVER_LIMIT = getattr(settings, 'AD_SYNC_PER_SERVER_LIMIT', 2)
+
+# Histórico usado para estimar a duração de cada país
+DURATION_HISTORY = timedelta(days=30)
+
+# Intervalo (segundos) em que os jobs reservados que aguardam vaga no DC
+# renovam updated_at, para não serem encerrados por fail_stale_jobs
+WAITING_HEARTBEAT_SECONDS = 60
+
+
+def _server_key(country_code, cache):
+    """DC principal do país (chave do limite por servidor)."""
+    if country_code not in cache:
+        directory = LdapDirectory.objects.filter(country_code=country_code, is_active=True).first()
+        cache[country_code] = directory.get_connection_string().lower() if directory else country_code
+    return cache[country_code]
+
+
+def _run_in_thread(job):
+    """Executa o job na thread do pool e fecha as conexões dela com o banco."""
+    try:
+        return run_job(job)
+    except Exception as e:
+        # run_job já trata erros da sincronização; aqui só sobra falha ao gravar o job
+        logger.error(f"❌ Job #{job.pk} interrompido ({job.country_code}): {str(e)}")
+        job.status = 'failed'
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        try:
+            ADSyncJob.objects.filter(pk=job.pk, status='running').update(
+                status='failed', error=job.error, finished_at=job.finished_at, updated_at=job.finished_at
+            )
+        except Exception as save_error:
+            # Sem banco: fail_stale_jobs encerra o job depois de STALE_JOB_TIMEOUT
+            logger.error(f"❌ Job #{job.pk}: falha ao gravar o erro: {str(save_error)}")
+        return job
+    finally:
+        connections.close_all()
+
+
+def _touch_waiting(waiting):
+    """Renova updated_at dos jobs reservados que aguardam vaga no DC."""
+    ADSyncJob.objects.filter(pk__in=[job.pk for job, _ in waiting], status='running').update(
+        updated_at=timezone.now()
+    )
+
+
+def run_jobs_in_parallel(next_job, max_workers=None, per_server_limit=None, on_finish=None):
+    """
+    Executa jobs reservados em paralelo, respeitando o limite por DC.
+
+    Novos jobs só são pedidos a `next_job` enquanto houver vaga no pool, para
+    não reservar jobs que ficariam parados. Os que já foram reservados e
+    aguardam o limite do DC renovam updated_at a cada WAITING_HEARTBEAT_SECONDS.
+
+    Args:
+        next_job (callable): Retorna o próximo job já reservado ('running') ou None
+        max_workers (int): Threads do pool (padrão: AD_SYNC_MAX_WORKERS)
+        per_server_limit (int): Jobs simultâneos por DC (padrão: AD_SYNC_PER_SERVER_LIMIT)
+        on_finish (callable): Chamado (na thread principal) com cada job concluído
+
+    Returns:
+        list[ADSyncJob]: Jobs executados, na ordem de conclusão
+    """
+    max_workers = max(1, max_workers or AD_SYNC_MAX_WORKERS)
+    per_server_limit = max(1, per_server_limit or AD_SYNC_PER_SERVER_LIMIT)
+
+    servers = {}
+    waiting = deque()
+    running = {}
+    busy = Counter()
+    finished = []
+    exhausted = False
+    last_heartbeat = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ad-sync') as executor:
+        while True:
+            while not exhausted and len(running) + len(waiting) < max_workers:
+                job = next_job()
+                if job is None:
+                    exhausted = True
+                    break
+                waiting.append((job, _server_key(job.country_code, servers)))
+
+            # Dispara, na ordem da fila, os jobs cujo DC ainda tem vaga
+            for item in list(waiting):
+                if len(running) >= max_workers:
+                    break
+                job, server = item
+                if busy[server] >= per_server_limit:
+                    continue
+                waiting.remove(item)
+                busy[server] += 1
+                running[executor.submit(_run_in_thread, job)] = item
+                logger.info(f"🔄 Job #{job.pk} iniciado ({job.country_code} @ {server})")
+
+            if not running:
+                break
+
+            done, _ = wait(running, timeout=WAITING_HEARTBEAT_SECONDS, return_when=FIRST_COMPLETED)
+            if waiting and time.monotonic() - last_heartbeat >= WAITING_HEARTBEAT_SECONDS:
+                _touch_waiting(waiting)
+                last_heartbeat = time.monotonic()
+            for future in done:
+                _, server = running.pop(future)
+                busy[server] -= 1
+                job = future.result()
+                finished.append(job)
+                if on_finish:
+                    on_finish(job)
+
+    return finished
+
+
+def run_queue_in_parallel(worker_name=None, max_workers=None, per_server_limit=None, on_finish=None):
+    """
+    Esvazia a fila de ADSyncJob executando os jobs em paralelo.
+
+    Returns:
+        list[ADSyncJob]: Jobs executados
+    """
+    worker_name = worker_name or default_worker_name()
+    return run_jobs_in_parallel(
+        lambda: claim_next_job(worker_name),
+        max_workers=max_workers,
+        per_server_limit=per_server_limit,
+        on_finish=on_finish,
+    )
+
+
+def _expected_durations(country_codes, job_type):
+    """Duração da última sincronização bem-sucedida de cada país (segundos)."""
+    durations = {}
+    rows = (ADSyncJob.objects
+            .filter(country_code__in=country_codes, job_type=job_type, status='success',
+                    finished_at__gte=timezone.now() - DURATION_HISTORY)
+            .order_by('-finished_at')
+            .values_list('country_code', 'started_at', 'finished_at'))
+    for country_code, started_at, finished_at in rows:
+        if country_code not in durations and started_at:
+            durations[country_code] = (finished_at - started_at).total_seconds()
+    return durations
+
+
+def enqueue_all_directories(job_type='all', full=False, requested_by=None, countries=None):
+    """
+    Enfileira um job para cada LdapDirectory ativo.
+
+    Returns:
+        list[tuple]: (job: ADSyncJob, created: bool) por país
+    """
+    directories = LdapDirectory.objects.filter(is_active=True).order_by('country_code')
+    if countries:
+        directories = directories.filter(country_code__in=countries)
+    return [
+        enqueue_sync(country_code, job_type=job_type, full=full, requested_by=requested_by)
+        for country_code in directories.values_list('country_code', flat=True)
+    ]
+
+
+def sync_all_directories(job_type='all', full=False, requested_by=None, countries=None,
+                         max_workers=None, per_server_limit=None, worker_name=None, on_finish=None):
+    """
+    Sincroniza todos os países com AD ativo, em paralelo, nesta chamada.
+
+    Países com job já em execução em outro worker são pulados. Os demais
+    começam pelos mais demorados na última execução, para que o tempo total
+    fique próximo ao do país mais lento. Cada job só é reservado quando há
+    vaga no pool: os que aguardam continuam 'pending'.
+
+    Args:
+        job_type (str): 'users', 'groups' ou 'all'
+        full (bool): Força ressincronização completa de usuários
+        requested_by (User): Quem solicitou
+        countries (list[str]): Restringe a estes países
+        max_workers (int): Threads do pool
+        per_server_limit (int): Jobs simultâneos por DC
+        worker_name (str): Identificação gravada nos jobs
+        on_finish (callable): Chamado com cada job concluído
+
+    Returns:
+        dict: Resumo (ver summarize_jobs) com 'skipped': jobs de outros workers
+    """
+    worker_name = worker_name or default_worker_name()
+    started = time.monotonic()
+
+    jobs = [job for job, _ in enqueue_all_directories(job_type, full, requested_by, countries)]
+    durations = _expected_durations([job.country_code for job in jobs], job_type)
+    jobs.sort(key=lambda job: durations.get(job.country_code, float('inf')), reverse=True)
+
+    pending = iter(jobs)
+    skipped = []
+
+    def next_job():
+        # Reserva na hora de executar: jobs reservados e parados na fila local
+        # seriam encerrados por fail_stale_jobs
+        for job in pending:
+            if claim_job(job, worker_name):
+                return job
+            skipped.append(job)
+        return None
+
+    finished = run_jobs_in_parallel(
+        next_job,
+        max_workers=max_workers,
+        per_server_limit=per_server_limit,
+        on_finish=on_finish,
+    )
+
+    summary = summarize_jobs(finished, time.monotonic() - started)
+    summary['skipped'] = skipped
+    logger.info(
+        f"✅ Sincronização global: {len(summary['succeeded'])} países ok, "
+        f"{len(summary['failed'])} com falha, {len(skipped)} já em andamento; "
+        f"{summary['elapsed']:.1f}s (sequencial: {summary['sequential']:.1f}s)"
+    )
+    return summary
+
+
+def summarize_jobs(jobs, elapsed):
+    """
+    Agrega o resultado de vários jobs.
+
+    Returns:
+        dict: {'succeeded': [job], 'failed': [job], 'totals': {'users': {...}, 'groups': {...}},
+               'elapsed': float, 'sequential': float, 'slowest': job|None}
+    """
+    totals = {}
+    for job in jobs:
+        if job.status != 'success':
+            continue
+        for kind, result in (job.result or {}).items():
+            counters = totals.setdefault(kind, {})
+            for key, value in result.items():
+                # Soma só contadores ('mode' é texto)
+                if isinstance(value, int) and not isinstance(value, bool):
+                    counters[key] = counters.get(key, 0) + value
+
+    durations = [(job.duration or 0, job) for job in jobs]
+    return {
+        'succeeded': [job for job in jobs if job.status == 'success'],
+        'failed': [job for job in jobs if job.status != 'success'],
+        'totals': totals,
+        'elapsed': elapsed,
+        'sequential': sum(duration for duration, _ in durations),
+        'slowest': max(durations, key=lambda item: item[0])[1] if durations else None,
+    }
@@ -0,0 +1,107 @@
+"""
+Paginação por cursor (keyset) para listagens grandes.
+
+Em vez de OFFSET (que percorre todas as linhas anteriores), cada página
+continua a partir da última linha exibida:
+
+    WHERE (display_name, id) > (:ultimo_nome, :ultimo_id)
+    ORDER BY display_name, id
+    LIMIT :tamanho + 1
+
+O custo de qualquer página é o mesmo, com índice em (country_code, ..., id).
+O cursor é opaco para o cliente (base64 de um JSON com os valores da chave).
+"""
+
+import base64
+import json
+
+from django.db.models import Q
+
+# Linhas por página nas listagens paginadas
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """Cursor malformado ou de outra ordenação."""
+
+
+def encode_cursor(values):
+    """Codifica os valores da chave de ordenação da última linha."""
+    raw = json.dumps(values, separators=(',', ':'), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """
+    Decodifica um cursor gerado por encode_cursor.
+
+    Raises:
+        InvalidCursor: Se o cursor não puder ser lido
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Cursor inválido.')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Cursor inválido.')
+    return values
+
+
+def _after(ordering, values):
+    """
+    Monta o filtro "linha > cursor" para uma ordenação ascendente composta:
+    (a > x) OR (a = x AND b > y) OR ...
+    """
+    condition = Q()
+    for index, field in enumerate(ordering):
+        step = Q(**{f'{field}__gt': values[index]})
+        for previous, value in zip(ordering[:index], values[:index]):
+            step &= Q(**{previous: value})
+        condition |= step
+    return condition
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Converte o parâmetro ?size= respeitando o máximo permitido."""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Retorna uma página da listagem a partir do cursor.
+
+    Args:
+        queryset: QuerySet já filtrado
+        ordering (tuple): Campos da ordenação ascendente; o último deve ser
+            único (ex.: ('display_name', 'id'))
+        cursor (str): Cursor recebido da página anterior (None = primeira)
+        page_size (int): Linhas por página
+
+    Returns:
+        dict: {'items': list, 'next_cursor': str|None, 'has_more': bool}
+
+    Raises:
+        InvalidCursor: Se o cursor for inválido
+    """
+    ordering = tuple(ordering)
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(_after(ordering, decode_cursor(cursor, len(ordering))))
+
+    # Uma linha extra indica se existe próxima página (sem COUNT)
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    items = rows[:page_size]
+
+    next_cursor = None
+    if has_more and items:
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, field) for field in ordering])
+
+    return {'items': items, 'next_cursor': next_cursor, 'has_more': has_more}
@@ -0,0 +1,108 @@
+"""
+Permissões efetivas materializadas dos usuários do AD.
+
+A permissão efetiva de um ADUser (permissões individuais, ou o OR das
+permissões dos seus grupos) é gravada em ADUser.effective_permissions como
+uma máscara de bits. Ela é recalculada em lote sempre que muda:
+- uma flag de permissão de um ADGroup;
+- uma permissão individual de um ADUser;
+- a associação usuário-grupo (ADUser.groups).
+
+Assim as verificações de permissão e as listagens leem uma única coluna em
+vez de percorrer os grupos de cada usuário.
+"""
+
+import logging
+
+from django.db import connection
+from django.db.models import Q
+
+from .bitset import PermissionSet
+from .models import ADUser
+
+logger = logging.getLogger(__name__)
+
+# Usuários recalculados por lote
+RECOMPUTE_BATCH_SIZE = 1000
+
+
+def recompute_effective_permissions(user_ids=None, group_ids=None, country_code=None):
+    """
+    Recalcula a coluna effective_permissions dos usuários afetados.
+
+    Cada lote custa 3 queries (usuários, máscaras dos grupos via tabela de
+    associação e bulk_update apenas dos que mudaram), independente da
+    quantidade de grupos por usuário.
+
+    Args:
+        user_ids (iterable): Usuários a recalcular
+        group_ids (iterable): Recalcula todos os membros destes grupos
+        country_code (str): Recalcula todos os usuários do país
+
+    Returns:
+        int: Quantidade de usuários cuja máscara mudou
+    """
+    if user_ids is None and group_ids is None and country_code is None:
+        return 0
+
+    Membership = ADUser.groups.through
+
+    scope = Q()
+    if user_ids is not None:
+        scope |= Q(pk__in=list(user_ids))
+    if group_ids is not None:
+        scope |= Q(pk__in=Membership.objects.filter(adgroup_id__in=list(group_ids)).values('aduser_id'))
+    if country_code is not None:
+        scope |= Q(country_code=country_code)
+
+    ids = list(ADUser.objects.filter(scope).order_by('pk').values_list('pk', flat=True))
+    changed = 0
+    for start in range(0, len(ids), RECOMPUTE_BATCH_SIZE):
+        changed += _recompute_batch(ids[start:start + RECOMPUTE_BATCH_SIZE])
+
+    if changed:
+        logger.info(f"🔐 Permissões efetivas recalculadas: {changed} usuário(s) alterado(s)")
+    return changed
+
+
+def _group_masks(ids):
+    """
+    União das permissões dos grupos de cada usuário: {user_id: PermissionSet}.
+    No PostgreSQL o OR é feito no banco (BIT_OR), devolvendo uma linha por usuário.
+    """
+    Membership = ADUser.groups.through
+    memberships = Membership.objects.filter(aduser_id__in=ids)
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.aggregates import BitOr
+        rows = (memberships.values('aduser_id')
+                .annotate(bits=BitOr('adgroup__permission_bits'))
+                .values_list('aduser_id', 'bits'))
+        return {user_id: PermissionSet(bits or 0) for user_id, bits in rows}
+
+    masks = {}
+    for user_id, bits in memberships.values_list('aduser_id', 'adgroup__permission_bits'):
+        masks[user_id] = masks.get(user_id, 0) | bits
+    return {user_id: PermissionSet(bits) for user_id, bits in masks.items()}
+
+
+def _recompute_batch(ids):
+    """Recalcula um lote de usuários e grava somente as máscaras alteradas."""
+    users = list(ADUser.objects.filter(pk__in=ids).only(
+        'pk', 'has_individual_permissions', 'permission_bits', 'effective_permissions'
+    ))
+    group_masks = _group_masks(ids)
+
+    to_update = []
+    for user in users:
+        if user.has_individual_permissions:
+            mask = user.permission_bits
+        else:
+            mask = group_masks.get(user.pk, PermissionSet())
+        if mask != user.effective_permissions:
+            user.effective_permissions = mask
+            to_update.append(user)
+
+    if to_update:
+        ADUser.objects.bulk_update(to_update, ['effective_permissions'], batch_size=RECOMPUTE_BATCH_SIZE)
+    return len(to_update)
@@ -0,0 +1,106 @@
+"""
+Busca de usuários e grupos sincronizados do AD.
+
+Cada ADUser/ADGroup mantém `search_document`: os campos de texto
+pesquisáveis concatenados, em minúsculas e sem acentos (atualizado no
+save() e na sincronização em lote).
+
+- PostgreSQL: índice GIN com gin_trgm_ops (pg_trgm) sobre search_document.
+  A busca combina substring (LIKE '%termo%') e similaridade de palavra
+  (operador %>, tolerante a erros de digitação); ambos usam o índice.
+  Com ranked=True os resultados vêm ordenados por word_similarity.
+- Demais bancos: busca por prefixo (`istartswith`) nos campos originais.
+
+Usage:
+    search_ad_users(ADUser.objects.active_in('BR'), 'joao slva', ranked=True)
+"""
+
+import unicodedata
+
+from django.db import connections
+from django.db.models import Q
+
+# Campos pesquisados em cada modelo (e que compõem o search_document)
+AD_USER_SEARCH_FIELDS = [
+    'display_name', 'username', 'email', 'department',
+    'first_name', 'last_name', 'title',
+]
+AD_GROUP_SEARCH_FIELDS = ['name', 'description']
+
+# Campos usados no fallback por prefixo
+AD_USER_PREFIX_FIELDS = ['display_name', 'username', 'email', 'department']
+AD_GROUP_PREFIX_FIELDS = ['name', 'description']
+
+
+def normalize_search_text(value):
+    """Minúsculas, sem acentos e com espaços simples ('João  Silva' -> 'joao silva')."""
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(value))
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+def build_search_document(obj, fields):
+    """Texto de busca de um objeto a partir dos seus `fields`."""
+    return normalize_search_text(' '.join(str(getattr(obj, field) or '') for field in fields))
+
+
+def supports_ranked_search(queryset):
+    """True se o banco do queryset tem pg_trgm (PostgreSQL)."""
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def _prefix_filter(fields, term):
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__istartswith': term})
+    return condition
+
+
+def _search(queryset, term, prefix_fields, ranked):
+    term = (term or '').strip()
+    if not term:
+        return queryset
+
+    if not supports_ranked_search(queryset):
+        return queryset.filter(_prefix_filter(prefix_fields, term))
+
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    normalized = normalize_search_text(term)
+    queryset = queryset.filter(
+        Q(search_document__contains=normalized) |
+        Q(search_document__trigram_word_similar=normalized)
+    )
+    if ranked:
+        queryset = (queryset
+                    .annotate(search_rank=TrigramWordSimilarity(normalized, 'search_document'))
+                    .order_by('-search_rank', 'pk'))
+    return queryset
+
+
+def search_ad_users(queryset, term, ranked=False):
+    """
+    Filtra usuários do AD por nome, login, e-mail, departamento ou cargo.
+
+    Args:
+        queryset: QuerySet de ADUser
+        term (str): Texto digitado
+        ranked (bool): Ordena por relevância e anota `search_rank`
+            (apenas PostgreSQL; nos demais bancos a ordem não muda)
+
+    Returns:
+        QuerySet: Usuários encontrados
+    """
+    return _search(queryset, term, AD_USER_PREFIX_FIELDS, ranked)
+
+
+def search_ad_groups(queryset, term, ranked=False):
+    """
+    Filtra grupos do AD por nome ou descrição.
+
+    Returns:
+        QuerySet: Grupos encontrados (ver search_ad_users)
+    """
+    return _search(queryset, term, AD_GROUP_PREFIX_FIELDS, ranked)
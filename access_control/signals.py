@@ -0,0 +1,136 @@
+"""
+Signals do app access_control.
+
+- Mantêm ADUser.effective_permissions atualizado quando as permissões de
+  grupos/usuários ou as associações usuário-grupo são alteradas pelo ORM
+  (admin, telas de permissão). A sincronização do AD usa operações em lote,
+  que não disparam signals, e chama recompute_effective_permissions diretamente.
+- Invalidam o contexto de autorização em cache (access_control.authz) quando
+  AdminProfile ou CountryPermission mudam.
+- Invalidam o snapshot do dashboard global (access_control.stats) quando
+  admins, diretórios LDAP, usuários ou usuários do AD mudam, e recontam os
+  usuários/grupos locais no rollup CountryStats.
+"""
+
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from accounts.models import User
+from adminpanel.models import LdapDirectory
+from .authz import invalidate_authorization_context
+from .bitset import PERMISSION_FIELDS
+from .models import ADGroup, ADUser, AdminProfile, CountryPermission
+from .permissions import recompute_effective_permissions
+from .stats import invalidate_global_stats, refresh_country_stats
+
+# Campos de ADUser que influenciam a permissão efetiva
+USER_PERMISSION_FIELDS = {'has_individual_permissions', *PERMISSION_FIELDS}
+
+
+def _touches(update_fields, fields):
+    """True se o save pode ter alterado algum dos `fields`."""
+    return update_fields is None or bool(set(update_fields) & set(fields))
+
+
+@receiver(post_save, sender=ADGroup)
+def adgroup_permissions_changed(sender, instance, created, update_fields=None, **kwargs):
+    # Grupo recém-criado ainda não tem membros
+    if created or not _touches(update_fields, PERMISSION_FIELDS):
+        return
+    recompute_effective_permissions(group_ids=[instance.pk])
+
+
+@receiver(pre_delete, sender=ADGroup)
+def adgroup_before_delete(sender, instance, **kwargs):
+    # As associações são apagadas em cascata sem m2m_changed: guarda os membros
+    instance._member_ids = list(instance.users.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=ADGroup)
+def adgroup_deleted(sender, instance, **kwargs):
+    member_ids = getattr(instance, '_member_ids', None)
+    if member_ids:
+        recompute_effective_permissions(user_ids=member_ids)
+
+
+@receiver(post_save, sender=ADUser)
+def aduser_permissions_changed(sender, instance, created, update_fields=None, **kwargs):
+    if not _touches(update_fields, USER_PERMISSION_FIELDS):
+        return
+    recompute_effective_permissions(user_ids=[instance.pk])
+
+
+@receiver(m2m_changed, sender=ADUser.groups.through)
+def aduser_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # group.users.clear(): guarda os membros antes de removê-los
+        instance._member_ids = list(instance.users.values_list('pk', flat=True))
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        # user.groups.add/remove/clear
+        recompute_effective_permissions(user_ids=[instance.pk])
+    elif action == 'post_clear':
+        recompute_effective_permissions(user_ids=getattr(instance, '_member_ids', []))
+    elif pk_set:
+        # group.users.add/remove
+        recompute_effective_permissions(user_ids=pk_set)
+
+
+@receiver(post_save, sender=AdminProfile)
+@receiver(post_delete, sender=AdminProfile)
+def admin_profile_changed(sender, instance, **kwargs):
+    invalidate_authorization_context(instance.user_id)
+    invalidate_global_stats()
+
+
+@receiver(post_save, sender=CountryPermission)
+@receiver(post_delete, sender=CountryPermission)
+def country_permission_changed(sender, instance, **kwargs):
+    user_id = (AdminProfile.objects
+               .filter(pk=instance.admin_profile_id)
+               .values_list('user_id', flat=True)
+               .first())
+    if user_id is not None:
+        invalidate_authorization_context(user_id)
+
+
+@receiver(post_save, sender=LdapDirectory)
+@receiver(post_delete, sender=LdapDirectory)
+@receiver(post_delete, sender=ADUser)
+def global_stats_changed(sender, **kwargs):
+    invalidate_global_stats()
+
+
+@receiver(post_save, sender=ADUser)
+def aduser_saved(sender, created, update_fields=None, **kwargs):
+    if created or _touches(update_fields, {'is_active', 'country_code'}):
+        invalidate_global_stats()
+
+
+# Campos de User que entram nas contagens (dashboard global e CountryStats)
+USER_STATS_FIELDS = {'is_active', 'is_supplier', 'country_code'}
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Login grava last_login/dados do AD com update_fields: não afeta as contagens
+    if not _touches(update_fields, USER_STATS_FIELDS):
+        return
+    invalidate_global_stats()
+    if instance.country_code:
+        refresh_country_stats(instance.country_code, sources=['local_users'], create=False)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def local_group_changed(sender, instance, **kwargs):
+    # Grupos locais seguem o padrão "<país>_<nome>"
+    country_code, sep, _ = instance.name.partition('_')
+    if sep and country_code:
+        refresh_country_stats(country_code, sources=['local_groups'], create=False)
@@ -0,0 +1,203 @@
+"""
+Estatísticas agregadas do painel de administração.
+
+- Dashboard global: snapshot em cache, calculado numa única ida ao banco
+  (UNION ALL de consultas agrupadas com COUNT ... FILTER). Os signals em
+  access_control.signals e a sincronização do AD descartam o snapshot.
+- Dashboard do país: tabela de rollup CountryStats, lida por chave primária.
+  A sincronização recalcula os contadores do país; os toggles de permissão
+  aplicam deltas com UPDATE ... SET campo = campo + n.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import Group
+from django.db.models import CharField, Count, F, Q, Value
+from django.db.models.functions import Greatest
+
+from accounts.models import User
+from adminpanel.models import LdapDirectory
+from .bitset import PermissionSet
+from .models import ADGroup, ADUser, AdminProfile, CountryStats
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_STATS_CACHE_KEY = 'access_control:global_stats'
+
+# Tempo (segundos) de vida do snapshot, mesmo sem invalidação
+GLOBAL_STATS_CACHE_TIMEOUT = getattr(settings, 'GLOBAL_STATS_CACHE_TIMEOUT', 60)
+
+
+def _per_country(queryset, kind, condition):
+    """Contagem condicional agrupada por país, rotulada com `kind`."""
+    return (queryset
+            .order_by()
+            .values('country_code')
+            .annotate(kind=Value(kind, output_field=CharField()), total=Count('pk', filter=condition))
+            .values_list('country_code', 'kind', 'total'))
+
+
+def compute_global_stats():
+    """
+    Calcula as estatísticas do dashboard global numa única query.
+
+    Returns:
+        dict: {
+            'total_countries': int,      # países com admin de país ativo
+            'total_admins': int,
+            'total_ads': int,
+            'total_users': int,          # usuários ativos não fornecedores
+            'total_ad_users': int,
+            'countries_without_ad': list,
+            'per_country': {country_code: {'admins', 'directories', 'users', 'ad_users'}},
+        }
+    """
+    rows = _per_country(
+        AdminProfile.objects.all(), 'admins',
+        Q(access_level='country_admin', is_active=True)
+    ).union(
+        _per_country(LdapDirectory.objects.all(), 'directories', Q(is_active=True)),
+        _per_country(User.objects.all(), 'users', Q(is_active=True, is_supplier=False)),
+        _per_country(ADUser.objects.all(), 'ad_users', Q(is_active=True)),
+        all=True,
+    )
+
+    per_country = {}
+    for country_code, kind, total in rows:
+        counters = per_country.setdefault(
+            country_code, {'admins': 0, 'directories': 0, 'users': 0, 'ad_users': 0}
+        )
+        counters[kind] += total
+
+    totals = {kind: sum(c[kind] for c in per_country.values())
+              for kind in ('admins', 'directories', 'users', 'ad_users')}
+
+    countries = {code: c for code, c in per_country.items() if code}
+    return {
+        'total_countries': sum(1 for c in countries.values() if c['admins']),
+        'total_admins': totals['admins'],
+        'total_ads': totals['directories'],
+        'total_users': totals['users'],
+        'total_ad_users': totals['ad_users'],
+        'countries_without_ad': sorted(
+            code for code, c in countries.items() if c['admins'] and not c['directories']
+        ),
+        'per_country': countries,
+    }
+
+
+def get_global_stats():
+    """
+    Snapshot das estatísticas globais (cache com TTL curto).
+
+    Returns:
+        dict: Mesmo formato de compute_global_stats()
+    """
+    stats = cache.get(GLOBAL_STATS_CACHE_KEY)
+    if stats is None:
+        stats = compute_global_stats()
+        cache.set(GLOBAL_STATS_CACHE_KEY, stats, GLOBAL_STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate_global_stats():
+    """Descarta o snapshot; a próxima leitura recalcula."""
+    cache.delete(GLOBAL_STATS_CACHE_KEY)
+
+
+# =====================================================
+# Rollup por país (CountryStats)
+# =====================================================
+
+# Contadores de CountryStats agrupados pela tabela de origem
+COUNTRY_STATS_SOURCES = {
+    'ad_users': ['ad_users_count', 'users_with_supplier_perm'],
+    'ad_groups': ['ad_groups_count', 'groups_with_supplier_perm'],
+    'local_users': ['local_users_count'],
+    'local_groups': ['local_groups_count'],
+}
+
+# Usuário do AD que conta como "com permissão" na tela de fornecedores
+AD_USER_WITH_LOGIN = Q(can_login=True) | Q(effective_permissions__has_all='can_login')
+
+
+def _count_country_stats(country_code, sources):
+    """Recalcula os contadores das fontes informadas (1 query por fonte)."""
+    values = {}
+    if 'ad_users' in sources:
+        values.update(ADUser.objects.active_in(country_code).aggregate(
+            ad_users_count=Count('pk'),
+            users_with_supplier_perm=Count('pk', filter=AD_USER_WITH_LOGIN),
+        ))
+    if 'ad_groups' in sources:
+        values.update(ADGroup.objects.active_in(country_code).aggregate(
+            ad_groups_count=Count('pk'),
+            groups_with_supplier_perm=Count('pk', filter=Q(can_login=True)),
+        ))
+    if 'local_users' in sources:
+        values['local_users_count'] = User.objects.filter(country_code=country_code, is_active=True).count()
+    if 'local_groups' in sources:
+        values['local_groups_count'] = Group.objects.filter(name__startswith=f'{country_code}_').count()
+    return values
+
+
+def refresh_country_stats(country_code, sources=None, create=True):
+    """
+    Recalcula (total ou parcialmente) a linha de CountryStats do país.
+
+    Args:
+        country_code (str): Código do país
+        sources (iterable): Chaves de COUNTRY_STATS_SOURCES; None = todas
+        create (bool): Se False, só atualiza um rollup já existente (os
+            demais são calculados por completo na primeira leitura)
+
+    Returns:
+        CountryStats: Linha atualizada (None se create=False e não existia)
+    """
+    sources = set(sources or COUNTRY_STATS_SOURCES)
+    values = _count_country_stats(country_code, sources)
+    if not create:
+        CountryStats.objects.filter(pk=country_code).update(**values)
+        return None
+    stats, _ = CountryStats.objects.update_or_create(country_code=country_code, defaults=values)
+    return stats
+
+
+def adjust_country_stats(country_code, **deltas):
+    """
+    Aplica deltas aos contadores do país num único UPDATE (sem ler a linha).
+    Se o país ainda não tem rollup, ele é calculado por completo.
+
+    Usage:
+        adjust_country_stats('BR', groups_with_supplier_perm=1)
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updated = CountryStats.objects.filter(country_code=country_code).update(
+        **{field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()}
+    )
+    if not updated:
+        refresh_country_stats(country_code)
+
+
+def get_country_stats(country_code):
+    """
+    Contadores do dashboard do país (1 leitura por chave primária).
+
+    Returns:
+        CountryStats: Rollup do país (criado na primeira leitura)
+    """
+    try:
+        return CountryStats.objects.get(pk=country_code)
+    except CountryStats.DoesNotExist:
+        return refresh_country_stats(country_code)
+
+
+def ad_user_has_supplier_perm(ad_user):
+    """True se o usuário do AD conta em users_with_supplier_perm."""
+    return ad_user.is_active and (
+        ad_user.can_login or 'can_login' in PermissionSet(ad_user.effective_permissions)
+    )
@@ -0,0 +1,219 @@
+"""
+Serviço de sincronização do Active Directory com o banco de dados.
+Concentra a lógica usada pelas views de sincronização de usuários e grupos.
+"""
+
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from ldap_advanced_utils import (
+    DNCache,
+    batched,
+    directory_connection,
+    get_sync_watermark,
+    iter_ad_groups,
+    iter_ad_users,
+    list_deleted_ad_users,
+)
+from .bulk import bulk_reconcile, deactivate_missing, empty_result, merge_results, reconcile_memberships
+from .models import ADGroup, ADUser, ADSyncState
+from .permissions import recompute_effective_permissions
+from .stats import invalidate_global_stats, refresh_country_stats
+
+logger = logging.getLogger(__name__)
+
+# Quantidade de entradas do AD reconciliadas por transação
+SYNC_BATCH_SIZE = 2000
+
+# Campos sincronizados a partir do AD
+AD_USER_SYNC_FIELDS = [
+    'username', 'email', 'first_name', 'last_name',
+    'display_name', 'department', 'title', 'is_active',
+]
+AD_GROUP_SYNC_FIELDS = ['name', 'description', 'member_count', 'is_active']
+
+# Validade (segundos) do mapeamento DN do membro -> ADUser numa sincronização de grupos
+SYNC_MEMBER_CACHE_TTL = 3600
+
+# Flag ACCOUNTDISABLE do userAccountControl
+UAC_ACCOUNT_DISABLE = 0x0002
+
+
+def sync_country_users(ldap_config, full=False, progress=None):
+    """
+    Sincroniza os usuários do AD de um país.
+
+    Por padrão faz uma sincronização incremental: busca apenas objetos com
+    uSNChanged acima da marca d'água salva e os tombstones removidos desde
+    então. Faz sincronização completa quando `full=True`, quando ainda não
+    existe marca d'água ou quando o DC mudou.
+
+    Usuários removidos do AD são desativados (removed_at preenchido): na
+    incremental, pelos tombstones; na completa, por diferença entre os DNs
+    lidos e os do banco.
+
+    Args:
+        ldap_config (LdapDirectory): Configuração do AD do país
+        full (bool): Força uma ressincronização completa
+        progress (callable): Chamado com os contadores parciais após cada lote
+
+    Returns:
+        dict: {'mode': 'full'|'incremental', 'created': int, 'updated': int,
+               'unchanged': int, 'deactivated': int, 'removed': int, 'conflicts': int}
+    """
+    country_code = ldap_config.country_code
+    state, _ = ADSyncState.objects.get_or_create(country_code=country_code)
+
+    # Uma conexão (um DC) para a marca d'água e as buscas: o uSN só vale no
+    # DC que o emitiu, e o failover/rodízio poderia trocar de DC entre elas
+    with directory_connection(ldap_config) as conn:
+        # Lê a marca d'água ANTES da busca: alterações feitas durante a
+        # sincronização serão retornadas novamente na próxima execução.
+        highest_usn, server_name = get_sync_watermark(ldap_config, conn)
+        incremental = not full and state.can_sync_incrementally(server_name)
+
+        if incremental:
+            ad_users = iter_ad_users(ldap_config, changed_since_usn=state.highest_usn, connection=conn)
+        else:
+            ad_users = iter_ad_users(ldap_config, connection=conn)
+
+        result = empty_result()
+        result['mode'] = 'incremental' if incremental else 'full'
+        seen_dns = set()
+
+        # As entradas chegam página a página; cada lote é reconciliado em sua transação
+        for batch in batched(ad_users, SYNC_BATCH_SIZE):
+            rows = [_user_row(user_data) for user_data in batch]
+            if not incremental:
+                seen_dns.update(row['distinguished_name'] for row in rows)
+            with transaction.atomic():
+                merge_results(result, bulk_reconcile(
+                    ADUser, country_code, rows, AD_USER_SYNC_FIELDS, natural_key='username'
+                ))
+            if progress:
+                progress(result)
+
+        with transaction.atomic():
+            now = timezone.now()
+            if incremental:
+                deleted_usernames = list_deleted_ad_users(ldap_config, state.highest_usn, connection=conn)
+                if deleted_usernames:
+                    result['removed'] += ADUser.objects.filter(
+                        country_code=country_code,
+                        username__in=deleted_usernames,
+                        removed_at__isnull=True
+                    ).update(is_active=False, removed_at=now, last_sync=now)
+            else:
+                result['removed'] += deactivate_missing(ADUser, country_code, seen_dns)['removed']
+
+            # A marca d'água só avança depois que todos os lotes foram gravados
+            state.server_name = server_name
+            state.highest_usn = highest_usn
+            if incremental:
+                state.last_incremental_sync = now
+            else:
+                state.last_full_sync = now
+            state.save()
+
+    # bulk_create/bulk_update não disparam signals
+    if result['created'] or result['deactivated'] or result['updated'] or result['removed']:
+        invalidate_global_stats()
+    refresh_country_stats(country_code, sources=['ad_users'])
+
+    logger.info(
+        f"✅ Sincronização {result['mode']} de usuários ({country_code}): "
+        f"{result['created']} criados, {result['updated']} atualizados, "
+        f"{result['unchanged']} inalterados, {result['deactivated']} desativados, "
+        f"{result['removed']} removidos do AD"
+    )
+    return result
+
+
+def sync_country_groups(ldap_config, progress=None):
+    """
+    Sincroniza os grupos do AD de um país, processando a busca paginada em lotes;
+    as associações usuário-grupo (ADUser.groups) de cada lote são gravadas na
+    mesma transação, com os membros completos (ranged retrieval acima de 1500).
+    Grupos que não vieram na busca são desativados como removidos do AD e
+    perdem suas associações.
+
+    Args:
+        ldap_config (LdapDirectory): Configuração do AD do país
+        progress (callable): Chamado com os contadores parciais após cada lote
+
+    Returns:
+        dict: {'created': int, 'updated': int, 'unchanged': int, 'deactivated': int,
+               'removed': int, 'members_added': int, 'members_removed': int}
+    """
+    country_code = ldap_config.country_code
+    result = empty_result()
+    result['members_added'] = result['members_removed'] = 0
+
+    # As associações são reconciliadas lote a lote, junto com os grupos: só os
+    # membros do lote atual ficam em memória. O cache (DN do membro -> id do
+    # ADUser) dura a sincronização inteira
+    member_ids = DNCache(ttl=SYNC_MEMBER_CACHE_TTL)
+    seen_dns = []
+
+    def apply_memberships(memberships):
+        membership_result = reconcile_memberships(country_code, memberships, cache=member_ids)
+        # bulk_create/delete não disparam m2m_changed: recalcula aqui
+        recompute_effective_permissions(user_ids=membership_result['user_ids'])
+        result['members_added'] += membership_result['added']
+        result['members_removed'] += membership_result['removed']
+
+    for batch in batched(iter_ad_groups(ldap_config), SYNC_BATCH_SIZE):
+        rows = [_group_row(group_data) for group_data in batch]
+        seen_dns.extend(group_data['dn'] for group_data in batch)
+        with transaction.atomic():
+            merge_results(result, bulk_reconcile(
+                ADGroup, country_code, rows, AD_GROUP_SYNC_FIELDS, natural_key='name'
+            ))
+            apply_memberships({group_data['dn']: group_data.get('members', []) for group_data in batch})
+        if progress:
+            progress(result)
+
+    with transaction.atomic():
+        removal = deactivate_missing(ADGroup, country_code, seen_dns)
+        result['removed'] = removal['removed']
+        apply_memberships({group_dn: [] for group_dn in removal['dns']})
+
+    # Associações mudam as permissões efetivas: recontamos grupos e usuários
+    refresh_country_stats(country_code, sources=['ad_groups', 'ad_users'])
+
+    logger.info(
+        f"✅ Sincronização de grupos ({country_code}): "
+        f"{result['created']} criados, {result['updated']} atualizados, "
+        f"{result['unchanged']} inalterados, {result['removed']} removidos do AD; associações: "
+        f"{result['members_added']} adicionadas, {result['members_removed']} removidas"
+    )
+    return result
+
+
+def _user_row(user_data):
+    """Converte um usuário vindo do AD nos campos do modelo ADUser."""
+    uac = user_data.get('user_account_control', 512)
+    return {
+        'distinguished_name': user_data['dn'],
+        'username': user_data.get('username', ''),
+        'email': user_data.get('email', ''),
+        'first_name': user_data.get('first_name', ''),
+        'last_name': user_data.get('last_name', ''),
+        'display_name': user_data.get('display_name', ''),
+        'department': user_data.get('department', ''),
+        'title': user_data.get('title', ''),
+        'is_active': not (uac & UAC_ACCOUNT_DISABLE),
+    }
+
+
+def _group_row(group_data):
+    """Converte um grupo vindo do AD nos campos do modelo ADGroup."""
+    return {
+        'distinguished_name': group_data['dn'],
+        'name': group_data['name'],
+        'description': group_data.get('description', ''),
+        'member_count': group_data.get('member_count', 0),
+        'is_active': True,
+    }
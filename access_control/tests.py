@@ -1,3 +1,829 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from importlib import import_module
+from types import SimpleNamespace
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from ldap3.utils.dn import safe_dn
+
+from accounts.models import User
+from access_control.authz import load_authorization_context
+from access_control.bitset import ALL_PERMISSIONS, PERMISSION_BITS, PermissionSet
+from access_control.bulk import bulk_reconcile, deactivate_missing
+from access_control.jobs import claim_job, claim_next_job, enqueue_sync, fail_stale_jobs, run_job
+from access_control.models import ADGroup, ADSyncJob, ADUser, AdminProfile, CountryStats
+from access_control.orchestrator import _run_in_thread, _touch_waiting, sync_all_directories
+from access_control.permissions import recompute_effective_permissions
+from access_control.search import AD_USER_SEARCH_FIELDS, normalize_search_text, search_ad_groups, search_ad_users
+from access_control.stats import (
+    COUNTRY_STATS_SOURCES,
+    adjust_country_stats,
+    get_country_stats,
+    get_global_stats,
+    refresh_country_stats,
+)
+from access_control.sync import AD_USER_SYNC_FIELDS, sync_country_groups, sync_country_users
+from adminpanel.ldap_health import open_with_failover
+from adminpanel.ldap_standin import STANDIN_RANGE_STEP
+from adminpanel.models import LdapDirectory
+from adminpanel.tests import StandInDirectoryTestCase
+from core.querycount import assert_query_budget
+from ldap_advanced_utils import (
+    ADConnection,
+    batched,
+    is_dn_under,
+    iter_ad_groups,
+    iter_ad_users,
+    iter_member_dns,
+    iter_organizational_units,
+    paged_search,
+)
+
+
+class DnTests(TestCase):
+
+    def test_is_dn_under(self):
+        self.assertTrue(is_dn_under('CN=Ana,OU=Users,OU=Corp,DC=x,DC=com', 'ou=corp, dc=x,dc=com'))
+        self.assertTrue(is_dn_under('OU=Corp,DC=x,DC=com', 'OU=Corp,DC=x,DC=com'))
+        self.assertFalse(is_dn_under('CN=Ana,OU=Other,DC=x,DC=com', 'OU=Corp,DC=x,DC=com'))
+        self.assertFalse(is_dn_under('OU=NotCorp,DC=x,DC=com', 'OU=Corp,DC=x,DC=com'))
+
+
+class IncrementalUserSyncTests(StandInDirectoryTestCase):
+    # base_dn numa OU: os tombstones ficam fora dela, em CN=Deleted Objects do domínio
+    base_dn = 'OU=Corp,DC=test,DC=local'
+
+    def setUp(self):
+        super().setUp()
+        sync_country_users(self.directory, full=True)
+
+    def test_tombstone_from_base_dn_removes_user(self):
+        self.standin.delete(self.standin.user_dns[3])
+
+        result = sync_country_users(self.directory)
+
+        self.assertEqual(result['mode'], 'incremental')
+        self.assertEqual(result['removed'], 1)
+        self.assertIsNotNone(ADUser.objects.get(username='bench000003').removed_at)
+        self.assertEqual(ADUser.objects.filter(removed_at__isnull=True).count(), self.users - 1)
+
+    def test_tombstone_outside_base_dn_is_ignored(self):
+        tombstone = 'CN=Homonimo\\0ADEL:1,CN=Deleted Objects,DC=test,DC=local'
+        self.standin._add(tombstone, {
+            'objectClass': ['top', 'person', 'user'],
+            'sAMAccountName': 'bench000004',
+            'isDeleted': 'TRUE',
+            'lastKnownParent': 'OU=Other,DC=test,DC=local',
+        })
+        self.standin.deleted_dns.add(safe_dn(tombstone))
+
+        result = sync_country_users(self.directory)
+
+        self.assertEqual(result['removed'], 0)
+        self.assertIsNone(ADUser.objects.get(username='bench000004').removed_at)
+
+    def test_sync_run_uses_a_single_connection(self):
+        # Marca d'água, busca incremental e tombstones no mesmo DC
+        self.standin.delete(self.standin.user_dns[2])
+        with mock.patch('ldap_advanced_utils.open_with_failover', wraps=open_with_failover) as opened:
+            result = sync_country_users(self.directory)
+
+        self.assertEqual(result['removed'], 1)
+        self.assertEqual(opened.call_count, 1)
+
+    def test_incremental_sync_skips_unchanged_users(self):
+        self.standin.delete(self.standin.user_dns[0])
+        result = sync_country_users(self.directory)
+        # Só o tombstone mudou desde a marca d'água
+        self.assertEqual(result['created'] + result['updated'] + result['unchanged'], 0)
+
+
+def user_row(username, dn=None, **fields):
+    row = {
+        'distinguished_name': dn or f'CN={username},OU=Users,DC=x,DC=com',
+        'username': username,
+        'email': f'{username}@x.com',
+        'first_name': username.title(),
+        'last_name': 'Silva',
+        'display_name': f'{username.title()} Silva',
+        'department': 'TI',
+        'title': 'Analista',
+        'is_active': True,
+    }
+    row.update(fields)
+    return row
+
+
+def reconcile(rows, country_code='BR'):
+    return bulk_reconcile(ADUser, country_code, rows, AD_USER_SYNC_FIELDS, natural_key='username')
+
+
+class BulkReconcileTests(TestCase):
+
+    def test_counts_created_updated_unchanged_and_deactivated(self):
+        reconcile([user_row('ana'), user_row('bia'), user_row('caio')])
+
+        result = reconcile([
+            user_row('ana'),
+            user_row('bia', title='Gerente'),
+            user_row('caio', is_active=False),
+            user_row('davi'),
+        ])
+
+        self.assertEqual(
+            {key: result[key] for key in ('created', 'updated', 'unchanged', 'deactivated', 'conflicts')},
+            {'created': 1, 'updated': 1, 'unchanged': 1, 'deactivated': 1, 'conflicts': 0},
+        )
+        self.assertEqual(ADUser.objects.get(username='bia').title, 'Gerente')
+        self.assertFalse(ADUser.objects.get(username='caio').is_active)
+
+    def test_moved_user_keeps_row(self):
+        reconcile([user_row('ana')])
+        pk = ADUser.objects.get(username='ana').pk
+
+        result = reconcile([user_row('ana', dn='CN=ana,OU=Moved,DC=x,DC=com')])
+
+        self.assertEqual(result['updated'], 1)
+        self.assertEqual(ADUser.objects.get(pk=pk).distinguished_name, 'CN=ana,OU=Moved,DC=x,DC=com')
+
+    def test_dn_of_another_country_is_rejected(self):
+        reconcile([user_row('ana')], country_code='AR')
+
+        result = reconcile([user_row('ana', first_name='Outra')], country_code='BR')
+
+        self.assertEqual(result['conflicts'], 1)
+        self.assertEqual(result['created'] + result['updated'], 0)
+        row = ADUser.objects.get(distinguished_name=user_row('ana')['distinguished_name'])
+        self.assertEqual((row.country_code, row.first_name), ('AR', 'Ana'))
+
+
+class DeactivateMissingTests(TestCase):
+
+    def setUp(self):
+        reconcile([user_row(name) for name in ('ana', 'bia', 'caio', 'davi')])
+
+    def test_missing_users_are_marked_removed_and_revived(self):
+        seen = [user_row(name)['distinguished_name'] for name in ('ana', 'bia', 'caio')]
+
+        result = deactivate_missing(ADUser, 'BR', seen)
+
+        self.assertEqual(result['removed'], 1)
+        davi = ADUser.objects.get(username='davi')
+        self.assertFalse(davi.is_active)
+        self.assertIsNotNone(davi.removed_at)
+
+        reconcile([user_row('davi')])
+        davi.refresh_from_db()
+        self.assertTrue(davi.is_active)
+        self.assertIsNone(davi.removed_at)
+
+    def test_guard_skips_mass_removal(self):
+        result = deactivate_missing(ADUser, 'BR', [user_row('ana')['distinguished_name']])
+
+        self.assertTrue(result['skipped'])
+        self.assertEqual(ADUser.objects.filter(removed_at__isnull=False).count(), 0)
+
+    def test_other_countries_are_untouched(self):
+        reconcile([user_row('eva')], country_code='AR')
+        deactivate_missing(ADUser, 'BR', [user_row(name)['distinguished_name'] for name in ('ana', 'bia', 'caio')])
+        self.assertIsNone(ADUser.objects.get(username='eva').removed_at)
+
+
+class PurgeRemovedDirectoryObjectsTests(TestCase):
+
+    def setUp(self):
+        reconcile([user_row(name) for name in ('ana', 'bia', 'caio')])
+        reconcile([user_row('eva')], country_code='AR')
+        self.group = ADGroup.objects.create(country_code='BR', name='Antigo', distinguished_name='CN=Antigo,DC=x')
+        self.group.users.set(ADUser.objects.filter(country_code='BR'))
+        old = timezone.now() - timedelta(days=100)
+        ADUser.objects.filter(username__in=['ana', 'eva']).update(is_active=False, removed_at=old)
+        ADGroup.objects.filter(pk=self.group.pk).update(is_active=False, removed_at=old)
+        # Removido há pouco tempo e apenas desabilitado: ficam
+        ADUser.objects.filter(username='bia').update(is_active=False, removed_at=timezone.now())
+        ADUser.objects.filter(username='caio').update(is_active=False)
+
+    def purge(self, **options):
+        call_command('purge_removed_directory_objects', stdout=StringIO(), **options)
+
+    def remaining(self):
+        return sorted(ADUser.objects.values_list('username', flat=True))
+
+    def test_only_old_removals_are_purged(self):
+        self.purge(batch_size=1)
+
+        self.assertEqual(self.remaining(), ['bia', 'caio'])
+        self.assertFalse(ADGroup.objects.filter(pk=self.group.pk).exists())
+        self.assertEqual(ADUser.groups.through.objects.count(), 0)
+
+    def test_dry_run_and_country_filter(self):
+        self.purge(dry_run=True)
+        self.assertEqual(self.remaining(), ['ana', 'bia', 'caio', 'eva'])
+
+        self.purge(countries='ar')
+        self.assertEqual(self.remaining(), ['ana', 'bia', 'caio'])
+
+    def test_days_option(self):
+        self.purge(days=0)
+
+        self.assertEqual(self.remaining(), ['caio'])
+
+
+class SyncJobQueueTests(TestCase):
+
+    def test_pending_request_is_reused(self):
+        job, created = enqueue_sync('BR', job_type='users')
+        again, created_again = enqueue_sync('BR', job_type='users')
+        self.assertTrue(created)
+        self.assertEqual((again.pk, created_again), (job.pk, False))
+
+    def test_pending_job_is_merged_with_new_request(self):
+        job, _ = enqueue_sync('BR', job_type='users')
+        merged, created = enqueue_sync('BR', job_type='groups', full=True)
+
+        self.assertFalse(created)
+        job.refresh_from_db()
+        self.assertEqual((merged.pk, job.job_type, job.full), (job.pk, 'all', True))
+
+    def test_database_allows_one_pending_job_per_country(self):
+        ADSyncJob.objects.create(country_code='BR', job_type='users')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ADSyncJob.objects.create(country_code='BR', job_type='groups')
+
+    def test_running_job_covering_request_is_reused(self):
+        job, _ = enqueue_sync('BR', job_type='all')
+        self.assertTrue(claim_job(job))
+
+        again, created = enqueue_sync('BR', job_type='groups')
+        self.assertEqual((again.pk, created), (job.pk, False))
+
+    def test_request_not_covered_waits_for_running_job(self):
+        job, _ = enqueue_sync('BR', job_type='users')
+        self.assertTrue(claim_job(job))
+
+        queued, created = enqueue_sync('BR', job_type='users', full=True)
+        self.assertTrue(created)
+        self.assertIsNone(claim_next_job('teste'))
+        self.assertFalse(claim_job(queued))
+
+        other, _ = enqueue_sync('AR', job_type='users')
+        self.assertEqual(claim_next_job('teste').pk, other.pk)
+
+    def test_run_job_keeps_status_set_by_stale_cleanup(self):
+        job, _ = enqueue_sync('BR', job_type='users')
+        claim_job(job)
+        ADSyncJob.objects.filter(pk=job.pk).update(updated_at=job.updated_at.replace(year=2000))
+        self.assertEqual(fail_stale_jobs(), 1)
+
+        run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', 'Worker interrompido durante a execução.'))
+
+    def test_thread_failure_is_saved(self):
+        job, _ = enqueue_sync('BR', job_type='users')
+        claim_job(job)
+        with mock.patch('access_control.orchestrator.run_job', side_effect=RuntimeError('sem banco')), \
+                mock.patch('access_control.orchestrator.connections'):
+            _run_in_thread(job)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', 'sem banco'))
+
+    def test_jobs_are_claimed_only_when_a_worker_is_free(self):
+        for country_code in ('AR', 'BR', 'MX'):
+            LdapDirectory.objects.create(
+                country_code=country_code, name=country_code, ldap_server=f'{country_code.lower()}.invalid',
+                base_dn='DC=test,DC=local', is_active=True,
+            )
+        pending_when_finished = []
+
+        def fake_run(job):
+            # Sem banco na thread: o job só é marcado como concluído em memória
+            job.status = 'success'
+            return job
+
+        def on_finish(job):
+            pending_when_finished.append(ADSyncJob.objects.filter(status='pending').count())
+
+        with mock.patch('access_control.orchestrator._run_in_thread', side_effect=fake_run):
+            summary = sync_all_directories(job_type='users', max_workers=1, on_finish=on_finish)
+
+        self.assertEqual(len(summary['succeeded']), 3)
+        self.assertEqual(pending_when_finished, [2, 1, 0])
+
+    def test_waiting_jobs_are_kept_alive(self):
+        job, _ = enqueue_sync('BR', job_type='users')
+        claim_job(job)
+        ADSyncJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        _touch_waiting([(job, 'ldap://dc.invalid:389')])
+
+        self.assertEqual(fail_stale_jobs(), 0)
+
+
+class GroupMembershipSyncTests(StandInDirectoryTestCase):
+    users = STANDIN_RANGE_STEP + 100
+
+    def populate(self):
+        self.standin.populate(self.users, groups=2, group_size=10, big_group_size=self.users)
+        self.standin._add_group('Bench Empty Group', [])
+
+    def setUp(self):
+        super().setUp()
+        sync_country_users(self.directory, full=True)
+        self.big_group_dn = self.standin.group_dns[0]
+
+    def test_only_ranged_groups_are_read_again(self):
+        with mock.patch('ldap_advanced_utils.iter_member_dns', wraps=iter_member_dns) as reread:
+            groups = {group['dn']: group['member_count'] for group in iter_ad_groups(self.directory)}
+
+        # Só o grupo acima de MaxValRange; o grupo vazio não gera outra busca
+        self.assertEqual(reread.call_count, 1)
+        self.assertEqual(groups[self.big_group_dn], self.users)
+        self.assertEqual(groups[self.standin.group_dns[-1]], 0)
+
+    def test_group_above_range_step_keeps_all_members(self):
+        result = sync_country_groups(self.directory)
+
+        big_group = ADGroup.objects.get(distinguished_name=self.big_group_dn)
+        self.assertEqual(big_group.users.count(), self.users)
+        self.assertEqual(big_group.member_count, self.users)
+        self.assertEqual(result['members_added'], self.users + 20)
+
+        again = sync_country_groups(self.directory)
+        self.assertEqual((again['members_added'], again['members_removed']), (0, 0))
+        self.assertEqual(big_group.users.count(), self.users)
+
+    def test_group_removed_from_ad_is_deactivated(self):
+        sync_country_groups(self.directory)
+        removed_dn = self.standin.group_dns[1]
+        self.standin.delete(removed_dn)
+
+        result = sync_country_groups(self.directory)
+
+        group = ADGroup.objects.get(distinguished_name=removed_dn)
+        self.assertEqual(result['removed'], 1)
+        self.assertFalse(group.is_active)
+        self.assertIsNotNone(group.removed_at)
+        # As associações do grupo removido saem junto
+        self.assertEqual(group.users.count(), 0)
+
+    def test_member_removed_from_big_group(self):
+        sync_country_groups(self.directory)
+        self.standin.delete(self.standin.user_dns[-1])
+
+        result = sync_country_groups(self.directory)
+
+        self.assertEqual(result['members_removed'], 1)
+        big_group = ADGroup.objects.get(distinguished_name=self.big_group_dn)
+        self.assertEqual(big_group.users.count(), self.users - 1)
+
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class PagedSearchTests(StandInDirectoryTestCase):
+    users = 23
+
+    def populate(self):
+        self.standin.populate(self.users, groups=3, group_size=5)
+        for ou_dn in (f'OU=Users,{self.base_dn}', f'OU=Compras,OU=Users,{self.base_dn}'):
+            self.standin._add(ou_dn, {
+                'objectClass': ['top', 'organizationalUnit'],
+                'ou': ou_dn.split(',')[0][3:],
+            })
+
+    def test_pages_are_requested_on_demand(self):
+        with ADConnection(self.directory) as ad:
+            conn = ad.connection
+            with mock.patch.object(conn, 'search', wraps=conn.search) as search:
+                entries = paged_search(conn, self.base_dn, '(objectCategory=person)', ['sAMAccountName'], page_size=5)
+                next(entries)
+                self.assertEqual(search.call_count, 1)
+
+                dns = [dn for dn, _ in entries]
+
+        # 23 usuários em páginas de 5 (a primeira entrada já foi consumida)
+        self.assertEqual(len(dns), self.users - 1)
+        self.assertEqual(search.call_count, 5)
+
+    def test_iterators_return_the_whole_directory(self):
+        users = list(iter_ad_users(self.directory))
+        groups = list(iter_ad_groups(self.directory))
+        units = {unit['name']: unit for unit in iter_organizational_units(self.directory)}
+
+        self.assertEqual(sorted(user['username'] for user in users), sorted(self.standin.usernames))
+        self.assertEqual(len(groups), 3)
+        self.assertEqual(units['Compras']['path'], 'Compras > Users')
+        self.assertEqual(units['Compras']['level'], 2)
+
+    def test_sync_writes_in_batches(self):
+        progress = []
+        with mock.patch('access_control.sync.SYNC_BATCH_SIZE', 10):
+            sync_country_users(self.directory, full=True, progress=lambda result: progress.append(result['created']))
+
+        # Um progresso por lote de até 10 usuários
+        self.assertEqual(progress, [10, 20, 23])
+        self.assertEqual(ADUser.objects.filter(country_code='BR').count(), self.users)
+
+    def test_batched(self):
+        self.assertEqual(list(batched(range(7), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(batched([], 3)), [])
+
+
+class CountryQuerySetTests(TestCase):
+
+    def setUp(self):
+        self.active = ADUser.objects.create(country_code='BR', username='ativo', distinguished_name='CN=ativo,DC=x')
+        self.inactive = ADUser.objects.create(country_code='BR', username='inativo', is_active=False,
+                                              distinguished_name='CN=inativo,DC=x')
+        self.other = ADUser.objects.create(country_code='AR', username='ativo', distinguished_name='CN=ativo,OU=AR,DC=x')
+
+    def test_country_filters(self):
+        self.assertEqual(set(ADUser.objects.for_country('BR')), {self.active, self.inactive})
+        self.assertEqual(set(ADUser.objects.active()), {self.active, self.other})
+        self.assertEqual(list(ADUser.objects.active_in('BR')), [self.active])
+
+    def test_filters_chain_with_permissions(self):
+        ADGroup.objects.create(country_code='BR', name='Login', can_login=True, distinguished_name='CN=Login,DC=x')
+        ADGroup.objects.create(country_code='BR', name='Velho', can_login=True, is_active=False,
+                               distinguished_name='CN=Velho,DC=x')
+
+        groups = ADGroup.objects.active_in('BR').with_permission('can_login')
+
+        self.assertEqual(list(groups.values_list('name', flat=True)), ['Login'])
+
+    @skipUnless(connection.vendor == 'sqlite', 'plano no formato do SQLite')
+    def test_active_listing_uses_partial_index(self):
+        plan = ADUser.objects.active_in('BR').order_by('display_name', 'id')[:51].explain()
+
+        self.assertIn('aduser_active_name_idx', plan)
+
+    def test_benchmark_query_plans_leaves_no_fixture(self):
+        output = StringIO()
+        call_command('benchmark_query_plans', rows=200, countries=2, repeat=1, stdout=output)
+
+        self.assertIn('Benchmark concluído', output.getvalue())
+        self.assertEqual(ADUser.objects.count(), 3)
+        # Os índices removidos para o "antes" voltaram
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, ADUser._meta.db_table)
+        self.assertIn('aduser_active_name_idx', indexes)
+
+
+class AuthorizationContextTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('admin.br', password='x')
+        self.profile = AdminProfile.objects.create(user=self.user, access_level='country_admin', country_code='BR')
+
+    def load(self):
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(self.expected_queries):
+            return load_authorization_context(user)
+
+    def test_without_shared_cache_reads_database_every_request(self):
+        self.expected_queries = 1
+        self.assertTrue(self.load().is_country_admin)
+
+        self.profile.delete()
+        self.assertFalse(self.load().is_admin)
+
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_shared_cache_is_invalidated_on_save(self):
+        with mock.patch('access_control.authz.AUTHZ_CACHE_ENABLED', True):
+            self.expected_queries = 1
+            self.assertTrue(self.load().admin_profile.is_active)
+            self.expected_queries = 0
+            self.load()
+
+            self.profile.is_active = False
+            self.profile.save()
+
+            self.expected_queries = 1
+            self.assertFalse(self.load().admin_profile.is_active)
+
+
+class SupplierPermissionsViewTests(StandInDirectoryTestCase):
+    users = 60
+
+    def setUp(self):
+        super().setUp()
+        sync_country_users(self.directory, full=True)
+        sync_country_groups(self.directory)
+        self.user = User.objects.create_user('admin.br', password='x')
+        AdminProfile.objects.create(user=self.user, access_level='country_admin', country_code='BR')
+        self.client.force_login(self.user)
+
+    def test_first_page_stays_within_budget(self):
+        response = self.client.get(reverse('access_control:country_supplier_permissions'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['has_ad_config'])
+        self.assertTrue(response.context['ad_users'])
+        self.assertTrue(response.context['ad_groups'])
+        assert_query_budget(response)
+
+    def test_search_stays_within_budget(self):
+        response = self.client.get(reverse('access_control:country_supplier_permissions'), {'q': 'bench0000'})
+
+        self.assertEqual(response.status_code, 200)
+        assert_query_budget(response)
+
+
+class PermissionSetTests(TestCase):
+
+    def test_set_operations(self):
+        perms = PermissionSet.from_names('can_login', 'can_view_contracts')
+
+        self.assertTrue(perms.test('can_login'))
+        self.assertFalse(perms.test('can_login', 'can_manage_contracts'))
+        self.assertTrue(perms.test_any('can_manage_contracts', 'can_view_contracts'))
+        self.assertIn('can_view_contracts', perms)
+        self.assertEqual(perms.mask(['can_login', 'can_manage_contracts']).names(), ['can_login'])
+        self.assertEqual(
+            perms.union(PermissionSet.from_names('can_manage_contracts')).names(),
+            ['can_login', 'can_view_contracts', 'can_manage_contracts'],
+        )
+        self.assertEqual(perms.to_dict()['can_view_contracts'], True)
+        self.assertIsInstance(perms | 1, PermissionSet)
+
+    def test_values_are_limited_to_known_bits(self):
+        self.assertEqual(PermissionSet(ALL_PERMISSIONS + 64), ALL_PERMISSIONS)
+        with self.assertRaises(ValueError):
+            PermissionSet.from_names('can_fly')
+
+
+class PermissionSetFieldTests(TestCase):
+
+    def setUp(self):
+        flags = {
+            'login': {'can_login': True},
+            'contracts': {'can_login': True, 'can_view_contracts': True, 'can_manage_contracts': True},
+            'dashboards': {'can_view_dashboards': True},
+            'none': {},
+        }
+        for name, perms in flags.items():
+            ADGroup.objects.create(country_code='BR', name=name, distinguished_name=f'CN={name},DC=x', **perms)
+
+    def names(self, queryset):
+        return sorted(queryset.values_list('name', flat=True))
+
+    def test_field_round_trip(self):
+        group = ADGroup.objects.get(name='contracts')
+
+        self.assertIsInstance(group.permission_bits, PermissionSet)
+        self.assertEqual(group.permission_bits.names(), ['can_login', 'can_view_contracts', 'can_manage_contracts'])
+
+        group.can_manage_contracts = False
+        group.save(update_fields=['can_manage_contracts'])
+        group.refresh_from_db()
+        self.assertEqual(group.permission_bits.names(), ['can_login', 'can_view_contracts'])
+
+    def test_lookups_run_in_the_database(self):
+        groups = ADGroup.objects.active_in('BR')
+
+        self.assertEqual(self.names(groups.with_permission('can_login')), ['contracts', 'login'])
+        self.assertEqual(self.names(groups.with_permission('can_login', 'can_view_contracts')), ['contracts'])
+        self.assertEqual(
+            self.names(groups.with_any_permission('can_view_dashboards', 'can_manage_contracts')),
+            ['contracts', 'dashboards'],
+        )
+        self.assertEqual(self.names(groups.without_permission('can_login')), ['dashboards', 'none'])
+        self.assertEqual(self.names(groups.filter(permission_bits__has_all=PERMISSION_BITS['can_login'])),
+                         ['contracts', 'login'])
+
+    def test_lookup_sql_uses_bitwise_mask(self):
+        sql = str(ADGroup.objects.with_permission('can_login', 'can_view_contracts').query)
+
+        mask = int(PermissionSet.from_names('can_login', 'can_view_contracts'))
+        self.assertIn(f'"permission_bits" & {mask}) = {mask}', sql)
+
+
+class EffectivePermissionsMixin:
+    """Cenários de access_control.permissions; as subclasses escolhem o caminho do OR."""
+
+    def setUp(self):
+        self.login = ADGroup.objects.create(country_code='BR', name='login', distinguished_name='CN=login,DC=x',
+                                            can_login=True)
+        self.contracts = ADGroup.objects.create(country_code='BR', name='contracts',
+                                                distinguished_name='CN=contracts,DC=x', can_view_contracts=True)
+        self.ana = ADUser.objects.create(country_code='BR', username='ana', distinguished_name='CN=ana,DC=x')
+        self.bia = ADUser.objects.create(country_code='BR', username='bia', distinguished_name='CN=bia,DC=x')
+
+    def effective(self, user):
+        return ADUser.objects.get(pk=user.pk).effective_permissions.names()
+
+    def test_groups_are_combined(self):
+        self.ana.groups.add(self.login, self.contracts)
+
+        self.assertEqual(self.effective(self.ana), ['can_login', 'can_view_contracts'])
+        self.assertEqual(self.effective(self.bia), [])
+
+        self.ana.groups.remove(self.contracts)
+        self.assertEqual(self.effective(self.ana), ['can_login'])
+
+    def test_group_side_add_remove_and_clear(self):
+        self.login.users.add(self.ana, self.bia)
+        self.assertEqual((self.effective(self.ana), self.effective(self.bia)), (['can_login'], ['can_login']))
+
+        self.login.users.remove(self.bia)
+        self.assertEqual(self.effective(self.bia), [])
+
+        self.login.users.clear()
+        self.assertEqual(self.effective(self.ana), [])
+
+    def test_group_permission_change_reaches_members(self):
+        self.contracts.users.add(self.ana)
+
+        self.contracts.can_manage_contracts = True
+        self.contracts.save(update_fields=['can_manage_contracts'])
+
+        self.assertEqual(self.effective(self.ana), ['can_view_contracts', 'can_manage_contracts'])
+
+    def test_group_delete_removes_its_permissions(self):
+        self.ana.groups.add(self.login, self.contracts)
+
+        self.login.delete()
+
+        self.assertEqual(self.effective(self.ana), ['can_view_contracts'])
+
+    def test_individual_permissions_replace_groups(self):
+        self.ana.groups.add(self.login)
+
+        self.ana.has_individual_permissions = True
+        self.ana.can_view_dashboards = True
+        self.ana.save()
+        self.assertEqual(self.effective(self.ana), ['can_view_dashboards'])
+
+        self.ana.has_individual_permissions = False
+        self.ana.save(update_fields=['has_individual_permissions'])
+        self.assertEqual(self.effective(self.ana), ['can_login'])
+
+    def test_recompute_repairs_stale_rows(self):
+        self.ana.groups.add(self.login)
+        ADUser.objects.filter(pk=self.ana.pk).update(effective_permissions=0)
+
+        self.assertEqual(recompute_effective_permissions(country_code='BR'), 1)
+        self.assertEqual(self.effective(self.ana), ['can_login'])
+
+
+class EffectivePermissionsTests(EffectivePermissionsMixin, TestCase):
+    """Caminho sem BIT_OR no banco (OR feito no Python)."""
+
+    def setUp(self):
+        patcher = mock.patch('access_control.permissions.connection', SimpleNamespace(vendor='sqlite'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'BIT_OR só no PostgreSQL')
+class PostgresEffectivePermissionsTests(EffectivePermissionsMixin, TestCase):
+    """Caminho do PostgreSQL (BitOr no banco)."""
+
+
+class CountryStatsTests(TestCase):
+
+    def setUp(self):
+        admin = User.objects.create_user('admin.br', password='x')
+        AdminProfile.objects.create(user=admin, access_level='country_admin', country_code='BR')
+        self.client.force_login(admin)
+
+        self.group = ADGroup.objects.create(country_code='BR', name='vendas', distinguished_name='CN=vendas,DC=x')
+        self.users = [
+            ADUser.objects.create(country_code='BR', username=name, distinguished_name=f'CN={name},DC=x')
+            for name in ('ana', 'bia', 'caio')
+        ]
+        self.group.users.add(*self.users[:2])
+        get_country_stats('BR')
+
+    def assertMatchesRefresh(self):
+        fields = [field for names in COUNTRY_STATS_SOURCES.values() for field in names]
+        adjusted = CountryStats.objects.filter(pk='BR').values(*fields).get()
+        refresh_country_stats('BR')
+        self.assertEqual(adjusted, CountryStats.objects.filter(pk='BR').values(*fields).get())
+        return adjusted
+
+    def toggle(self, name, pk):
+        response = self.client.post(reverse(f'access_control:country_toggle_{name}_permission', args=[pk]))
+        self.assertRedirects(response, reverse('access_control:country_supplier_permissions'),
+                             fetch_redirect_response=False)
+
+    def test_toggles_keep_rollup_in_sync(self):
+        self.toggle('group', self.group.pk)
+        stats = self.assertMatchesRefresh()
+        self.assertEqual((stats['groups_with_supplier_perm'], stats['users_with_supplier_perm']), (1, 2))
+
+        # Membro do grupo: ligar o login individual não muda a contagem
+        self.toggle('user', self.users[0].pk)
+        self.toggle('user', self.users[2].pk)
+        stats = self.assertMatchesRefresh()
+        self.assertEqual(stats['users_with_supplier_perm'], 3)
+
+        self.toggle('group', self.group.pk)
+        stats = self.assertMatchesRefresh()
+        self.assertEqual((stats['groups_with_supplier_perm'], stats['users_with_supplier_perm']), (0, 2))
+
+    def test_adjust_never_goes_below_zero(self):
+        adjust_country_stats('BR', groups_with_supplier_perm=-5)
+
+        self.assertEqual(CountryStats.objects.get(pk='BR').groups_with_supplier_perm, 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class GlobalStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        for country_code in ('BR', 'AR'):
+            admin = User.objects.create_user(f'admin.{country_code.lower()}', password='x', country_code=country_code)
+            AdminProfile.objects.create(user=admin, access_level='country_admin', country_code=country_code)
+        LdapDirectory.objects.create(country_code='BR', name='BR', ldap_server='br.invalid',
+                                     base_dn='DC=x', is_active=True)
+        ADUser.objects.create(country_code='BR', username='ana', distinguished_name='CN=ana,DC=x')
+        ADUser.objects.create(country_code='BR', username='bia', distinguished_name='CN=bia,DC=x', is_active=False)
+
+    def test_snapshot_is_one_query_and_cached(self):
+        cache.clear()
+        with self.assertNumQueries(1):
+            stats = get_global_stats()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_global_stats(), stats)
+
+        self.assertEqual(stats['total_countries'], 2)
+        self.assertEqual(stats['total_admins'], 2)
+        self.assertEqual(stats['total_ads'], 1)
+        self.assertEqual(stats['total_ad_users'], 1)
+        self.assertEqual(stats['countries_without_ad'], ['AR'])
+        self.assertEqual(stats['per_country']['BR'], {'admins': 1, 'directories': 1, 'users': 1, 'ad_users': 1})
+
+    def test_snapshot_is_invalidated_by_signals(self):
+        get_global_stats()
+
+        LdapDirectory.objects.create(country_code='AR', name='AR', ldap_server='ar.invalid',
+                                     base_dn='DC=x', is_active=True)
+
+        self.assertEqual(get_global_stats()['countries_without_ad'], [])
+
+
+class DirectorySearchTests(TestCase):
+
+    def setUp(self):
+        people = [
+            ('jsilva', 'João Silva', 'Compras'),
+            ('msouza', 'Maria Souza', 'Financeiro'),
+            ('pjoao', 'Pedro Joanes', 'TI'),
+        ]
+        for username, display_name, department in people:
+            ADUser.objects.create(country_code='BR', username=username, display_name=display_name,
+                                  department=department, distinguished_name=f'CN={username},DC=x')
+        ADUser.objects.create(country_code='AR', username='jsilva', display_name='João Silva',
+                              distinguished_name='CN=jsilva,OU=AR,DC=x')
+        ADGroup.objects.create(country_code='BR', name='Compras Nacionais', description='Grupo de compras',
+                               distinguished_name='CN=Compras,DC=x')
+
+    def usernames(self, term, ranked=False):
+        return list(search_ad_users(ADUser.objects.active_in('BR'), term, ranked=ranked)
+                    .values_list('username', flat=True))
+
+    def test_search_document_is_normalized(self):
+        user = ADUser.objects.get(country_code='BR', username='jsilva')
+
+        self.assertIn('joao silva', user.search_document)
+        self.assertEqual(normalize_search_text('  JOÃO   Silva '), 'joao silva')
+
+    def test_migration_builder_matches_current_builder(self):
+        migration = import_module('access_control.migrations.0009_search_document')
+        user = ADUser.objects.get(country_code='BR', username='jsilva')
+
+        self.assertEqual(migration.build_search_document(user, AD_USER_SEARCH_FIELDS), user.search_document)
+
+    def test_empty_term_keeps_queryset(self):
+        self.assertEqual(len(self.usernames('  ')), 3)
+
+    @skipIf(connection.vendor == 'postgresql', 'fallback por prefixo')
+    def test_prefix_fallback(self):
+        self.assertEqual(self.usernames('Maria'), ['msouza'])
+        self.assertEqual(self.usernames('compr'), ['jsilva'])
+        # Só prefixo: o meio do nome não é encontrado
+        self.assertEqual(self.usernames('Souza'), [])
+        self.assertEqual(
+            list(search_ad_groups(ADGroup.objects.active_in('BR'), 'grupo').values_list('name', flat=True)),
+            ['Compras Nacionais'],
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'pg_trgm só no PostgreSQL')
+    def test_trigram_search_tolerates_accents_and_typos(self):
+        self.assertEqual(self.usernames('souza'), ['msouza'])
+        self.assertEqual(sorted(self.usernames('joao')), ['jsilva', 'pjoao'])
+        self.assertIn('jsilva', self.usernames('joao slva'))
+        self.assertEqual(self.usernames('joão silva', ranked=True)[0], 'jsilva')
@@ -21,6 +21,7 @@ urlpatterns = [
     path('admin-login/', views.admin_login, name='admin_login'),
     path('global/create/', views.global_admin_create, name='global_admin_create'),
     path('global/system-config/', views.system_default_config, name='system_default_config'),
+    path('global/ad-sync-all/', views.global_ad_sync_all, name='global_ad_sync_all'),
 
     # ==========================================================
     # ADMIN DE PAÍS
@@ -30,10 +31,13 @@ urlpatterns = [
     path('country/smtp-config/', views.country_smtp_config, name='country_smtp_config'),
     path('country/test-ldap/', views.test_ldap_connection, name='test_ldap_connection'),
     path('country/ad-sync/', views.country_ad_sync, name='country_ad_sync'),
+    path('country/ad-sync/status/', views.country_ad_sync_status, name='country_ad_sync_status'),
     path('country/supplier-permissions/', views.country_supplier_permissions, name='country_supplier_permissions'),
     path('country/groups/', views.country_groups_list, name='country_groups_list'),
     path('country/users/', views.country_users_list, name='country_users_list'),
     path('country/suppliers/sync-groups/', views.country_ad_sync_groups, name='country_ad_sync_groups'),
+    path('country/suppliers/users/', views.country_supplier_users_page, name='country_supplier_users_page'),
+    path('country/suppliers/groups/', views.country_supplier_groups_page, name='country_supplier_groups_page'),
     path('country/suppliers/group/<int:group_id>/toggle/', views.country_toggle_group_permission, name='country_toggle_group_permission'),
     path('country/suppliers/user/<int:user_id>/toggle/', views.country_toggle_user_permission, name='country_toggle_user_permission'),
     path('country/suppliers/user/<int:user_id>/edit/', views.country_edit_user_permissions, name='country_edit_user_permissions'),
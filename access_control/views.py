@@ -27,8 +27,10 @@ from ldap3 import Server, Connection, ALL
 from accounts.models import User
 from adminpanel.models import LdapDirectory, SmtpConfiguration
 from adminpanel.forms import LdapDirectoryForm, SmtpConfigurationForm
+from core.querycount import query_budget
 from .models import AdminProfile, CountryPermission
 from .forms import CreateCountryAdminForm
+from .authz import get_authz
 
 
 # =====================================================
@@ -41,13 +43,14 @@ def global_admin_required(view_func):
         if not request.user.is_authenticated:
             messages.error(request, _('Você precisa estar autenticado.'))
             return redirect('accounts:collaborator_login')
-        try:
-            if not request.user.admin_profile.is_global_admin():
-                messages.error(request, _('Acesso negado. Apenas Admin Global.'))
-                return redirect('accounts:collaborator_dashboard')
-        except AdminProfile.DoesNotExist:
+        # Perfil + permissões carregados uma vez por request (e cacheados)
+        authz = get_authz(request)
+        if not authz.is_admin:
             messages.error(request, _('Acesso negado. Você não é um administrador.'))
             return redirect('accounts:collaborator_dashboard')
+        if not authz.is_global_admin:
+            messages.error(request, _('Acesso negado. Apenas Admin Global.'))
+            return redirect('accounts:collaborator_dashboard')
         return view_func(request, *args, **kwargs)
     return wrapper
 
@@ -58,14 +61,13 @@ def country_admin_required(view_func):
         if not request.user.is_authenticated:
             messages.error(request, _('Você precisa estar autenticado.'))
             return redirect('accounts:collaborator_login')
-        try:
-            prof = request.user.admin_profile
-            if not (prof.is_country_admin() or prof.is_global_admin()):
-                messages.error(request, _('Acesso negado. Apenas administradores.'))
-                return redirect('accounts:collaborator_dashboard')
-        except AdminProfile.DoesNotExist:
+        authz = get_authz(request)
+        if not authz.is_admin:
             messages.error(request, _('Acesso negado. Você não é um administrador.'))
             return redirect('accounts:collaborator_dashboard')
+        if not (authz.is_country_admin or authz.is_global_admin):
+            messages.error(request, _('Acesso negado. Apenas administradores.'))
+            return redirect('accounts:collaborator_dashboard')
         return view_func(request, *args, **kwargs)
     return wrapper
 
@@ -122,17 +124,13 @@ class CombinedFormProxy:
 
 @login_required
 def admin_panel_home(request):
-    try:
-        ap = request.user.admin_profile
-        if ap.is_global_admin():
-            return redirect('access_control:global_dashboard')
-        if ap.is_country_admin():
-            return redirect('access_control:country_dashboard')
-        messages.error(request, _('Acesso negado. Você não é um administrador.'))
-        return redirect('accounts:collaborator_dashboard')
-    except AdminProfile.DoesNotExist:
-        messages.error(request, _('Acesso negado. Você não é um administrador.'))
-        return redirect('accounts:collaborator_dashboard')
+    authz = get_authz(request)
+    if authz.is_global_admin:
+        return redirect('access_control:global_dashboard')
+    if authz.is_country_admin:
+        return redirect('access_control:country_dashboard')
+    messages.error(request, _('Acesso negado. Você não é um administrador.'))
+    return redirect('accounts:collaborator_dashboard')
 
 
 # =====================================================
@@ -142,36 +140,52 @@ def admin_panel_home(request):
 @login_required
 @global_admin_required
 def global_dashboard(request):
-    total_countries = (
-        AdminProfile.objects
-        .filter(access_level='country_admin', is_active=True)
-        .values('country_code').distinct().count()
-    )
-    total_admins = AdminProfile.objects.filter(access_level='country_admin', is_active=True).count()
-    total_ads = LdapDirectory.objects.filter(is_active=True).count()
-    total_users = User.objects.filter(is_active=True, is_supplier=False).count()
+    from .stats import get_global_stats
+
+    # Snapshot em cache (1 query agregada quando expira ou é invalidado)
+    stats = get_global_stats()
 
     recent_admins = (AdminProfile.objects
                      .filter(access_level='country_admin')
                      .select_related('user')
                      .order_by('-created_at')[:5])
 
-    configured_ads = set(LdapDirectory.objects.filter(is_active=True)
-                         .values_list('country_code', flat=True))
-    all_country_admins = set(AdminProfile.objects.filter(access_level='country_admin', is_active=True)
-                             .values_list('country_code', flat=True))
-    countries_without_ad = [c for c in all_country_admins if c not in configured_ads]
-
     return render(request, 'access_control/global/dashboard.html', {
-        'total_countries': total_countries,
-        'total_admins': total_admins,
-        'total_ads': total_ads,
-        'total_users': total_users,
+        'total_countries': stats['total_countries'],
+        'total_admins': stats['total_admins'],
+        'total_ads': stats['total_ads'],
+        'total_users': stats['total_users'],
         'recent_admins': recent_admins,
-        'countries_without_ad': countries_without_ad,
+        'countries_without_ad': stats['countries_without_ad'],
     })
 
 
+@login_required
+@global_admin_required
+def global_ad_sync_all(request):
+    """
+    Enfileira a sincronização do AD de todos os países com diretório ativo.
+    Incremental por padrão; use ?full=1 para ressincronização completa.
+    Os jobs rodam em paralelo no worker (run_sync_worker --concurrency N).
+    """
+    from .orchestrator import enqueue_all_directories
+
+    full = request.GET.get('full') == '1'
+    queued = enqueue_all_directories(job_type='all', full=full, requested_by=request.user)
+
+    if not queued:
+        messages.error(request, '❌ Nenhum país com Active Directory ativo.')
+        return redirect('access_control:global_dashboard')
+
+    created = sum(1 for _, was_created in queued if was_created)
+    mode = 'completa' if full else 'incremental'
+    messages.success(request, f'🔄 Sincronização {mode} agendada para {created} país(es).')
+    if created < len(queued):
+        messages.info(request, f'⏳ {len(queued) - created} país(es) já tinham sincronização em andamento.')
+
+    return redirect('access_control:global_dashboard')
+
+
 # =====================================================
 # Listas / gerenciamento GLOBAL (stubs seguros)
 # =====================================================
@@ -186,6 +200,7 @@ def global_countries_list(request):
     return render(request, 'access_control/global/countries_list.html', {'countries': countries})
 
 
+@query_budget(max_queries=8, max_duplicates=0)
 @login_required
 @global_admin_required
 def global_admins_list(request):
@@ -256,8 +271,11 @@ def global_admin_edit(request, admin_id):
 @login_required
 @global_admin_required
 def global_admin_permissions(request, admin_id):
-    ap = get_object_or_404(AdminProfile, pk=admin_id)
-    perm, _ = CountryPermission.objects.get_or_create(admin_profile=ap)
+    ap = get_object_or_404(AdminProfile.objects.select_related('country_permissions'), pk=admin_id)
+    try:
+        perm = ap.country_permissions
+    except CountryPermission.DoesNotExist:
+        perm = CountryPermission.objects.create(admin_profile=ap)
     if request.method == 'POST':
         bool_fields = [
             'can_configure_ad', 'can_configure_smtp', 'can_sync_ad_groups',
@@ -321,19 +339,15 @@ def global_smtp_config(request):
 @country_admin_required
 def country_admin_dashboard(request):
     """Dashboard do Admin de País com estatísticas e ações rápidas"""
-    from django.contrib.auth.models import Group
+    from .stats import get_country_stats
     
     admin_profile = request.user.admin_profile
     country_code = admin_profile.country_code
     
-    # Verificar permissões
-    try:
-        perm = CountryPermission.objects.get(admin_profile=admin_profile)
-        can_configure_ad = perm.can_configure_ad
-        can_configure_smtp = perm.can_configure_smtp
-    except CountryPermission.DoesNotExist:
-        can_configure_ad = False
-        can_configure_smtp = False
+    # Verificar permissões (já carregadas pelo decorator)
+    authz = get_authz(request)
+    can_configure_ad = authz.has_country_permission('can_configure_ad')
+    can_configure_smtp = authz.has_country_permission('can_configure_smtp')
     
     # Verificar se tem AD configurado
     has_ad = LdapDirectory.objects.filter(
@@ -347,21 +361,8 @@ def country_admin_dashboard(request):
         is_active=True
     ).exists()
     
-    # Contar usuários e grupos
-    total_users = User.objects.filter(
-        country_code=country_code,
-        is_active=True
-    ).count()
-    
-    total_groups = Group.objects.filter(
-        name__startswith=f'{country_code}_'
-    ).count()
-    
-    # Stats
-    groups_with_supplier_perm = 0
-    users_with_supplier_perm = 0
-    ad_users_count = 0
-    ad_groups_count = 0
+    # Contadores consolidados (rollup CountryStats, 1 leitura por chave)
+    stats = get_country_stats(country_code)
     
     context = {
         'admin_profile': admin_profile,
@@ -370,12 +371,12 @@ def country_admin_dashboard(request):
         'can_configure_smtp': can_configure_smtp,
         'has_ad': has_ad,
         'has_smtp': has_smtp,
-        'total_users': total_users,
-        'total_groups': total_groups,
-        'groups_with_supplier_perm': groups_with_supplier_perm,
-        'users_with_supplier_perm': users_with_supplier_perm,
-        'ad_users_count': ad_users_count,
-        'ad_groups_count': ad_groups_count,
+        'total_users': stats.local_users_count,
+        'total_groups': stats.local_groups_count,
+        'groups_with_supplier_perm': stats.groups_with_supplier_perm,
+        'users_with_supplier_perm': stats.users_with_supplier_perm,
+        'ad_users_count': stats.ad_users_count,
+        'ad_groups_count': stats.ad_groups_count,
     }
     
     return render(request, 'access_control/country/dashboard.html', context)
@@ -383,40 +384,55 @@ def country_admin_dashboard(request):
 @login_required
 @country_admin_required
 def country_ad_sync(request):
-    """Sincroniza usuários e grupos do Active Directory"""
+    """Enfileira a sincronização de usuários e grupos do Active Directory (POST)."""
     admin_profile = request.user.admin_profile
     country_code = admin_profile.country_code
     
-    # Verificar permissão
-    try:
-        perm = CountryPermission.objects.get(admin_profile=admin_profile)
-        if not perm.can_sync_ad_groups:
-            messages.error(request, _('Você não tem permissão para sincronizar o AD.'))
-            return redirect('access_control:country_dashboard')
-    except CountryPermission.DoesNotExist:
+    # Verificar permissão (já carregada pelo decorator)
+    perm = get_authz(request).country_permissions
+    if perm is None:
         messages.error(request, _('Permissões não configuradas.'))
         return redirect('access_control:country_dashboard')
+    if not perm.can_sync_ad_groups:
+        messages.error(request, _('Você não tem permissão para sincronizar o AD.'))
+        return redirect('access_control:country_dashboard')
     
-    # Buscar configuração do AD
-    try:
-        ad_config = LdapDirectory.objects.get(
-            country_code=country_code,
-            is_active=True
-        )
-    except LdapDirectory.DoesNotExist:
+    # Verificar configuração do AD
+    if not LdapDirectory.objects.filter(country_code=country_code, is_active=True).exists():
         messages.error(request, _('Active Directory não configurado.'))
         return redirect('access_control:country_dashboard')
     
     if request.method == 'POST':
-        try:
+        from .jobs import enqueue_sync
+        
+        job, created = enqueue_sync(
+            country_code,
+            job_type='all',
+            full=request.POST.get('full') == '1',
+            requested_by=request.user
+        )
+        if created:
             messages.success(request, _('Sincronização iniciada! Aguarde alguns minutos.'))
-            return redirect('access_control:country_dashboard')
-        except Exception as e:
-            messages.error(request, f'Erro ao sincronizar: {str(e)}')
+        else:
+            messages.info(request, _('Já existe uma sincronização em andamento para este país.'))
     
-    return render(request, 'access_control/country/ad_sync.html', {
-        'ad_config': ad_config
-    })
+    return redirect('access_control:country_dashboard')
+
+
+@login_required
+@country_admin_required
+def country_ad_sync_status(request):
+    """
+    Status dos jobs de sincronização do país (JSON, consultado pelo dashboard).
+    Use ?job=<id> para um job específico; sem parâmetro retorna o mais recente.
+    """
+    from .models import ADSyncJob
+    
+    jobs = ADSyncJob.objects.filter(country_code=request.user.admin_profile.country_code)
+    job_id = request.GET.get('job')
+    job = jobs.filter(pk=job_id).first() if job_id else jobs.first()
+    
+    return JsonResponse({'job': job.to_dict() if job else None})
 
 @login_required
 @country_admin_required
@@ -435,30 +451,76 @@ def country_groups_list(request):
         'groups': groups
     })
 
+# Ordenação (chave do cursor) das listagens da tela de permissões
+SUPPLIER_USERS_ORDERING = ('display_name', 'id')
+SUPPLIER_GROUPS_ORDERING = ('name', 'id')
+
+
+def _supplier_users_queryset(country_code):
+    from .models import ADUser
+    return ADUser.objects.active_in(country_code).only(
+        'id', 'display_name', 'username', 'email', 'department',
+        'can_login', 'has_individual_permissions', 'effective_permissions'
+    )
+
+
+def _supplier_groups_queryset(country_code):
+    from .models import ADGroup
+    return ADGroup.objects.active_in(country_code).only(
+        'id', 'name', 'description', 'member_count', 'can_login', 'permission_bits'
+    )
+
+
+def _apply_supplier_filters(request, queryset, search):
+    """
+    Aplica os filtros da tela de permissões vindos da query string:
+    ?q= (busca textual, ver access_control.search), ?has=perm1,perm2 e
+    ?lacks=perm (permissões).
+
+    Raises:
+        ValueError: Permissão desconhecida
+    """
+    queryset = search(queryset, request.GET.get('q', ''))
+    has = [p for p in request.GET.get('has', '').split(',') if p]
+    lacks = [p for p in request.GET.get('lacks', '').split(',') if p]
+    if has:
+        queryset = queryset.with_permission(*has)
+    if lacks:
+        queryset = queryset.without_permission(*lacks)
+    return queryset
+
+
+# Primeira página de cada lista + contadores do rollup: não cresce com o AD
+@query_budget(max_queries=10, max_duplicates=0)
 @login_required
 @country_admin_required
 def country_supplier_permissions(request):
     """
     Gerencia quais grupos/usuários do AD podem fazer login no sistema.
     Mostra grupos e usuários sincronizados do Active Directory.
+    
+    Renderiza apenas a primeira página de cada lista; as seguintes (e as
+    buscas) vêm dos endpoints JSON com paginação por cursor.
     """
-    from .models import ADGroup, ADUser
-    from django.db.models import Q
+    from .pagination import DEFAULT_PAGE_SIZE, keyset_page
+    from .search import search_ad_groups, search_ad_users
+    from .stats import get_country_stats
 
     ap = request.user.admin_profile
     country_code = ap.country_code
 
-    # Buscar grupos do AD do país (apenas ativos)
-    ad_groups = ADGroup.objects.filter(
-        country_code=country_code,
-        is_active=True
-    ).order_by('name')
-
-    # Buscar usuários do AD do país (apenas ativos)
-    ad_users = ADUser.objects.filter(
-        country_code=country_code,
-        is_active=True
-    ).order_by('display_name')
+    try:
+        groups_page = keyset_page(
+            _apply_supplier_filters(request, _supplier_groups_queryset(country_code), search_ad_groups),
+            SUPPLIER_GROUPS_ORDERING, page_size=DEFAULT_PAGE_SIZE
+        )
+        users_page = keyset_page(
+            _apply_supplier_filters(request, _supplier_users_queryset(country_code), search_ad_users),
+            SUPPLIER_USERS_ORDERING, page_size=DEFAULT_PAGE_SIZE
+        )
+    except ValueError as e:
+        messages.error(request, f'❌ {str(e)}')
+        return redirect('access_control:country_supplier_permissions')
 
     # Verificar se tem configuração de AD
     has_ad_config = LdapDirectory.objects.filter(
@@ -466,37 +528,87 @@ def country_supplier_permissions(request):
         is_active=True
     ).exists()
 
-    # Quantos grupos têm permissão para fazer login
-    groups_with_permission = ad_groups.filter(can_login=True).count()
-
-    # Quantos usuários têm permissão para fazer login:
-    # (usuarios com permissão individual OU que pertencem a grupos com permissão)
-    users_with_permission_qs = ADUser.objects.filter(
-        country_code=country_code,
-        is_active=True
-    ).filter(
-        Q(can_login=True) |
-        Q(groups__can_login=True)
-    ).distinct()
-
-    users_with_permission = users_with_permission_qs.count()
+    # Contadores do rollup CountryStats (sem COUNT/JOIN nas tabelas do AD)
+    stats = get_country_stats(country_code)
 
     context = {
-        'ad_groups': ad_groups,
-        'ad_users': ad_users,
+        'ad_groups': groups_page['items'],
+        'ad_users': users_page['items'],
+        'groups_next_cursor': groups_page['next_cursor'],
+        'users_next_cursor': users_page['next_cursor'],
+        'search_term': request.GET.get('q', ''),
         'country_code': country_code,
         'country_name': ap.get_country_code_display(),
         'has_ad_config': has_ad_config,
-        'total_groups': ad_groups.count(),
-        'total_users': ad_users.count(),
-        'groups_with_permission': groups_with_permission,
-        'users_with_permission': users_with_permission,
-        'users_with_permission_qs': users_with_permission_qs,
+        'total_groups': stats.ad_groups_count,
+        'total_users': stats.ad_users_count,
+        'groups_with_permission': stats.groups_with_supplier_perm,
+        'users_with_permission': stats.users_with_supplier_perm,
     }
 
     return render(request, 'access_control/country/supplier_permissions.html', context)
 
 
+def _supplier_rows_response(request, queryset, search, ordering, template, context_name):
+    """Página (JSON) de uma das listas da tela de permissões."""
+    from django.template.loader import render_to_string
+    from .pagination import InvalidCursor, keyset_page, parse_page_size
+
+    try:
+        page = keyset_page(
+            _apply_supplier_filters(request, queryset, search),
+            ordering,
+            cursor=request.GET.get('cursor'),
+            page_size=parse_page_size(request.GET.get('size'))
+        )
+    except (InvalidCursor, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    html = render_to_string(template, {context_name: page['items']}, request=request)
+    return JsonResponse({
+        'html': html,
+        'count': len(page['items']),
+        'next_cursor': page['next_cursor'],
+        'has_more': page['has_more'],
+    })
+
+
+@login_required
+@country_admin_required
+def country_supplier_users_page(request):
+    """
+    Linhas da tabela de usuários (JSON com fragmento HTML).
+    Parâmetros: ?q=, ?has=, ?lacks=, ?cursor=, ?size=
+    """
+    from .search import search_ad_users
+    return _supplier_rows_response(
+        request,
+        _supplier_users_queryset(request.user.admin_profile.country_code),
+        search_ad_users,
+        SUPPLIER_USERS_ORDERING,
+        'access_control/country/partials/supplier_user_rows.html',
+        'ad_users'
+    )
+
+
+@login_required
+@country_admin_required
+def country_supplier_groups_page(request):
+    """
+    Linhas da tabela de grupos (JSON com fragmento HTML).
+    Parâmetros: ?q=, ?has=, ?lacks=, ?cursor=, ?size=
+    """
+    from .search import search_ad_groups
+    return _supplier_rows_response(
+        request,
+        _supplier_groups_queryset(request.user.admin_profile.country_code),
+        search_ad_groups,
+        SUPPLIER_GROUPS_ORDERING,
+        'access_control/country/partials/supplier_group_rows.html',
+        'ad_groups'
+    )
+
+
 # =====================================================
 # Configuração AD + SMTP (tela unificada)
 # =====================================================
@@ -690,7 +802,9 @@ def country_ad_groups_sync(request):
 @country_admin_required
 def country_permissions(request):
     ap = request.user.admin_profile
-    perm, _ = CountryPermission.objects.get_or_create(admin_profile=ap)
+    perm = get_authz(request).country_permissions
+    if perm is None:
+        perm, _ = CountryPermission.objects.get_or_create(admin_profile=ap)
     if request.method == 'POST':
         for field in [
             'can_configure_ad', 'can_configure_smtp', 'can_sync_ad_groups',
@@ -730,7 +844,7 @@ def system_default_config(request):
     from .models import SystemDefaultConfig, CountryPermission
     from .forms import SystemDefaultConfigForm
     
-    if not hasattr(request.user, 'admin_profile') or not request.user.admin_profile.is_global_admin():
+    if not get_authz(request).is_global_admin:
         messages.error(request, 'Acesso negado. Apenas Admin Global pode acessar.')
         return redirect('access_control:home')
     
@@ -815,53 +929,22 @@ def admin_login(request):
 @country_admin_required
 def country_ad_sync_groups(request):
     """
-    Sincroniza grupos do Active Directory com o banco de dados.
-    Busca todos os grupos do AD e salva/atualiza no modelo ADGroup.
+    Enfileira a sincronização de grupos do Active Directory.
+    A execução acontece no worker (python manage.py run_sync_worker).
     """
-    from .models import ADGroup
-    import sys
-    sys.path.append('/home/claude')
-    from ldap_advanced_utils import list_ad_groups
+    from .jobs import enqueue_sync
     
     ap = request.user.admin_profile
     
-    try:
-        ldap_config = LdapDirectory.objects.get(
-            country_code=ap.country_code,
-            is_active=True
-        )
-        
-        ad_groups = list_ad_groups(ldap_config)
-        
-        created_count = 0
-        updated_count = 0
-        
-        for group_data in ad_groups:
-            group, created = ADGroup.objects.update_or_create(
-                country_code=ap.country_code,
-                distinguished_name=group_data['dn'],
-                defaults={
-                    'name': group_data['name'],
-                    'description': group_data.get('description', ''),
-                    'member_count': group_data.get('member_count', 0),
-                    'is_active': True
-                }
-            )
-            
-            if created:
-                created_count += 1
-            else:
-                updated_count += 1
-        
-        messages.success(
-            request, 
-            f'✅ Sincronização concluída! {created_count} grupos criados, {updated_count} grupos atualizados.'
-        )
-    
-    except LdapDirectory.DoesNotExist:
+    if not LdapDirectory.objects.filter(country_code=ap.country_code, is_active=True).exists():
         messages.error(request, '❌ Active Directory não configurado para este país.')
-    except Exception as e:
-        messages.error(request, f'❌ Erro ao sincronizar grupos: {str(e)}')
+        return redirect('access_control:country_supplier_permissions')
+    
+    job, created = enqueue_sync(ap.country_code, job_type='groups', requested_by=request.user)
+    if created:
+        messages.success(request, f'🔄 Sincronização de grupos agendada (job #{job.pk}). Atualize a página em instantes.')
+    else:
+        messages.info(request, f'⏳ Sincronização de grupos já em andamento (job #{job.pk}).')
 
     return redirect('access_control:country_supplier_permissions')
 
@@ -879,11 +962,13 @@ def country_edit_user_permissions(request, user_id):
     """
     from .models import ADUser
     from .forms import ADUserPermissionsForm
+    from .stats import ad_user_has_supplier_perm, adjust_country_stats
     
     ap = request.user.admin_profile
     user = get_object_or_404(ADUser, id=user_id, country_code=ap.country_code)
     
     if request.method == 'POST':
+        had_perm = ad_user_has_supplier_perm(user)
         form = ADUserPermissionsForm(request.POST, instance=user)
         if form.is_valid():
             user = form.save(commit=False)
@@ -891,6 +976,13 @@ def country_edit_user_permissions(request, user_id):
             user.has_individual_permissions = True
             user.save()
             
+            # Permissão efetiva recalculada pelo signal: atualiza o rollup do país
+            user.refresh_from_db(fields=['effective_permissions'])
+            adjust_country_stats(
+                ap.country_code,
+                users_with_supplier_perm=ad_user_has_supplier_perm(user) - had_perm
+            )
+            
             messages.success(request, f'✅ Permissões de "{user.display_name}" atualizadas com sucesso!')
             return redirect('access_control:country_supplier_permissions')
     else:
@@ -917,56 +1009,25 @@ def country_edit_user_permissions(request, user_id):
 @country_admin_required
 def country_ad_sync_users(request):
     """
-    Sincroniza usuários do Active Directory com o banco de dados.
+    Enfileira a sincronização de usuários do Active Directory.
+    Incremental por padrão; use ?full=1 para forçar uma ressincronização completa.
+    A execução acontece no worker (python manage.py run_sync_worker).
     """
-    from .models import ADUser
-    import sys
-    sys.path.append('/home/claude')
-    from ldap_advanced_utils import list_ad_users
+    from .jobs import enqueue_sync
     
     ap = request.user.admin_profile
+    full = request.GET.get('full') == '1'
     
-    try:
-        ldap_config = LdapDirectory.objects.get(
-            country_code=ap.country_code,
-            is_active=True
-        )
-        
-        ad_users = list_ad_users(ldap_config)
-        
-        created_count = 0
-        updated_count = 0
-        
-        for user_data in ad_users:
-            user, created = ADUser.objects.update_or_create(
-                country_code=ap.country_code,
-                distinguished_name=user_data['dn'],
-                defaults={
-                    'username': user_data.get('username', ''),
-                    'email': user_data.get('email', ''),
-                    'first_name': user_data.get('first_name', ''),
-                    'last_name': user_data.get('last_name', ''),
-                    'display_name': user_data.get('display_name', ''),
-                    'department': user_data.get('department', ''),
-                    'title': user_data.get('title', ''),
-                    'is_active': True
-                }
-            )
-            
-            if created:
-                created_count += 1
-            else:
-                updated_count += 1
-        
-        messages.success(
-            request, 
-            f'✅ Sincronização de usuários concluída! {created_count} usuários criados, {updated_count} usuários atualizados.'
-        )
-    
-    except LdapDirectory.DoesNotExist:
+    if not LdapDirectory.objects.filter(country_code=ap.country_code, is_active=True).exists():
         messages.error(request, '❌ Active Directory não configurado para este país.')
-    except Exception as e:
-        messages.error(request, f'❌ Erro ao sincronizar usuários: {str(e)}')
+        return redirect('access_control:country_supplier_permissions')
+    
+    job, created = enqueue_sync(ap.country_code, job_type='users', full=full, requested_by=request.user)
+    if created:
+        mode = 'completa' if full else 'incremental'
+        messages.success(request, f'🔄 Sincronização {mode} de usuários agendada (job #{job.pk}). Atualize a página em instantes.')
+    else:
+        messages.info(request, f'⏳ Sincronização de usuários já em andamento (job #{job.pk}).')
 
     return redirect('access_control:country_supplier_permissions')
 
@@ -982,6 +1043,7 @@ def country_toggle_group_permission(request, group_id):
     Ativa/desativa permissão de LOGIN de um grupo inteiro.
     """
     from .models import ADGroup
+    from .stats import adjust_country_stats, refresh_country_stats
     
     try:
         group = ADGroup.objects.get(
@@ -993,6 +1055,11 @@ def country_toggle_group_permission(request, group_id):
         group.can_login = not group.can_login
         group.save()
         
+        # Rollup: delta do grupo; os membros mudam juntos, então recontamos os usuários
+        if group.is_active:
+            adjust_country_stats(group.country_code, groups_with_supplier_perm=1 if group.can_login else -1)
+        refresh_country_stats(group.country_code, sources=['ad_users'])
+        
         status = "permitido" if group.can_login else "bloqueado"
         messages.success(request, f'✅ Login {status} para o grupo "{group.name}"')
     
@@ -1012,17 +1079,25 @@ def country_toggle_user_permission(request, user_id):
     Para permissões detalhadas, clicar no nome do usuário.
     """
     from .models import ADUser
+    from .stats import ad_user_has_supplier_perm, adjust_country_stats
     
     try:
         user = ADUser.objects.get(
             id=user_id, 
             country_code=request.user.admin_profile.country_code
         )
+        had_perm = ad_user_has_supplier_perm(user)
         
         # Toggle da permissão
         user.can_login = not user.can_login
         user.save()
         
+        user.refresh_from_db(fields=['effective_permissions'])
+        adjust_country_stats(
+            user.country_code,
+            users_with_supplier_perm=ad_user_has_supplier_perm(user) - had_perm
+        )
+        
         status = "permitido" if user.can_login else "bloqueado"
         messages.success(request, f'✅ Login {status} para "{user.display_name}"')
     
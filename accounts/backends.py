@@ -4,15 +4,25 @@ Permite autenticação usando Active Directory de diferentes países.
 """
 
 import logging
-from ldap3 import Server, Connection, ALL, NTLM
+import time
 from ldap3.core.exceptions import LDAPException
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
-from adminpanel.models import LdapDirectory
+from adminpanel.models import COUNTRY_CHOICES, LdapDirectory
+from adminpanel.ldap_pool import get_pool
+from core.metrics import LOGIN_ATTEMPTS, LOGIN_SECONDS
+from .throttle import get_login_block, record_login_failure, record_login_success
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Retorno de _authenticate_ldap quando o AD recusou as credenciais
+# (diferente de None, que indica erro de comunicação com o AD)
+REJECTED = object()
+
+# Países aceitos como rótulo das métricas de login
+LOGIN_COUNTRY_CODES = {code for code, _ in COUNTRY_CHOICES}
+
 
 class MultiCountryLDAPBackend(ModelBackend):
     """
@@ -33,11 +43,42 @@ class MultiCountryLDAPBackend(ModelBackend):
         Returns:
             User: Objeto do usuário autenticado ou None
         """
-        # Validação básica
-        if not username or not password or not country_code:
+        # Logins de fornecedores/admin (sem país) não são logins LDAP: sem métricas
+        if not country_code:
             logger.warning("❌ Autenticação LDAP: parâmetros faltando")
             return None
         
+        started = time.perf_counter()
+        user, outcome = self._authenticate(username, password, country_code)
+        
+        # País fora da lista vem de formulário adulterado: não vira série nova
+        country = country_code if country_code in LOGIN_COUNTRY_CODES else 'other'
+        LOGIN_ATTEMPTS.inc(country=country, outcome=outcome)
+        LOGIN_SECONDS.observe(time.perf_counter() - started, country=country)
+        return user
+    
+    def _authenticate(self, username, password, country_code):
+        """
+        Fluxo do login LDAP.
+        
+        Returns:
+            tuple: (User ou None, resultado: 'success', 'rejected', 'throttled',
+                'invalid', 'no_directory' ou 'error')
+        """
+        # Validação básica
+        if not username or not password:
+            logger.warning("❌ Autenticação LDAP: parâmetros faltando")
+            return None, 'invalid'
+        
+        # Tentativa fadada a falhar (bloqueio ou senha já recusada): não consulta o AD
+        block = get_login_block(country_code, username, password)
+        if block:
+            logger.warning(
+                f"⛔ Login LDAP recusado localmente ({block['reason']}, "
+                f"{block['retry_after']}s): {username} ({country_code})"
+            )
+            return None, 'throttled'
+        
         try:
             # Buscar configuração do AD do país
             ldap_config = LdapDirectory.objects.get(
@@ -46,7 +87,7 @@ class MultiCountryLDAPBackend(ModelBackend):
             )
         except LdapDirectory.DoesNotExist:
             logger.error(f"❌ Configuração LDAP não encontrada para país: {country_code}")
-            return None
+            return None, 'no_directory'
         
         # Tentar autenticar no AD
         try:
@@ -56,9 +97,16 @@ class MultiCountryLDAPBackend(ModelBackend):
                 password=password
             )
             
+            if user_info is REJECTED:
+                logger.warning(f"❌ Autenticação LDAP falhou para: {username}")
+                record_login_failure(country_code, username, password)
+                return None, 'rejected'
+            
             if not user_info:
                 logger.warning(f"❌ Autenticação LDAP falhou para: {username}")
-                return None
+                return None, 'error'
+            
+            record_login_success(country_code, username)
             
             # Criar ou atualizar usuário no Django
             user = self._get_or_create_user(
@@ -68,11 +116,11 @@ class MultiCountryLDAPBackend(ModelBackend):
             )
             
             logger.info(f"✅ Autenticação LDAP bem-sucedida: {username} ({country_code})")
-            return user
+            return user, 'success'
         
         except Exception as e:
             logger.error(f"❌ Erro na autenticação LDAP: {str(e)}")
-            return None
+            return None, 'error'
     
     def _authenticate_ldap(self, ldap_config, username, password):
         """
@@ -84,52 +132,45 @@ class MultiCountryLDAPBackend(ModelBackend):
             password (str): Senha
         
         Returns:
-            dict: Informações do usuário ou None se falhar
+            dict: Informações do usuário, REJECTED se o AD recusou as
+                credenciais ou None em caso de erro
         """
         try:
-            # Configurar servidor LDAP
-            server = Server(
-                ldap_config.get_connection_string(),
-                get_info=ALL
-            )
+            # Pool do país (Server com schema em cache + conexões quentes)
+            pool = get_pool(ldap_config)
             
             # Montar DN do usuário para bind
             # Formato: usuario@dominio ou DOMINIO\usuario
             user_dn = f"{username}@{ldap_config.base_dn.replace('DC=', '').replace(',', '.')}"
             
-            # Tentar conectar com credenciais do usuário
-            conn = Connection(
-                server,
-                user=user_dn,
-                password=password,
-                auto_bind=True
-            )
-            
-            if not conn.bind():
+            # Validar credenciais do usuário num socket reaproveitado
+            if not pool.check_credentials(user_dn, password):
                 logger.warning(f"❌ Bind LDAP falhou para: {username}")
-                return None
+                return REJECTED
             
-            # Buscar informações do usuário
+            # Buscar informações do usuário com a conta de serviço
             search_filter = ldap_config.search_filter.format(username=username)
             search_base = ldap_config.get_user_search_base()
             
-            conn.search(
-                search_base=search_base,
-                search_filter=search_filter,
-                attributes=[
-                    ldap_config.attr_first_name,
-                    ldap_config.attr_last_name,
-                    ldap_config.attr_email,
-                    'sAMAccountName'
-                ]
-            )
-            
-            if not conn.entries:
+            with pool.service_connection() as conn:
+                conn.search(
+                    search_base=search_base,
+                    search_filter=search_filter,
+                    attributes=[
+                        ldap_config.attr_first_name,
+                        ldap_config.attr_last_name,
+                        ldap_config.attr_email,
+                        'sAMAccountName'
+                    ]
+                )
+                entries = conn.entries
+            
+            if not entries:
                 logger.warning(f"❌ Usuário não encontrado no AD: {username}")
                 return None
             
             # Extrair informações do primeiro resultado
-            entry = conn.entries[0]
+            entry = entries[0]
             user_info = {
                 'username': str(entry['sAMAccountName']),
                 'first_name': str(entry[ldap_config.attr_first_name]) if entry[ldap_config.attr_first_name] else '',
@@ -137,8 +178,6 @@ class MultiCountryLDAPBackend(ModelBackend):
                 'email': str(entry[ldap_config.attr_email]) if entry[ldap_config.attr_email] else '',
             }
             
-            conn.unbind()
-            
             logger.info(f"✅ Informações obtidas do AD: {user_info['username']}")
             return user_info
         
@@ -161,37 +200,40 @@ class MultiCountryLDAPBackend(ModelBackend):
         Returns:
             User: Objeto do usuário
         """
+        # Valores que o login LDAP mantém sincronizados com o AD
+        ad_values = {
+            'first_name': user_info.get('first_name', ''),
+            'last_name': user_info.get('last_name', ''),
+            # Mesma normalização do create_user (domínio em minúsculas)
+            'email': User.objects.normalize_email(user_info.get('email', '')),
+            'country_code': country_code,
+            'is_staff': True,  # Colaborador tem acesso ao admin
+        }
+        
         try:
             # Buscar usuário existente
             user = User.objects.get(username=username)
-            
-            # Atualizar informações do AD
-            user.first_name = user_info.get('first_name', '')
-            user.last_name = user_info.get('last_name', '')
-            user.email = user_info.get('email', '')
-            user.country_code = country_code
-            user.is_staff = True  # Colaborador tem acesso ao admin
-            user.save()
-            
-            logger.info(f"✅ Usuário atualizado: {username}")
         
         except User.DoesNotExist:
-            # Criar novo usuário
+            # Criar novo usuário num único INSERT. Sem senha, create_user grava
+            # uma senha inutilizável: usuário LDAP autentica sempre no AD.
             user = User.objects.create_user(
                 username=username,
-                email=user_info.get('email', ''),
-                first_name=user_info.get('first_name', ''),
-                last_name=user_info.get('last_name', ''),
-                country_code=country_code,
-                is_staff=True,  # Colaborador tem acesso ao admin
-                is_supplier=False
+                password=None,
+                is_supplier=False,
+                **ad_values
             )
             
-            # Usuário LDAP não tem senha no Django (autentica sempre no AD)
-            user.set_unusable_password()
-            user.save()
-            
             logger.info(f"✅ Novo usuário criado: {username}")
+            return user
+        
+        # Atualizar apenas o que mudou no AD (a maioria dos logins não grava nada)
+        changed = [field for field, value in ad_values.items() if getattr(user, field) != value]
+        if changed:
+            for field in changed:
+                setattr(user, field, ad_values[field])
+            user.save(update_fields=[*changed, 'updated_at'])
+            logger.info(f"✅ Usuário atualizado: {username} ({', '.join(changed)})")
         
         return user
     
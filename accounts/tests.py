@@ -1,3 +1,155 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from access_control.models import AdminProfile
+from accounts.backends import MultiCountryLDAPBackend
+from accounts.models import User
+from accounts.throttle import (
+    LDAP_AUTH_FAILURE_WINDOW,
+    LDAP_AUTH_LOCKOUT_SECONDS,
+    LDAP_AUTH_MAX_FAILURES,
+    get_login_block,
+    record_login_failure,
+    record_login_success,
+)
+from adminpanel.ldap_standin import STANDIN_PASSWORD
+from adminpanel.tests import StandInDirectoryTestCase
+from core.querycount import assert_query_budget
+
+
+class LoginThrottleTests(TestCase):
+
+    def setUp(self):
+        # Com LocMem/Redis o cache não volta com a transação do teste
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # Relógio do throttle fixo no meio de um intervalo da janela
+        self.now = LDAP_AUTH_FAILURE_WINDOW * 1000 + LDAP_AUTH_FAILURE_WINDOW / 2
+        patcher = mock.patch('accounts.throttle.time')
+        patcher.start().time.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+
+    def record_failures(self, times, username='jsilva'):
+        return [record_login_failure('BR', username, f'senha-{n}') for n in range(times)]
+
+    def test_rejected_password_is_refused_locally(self):
+        record_login_failure('BR', 'jsilva', 'errada')
+
+        self.assertEqual(get_login_block('BR', 'jsilva', 'errada')['reason'], 'rejected')
+        self.assertIsNone(get_login_block('BR', 'jsilva', 'outra'))
+        self.assertIsNone(get_login_block('AR', 'jsilva', 'errada'))
+
+    def test_lockout_after_max_failures_doubles(self):
+        lockouts = self.record_failures(LDAP_AUTH_MAX_FAILURES + 1)
+
+        self.assertEqual(lockouts[:-2], [0] * (LDAP_AUTH_MAX_FAILURES - 1))
+        self.assertEqual(lockouts[-2:], [LDAP_AUTH_LOCKOUT_SECONDS, LDAP_AUTH_LOCKOUT_SECONDS * 2])
+        self.assertEqual(get_login_block('BR', 'JSilva ', 'qualquer')['reason'], 'locked')
+        self.assertIsNone(get_login_block('BR', 'outro', 'qualquer'))
+
+    def test_success_clears_failures_and_lock(self):
+        self.record_failures(LDAP_AUTH_MAX_FAILURES)
+        record_login_success('BR', 'jsilva')
+
+        self.assertIsNone(get_login_block('BR', 'jsilva', 'qualquer'))
+        self.assertEqual(record_login_failure('BR', 'jsilva', 'nova'), 0)
+
+    def test_burst_across_interval_boundary_is_locked(self):
+        # Metade das falhas no fim de um intervalo e o resto logo depois da
+        # virada: numa janela fixa, nenhuma das metades chegaria ao limite
+        self.now = LDAP_AUTH_FAILURE_WINDOW * 1001 - 1
+        self.assertEqual(set(self.record_failures(LDAP_AUTH_MAX_FAILURES - 1)), {0})
+
+        self.now += 2
+        self.assertEqual(record_login_failure('BR', 'jsilva', 'outra'), LDAP_AUTH_LOCKOUT_SECONDS)
+
+    def test_failures_leave_the_window(self):
+        self.record_failures(LDAP_AUTH_MAX_FAILURES - 1)
+
+        self.now += LDAP_AUTH_FAILURE_WINDOW * 2
+        self.assertEqual(record_login_failure('BR', 'jsilva', 'outra'), 0)
+
+
+class CollaboratorLoginViewTests(StandInDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # O formulário só oferece países com um Admin de País ativo
+        admin = User.objects.create_user('admin.br', password='x')
+        AdminProfile.objects.create(user=admin, access_level='country_admin', country_code='BR')
+
+    def login(self, password=STANDIN_PASSWORD):
+        return self.client.post(reverse('accounts:collaborator_login'), {
+            'country_code': 'BR',
+            'username': self.standin.usernames[1],
+            'password': password,
+        })
+
+    def test_ldap_login_stays_within_budget(self):
+        response = self.login()
+
+        self.assertRedirects(response, reverse('accounts:collaborator_dashboard'), fetch_redirect_response=False)
+        assert_query_budget(response)
+
+    def test_second_login_stays_within_budget(self):
+        self.login()
+        self.client.logout()
+
+        response = self.login()
+
+        self.assertRedirects(response, reverse('accounts:collaborator_dashboard'), fetch_redirect_response=False)
+        assert_query_budget(response)
+
+    def test_wrong_password_stays_within_budget(self):
+        response = self.login(password='errada')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('_auth_user_id', self.client.session)
+        assert_query_budget(response)
+
+
+class LdapUserSyncTests(TestCase):
+
+    def setUp(self):
+        self.backend = MultiCountryLDAPBackend()
+        self.user_info = {
+            'username': 'jsilva',
+            'first_name': 'João',
+            'last_name': 'Silva',
+            'email': 'jsilva@Example.COM',
+        }
+        self.user = self.backend._get_or_create_user('jsilva', self.user_info, 'BR')
+
+    def sync(self, **changes):
+        with CaptureQueriesContext(connection) as queries:
+            user = self.backend._get_or_create_user('jsilva', {**self.user_info, **changes}, 'BR')
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        return user, updates
+
+    def test_new_user_is_created_from_ad(self):
+        self.assertEqual(self.user.email, 'jsilva@example.com')
+        self.assertTrue(self.user.is_staff)
+        self.assertFalse(self.user.has_usable_password())
+
+    def test_unchanged_ad_values_do_not_write(self):
+        user, updates = self.sync()
+
+        self.assertEqual(updates, [])
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_only_changed_fields_are_written(self):
+        with mock.patch.object(User, 'save', autospec=True, side_effect=User.save) as save:
+            user, updates = self.sync(last_name='Souza')
 
-# Create your tests here.
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(set(save.call_args.kwargs['update_fields']), {'last_name', 'updated_at'})
+        self.assertNotIn('"first_name"', updates[0])
+        user.refresh_from_db()
+        self.assertEqual(user.last_name, 'Souza')
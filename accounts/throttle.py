@@ -0,0 +1,154 @@
+"""
+Contenção de logins LDAP com falha, por (país, usuário).
+
+O estado fica no cache compartilhado do Django (CACHES), em chaves
+independentes e sem leitura+gravação de um estado inteiro:
+- contadores de falhas em janela deslizante de LDAP_AUTH_FAILURE_WINDOW:
+  um contador por intervalo (cache.add + cache.incr, atômico no Redis), e
+  as falhas na janela são as do intervalo atual mais as do anterior
+  ponderadas pela parte dele que ainda está na janela. Uma rajada na
+  virada do intervalo não ganha o dobro do limite;
+- credenciais recusadas recentemente (uma chave por HMAC, nunca a senha),
+  para que a mesma senha errada repetida seja recusada sem consultar o AD;
+- bloqueio em vigor: ao atingir LDAP_AUTH_MAX_FAILURES falhas na janela,
+  novas tentativas são recusadas localmente por um tempo que dobra a cada
+  falha adicional, até LDAP_AUTH_MAX_LOCKOUT_SECONDS.
+
+Tentativas recusadas localmente não contam como falha (não estendem o
+bloqueio). Erros de infraestrutura (DC fora do ar) também não contam.
+
+Na tabela de cache do banco (sem REDIS_URL) o incr é leitura+gravação:
+falhas simultâneas do mesmo usuário podem contar uma vez só, o que apenas
+atrasa o bloqueio.
+
+Usage:
+    block = get_login_block('BR', 'jsilva', password)
+    if block: ...  # {'reason': 'locked'|'rejected', 'retry_after': int}
+    record_login_failure('BR', 'jsilva', password)
+    record_login_success('BR', 'jsilva')
+"""
+
+import hashlib
+import hmac
+import logging
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Janela (segundos) em que as falhas são contadas
+LDAP_AUTH_FAILURE_WINDOW = getattr(settings, 'LDAP_AUTH_FAILURE_WINDOW', 300)
+
+# Falhas na janela a partir das quais o usuário é bloqueado
+LDAP_AUTH_MAX_FAILURES = getattr(settings, 'LDAP_AUTH_MAX_FAILURES', 5)
+
+# Primeiro bloqueio (segundos); dobra a cada falha seguinte
+LDAP_AUTH_LOCKOUT_SECONDS = getattr(settings, 'LDAP_AUTH_LOCKOUT_SECONDS', 30)
+LDAP_AUTH_MAX_LOCKOUT_SECONDS = getattr(settings, 'LDAP_AUTH_MAX_LOCKOUT_SECONDS', 900)
+
+# Tempo (segundos) em que uma senha recusada pelo AD é recusada localmente
+LDAP_AUTH_NEGATIVE_CACHE_SECONDS = getattr(settings, 'LDAP_AUTH_NEGATIVE_CACHE_SECONDS', 60)
+
+
+def _cache_key(country_code, username):
+    # Usernames podem ter espaços/acentos: a chave usa um hash
+    digest = hashlib.sha256(username.strip().casefold().encode('utf-8')).hexdigest()[:32]
+    return f'ldap_auth:{country_code}:{digest}'
+
+
+def _credential_digest(country_code, username, password):
+    message = f'{country_code}\0{username.strip().casefold()}\0{password}'.encode('utf-8')
+    return hmac.new(settings.SECRET_KEY.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+def _failure_keys(country_code, username, now):
+    """Chaves dos contadores de falhas do intervalo atual e do anterior."""
+    key = _cache_key(country_code, username)
+    bucket = int(now // LDAP_AUTH_FAILURE_WINDOW)
+    return f'{key}:failures:{bucket}', f'{key}:failures:{bucket - 1}'
+
+
+def _locked_key(country_code, username):
+    return f'{_cache_key(country_code, username)}:locked'
+
+
+def _rejected_key(country_code, username, password):
+    return f'ldap_auth:rejected:{_credential_digest(country_code, username, password)}'
+
+
+def get_login_block(country_code, username, password):
+    """
+    Verifica se a tentativa deve ser recusada sem consultar o AD.
+
+    Returns:
+        dict: {'reason': 'locked'|'rejected', 'retry_after': int} ou None
+    """
+    now = time.time()
+    locked_key = _locked_key(country_code, username)
+    rejected_key = _rejected_key(country_code, username, password)
+    values = cache.get_many([locked_key, rejected_key])
+
+    locked_until = values.get(locked_key, 0)
+    if locked_until > now:
+        return {'reason': 'locked', 'retry_after': math.ceil(locked_until - now)}
+
+    until = values.get(rejected_key, 0)
+    if until > now:
+        return {'reason': 'rejected', 'retry_after': math.ceil(until - now)}
+    return None
+
+
+def record_login_failure(country_code, username, password):
+    """
+    Registra uma senha recusada pelo AD e aplica o bloqueio, se for o caso.
+
+    Returns:
+        int: Segundos de bloqueio aplicados (0 = sem bloqueio)
+    """
+    now = time.time()
+    failures_key, previous_key = _failure_keys(country_code, username, now)
+
+    cache.set(
+        _rejected_key(country_code, username, password),
+        now + LDAP_AUTH_NEGATIVE_CACHE_SECONDS,
+        LDAP_AUTH_NEGATIVE_CACHE_SECONDS
+    )
+
+    # add só cria o contador do intervalo na primeira falha; nas seguintes o
+    # incr não perde falhas simultâneas vindas de outros workers. O contador
+    # vive dois intervalos: no seguinte, ele é o "anterior" da janela
+    if cache.add(failures_key, 1, 2 * LDAP_AUTH_FAILURE_WINDOW):
+        current = 1
+    else:
+        try:
+            current = cache.incr(failures_key)
+        except ValueError:
+            # O contador expirou entre o add e o incr
+            cache.add(failures_key, 1, 2 * LDAP_AUTH_FAILURE_WINDOW)
+            current = 1
+
+    # Parte do intervalo anterior que ainda está dentro da janela
+    weight = 1 - (now % LDAP_AUTH_FAILURE_WINDOW) / LDAP_AUTH_FAILURE_WINDOW
+    failures = current + math.ceil(cache.get(previous_key, 0) * weight)
+
+    lockout = 0
+    excess = failures - LDAP_AUTH_MAX_FAILURES
+    if excess >= 0:
+        lockout = min(LDAP_AUTH_LOCKOUT_SECONDS * 2 ** excess, LDAP_AUTH_MAX_LOCKOUT_SECONDS)
+        cache.set(_locked_key(country_code, username), now + lockout, lockout)
+        logger.warning(
+            f"🔒 Login LDAP bloqueado por {lockout}s: {username} ({country_code}), "
+            f"{failures} falhas em {LDAP_AUTH_FAILURE_WINDOW}s"
+        )
+    return lockout
+
+
+def record_login_success(country_code, username):
+    """Zera as falhas e o bloqueio do usuário."""
+    cache.delete_many([
+        *_failure_keys(country_code, username, time.time()),
+        _locked_key(country_code, username),
+    ])
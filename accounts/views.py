@@ -6,6 +6,7 @@ from django.utils import translation
 from django.utils.translation import gettext_lazy as _
 from .forms import PartnerLoginForm, CollaboratorLoginForm, UserLanguagePreferenceForm
 from .models import User
+from core.querycount import query_budget
 
 def partner_login(request):
     """Login de parceiros externos (usuários com is_supplier=True)."""
@@ -65,6 +66,11 @@ def supplier_dashboard(request):
     return render(request, "accounts/supplier_dashboard.html", context)
 
 
+# Primeiro login LDAP (pior caso, medido em accounts.tests): 4 da view, 4 do
+# backend (throttle no cache + diretório + usuário), 3 da criação do usuário
+# e 8 do login() do Django (sessão e last_login, com savepoints). O usuário é
+# lido pela view e de novo pelo backend LDAP (1 repetição).
+@query_budget(max_queries=20, max_duplicates=1)
 def collaborator_login(request):
     from access_control.models import AdminProfile, COUNTRY_CHOICES
     import logging
@@ -47,6 +47,8 @@ class LdapDirectoryAdmin(admin.ModelAdmin):
             'fields': (
                 'ldap_server',
                 'port',
+                'backup_servers',
+                'server_pool_strategy',
                 'base_dn',
                 'use_ssl',
                 'use_tls'
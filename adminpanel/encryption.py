@@ -1,55 +1,161 @@
 """
 Módulo de criptografia AES para dados sensíveis.
-Mantém compatibilidade com o sistema existente (modo ECB).
+
+Formatos aceitos na leitura:
+- Legado (sem prefixo): AES-256 ECB com CRYPTO_MASTER_KEY.
+- Versionado: "enc:v<N>:<base64(nonce + tag + ciphertext)>", AES-256-GCM
+  com a chave N de CRYPTO_KEYS.
+
+Novas gravações usam a versão CRYPTO_KEY_VERSION (se configurada) ou o
+formato legado. Para regravar os valores existentes com outra chave, use
+`python manage.py rotate_crypto_key`.
+
+Inclui um cache em memória (por processo) das senhas descriptografadas de
+LdapDirectory/SmtpConfiguration, para que sincronização, testes de conexão
+e autenticação não descriptografem a mesma senha a cada conexão.
 """
 
 import base64
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
 from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
 from Crypto.Util.Padding import pad, unpad
 from django.conf import settings
 
 BLOCK_SIZE = 16
 
+# Prefixo do formato versionado: enc:v<versão>:
+VERSIONED_PREFIX_RE = re.compile(r'^enc:v(\d+):')
+GCM_NONCE_SIZE = 12
+GCM_TAG_SIZE = 16
+
+# Tempo (segundos) que uma senha descriptografada fica em memória
+SECRET_CACHE_TIMEOUT = getattr(settings, 'SECRET_CACHE_TIMEOUT', 300)
+
+# Máximo de senhas em memória (as menos usadas são descartadas)
+SECRET_CACHE_MAX_ENTRIES = getattr(settings, 'SECRET_CACHE_MAX_ENTRIES', 256)
+
+
+def load_versioned_keys():
+    """
+    Lê as chaves versionadas do settings.
+
+    CRYPTO_KEYS aceita um dict {versão: chave} ou o texto
+    "versão:chave,versão:chave" (variável de ambiente). Cada chave é
+    derivada para 32 bytes com SHA-256.
+
+    Returns:
+        dict: {int: bytes}
+    """
+    raw = getattr(settings, 'CRYPTO_KEYS', None) or {}
+    if isinstance(raw, str):
+        raw = dict(item.split(':', 1) for item in raw.split(',') if item.strip())
+    return {
+        int(version): hashlib.sha256(str(key).strip().encode('utf-8')).digest()
+        for version, key in raw.items()
+    }
+
+
+def key_version(enc):
+    """Versão da chave de um valor criptografado (0 = formato legado)."""
+    match = VERSIONED_PREFIX_RE.match(enc or '')
+    return int(match.group(1)) if match else 0
+
 
 class AESCipher:
     """
     Classe para criptografia/descriptografia AES-256.
-    Usa modo ECB para compatibilidade com sistema legado.
+    Lê o formato legado (ECB) e o versionado (GCM); grava no versionado
+    quando CRYPTO_KEY_VERSION está configurado.
     """
     
     def __init__(self):
         """Inicializa o cipher com a chave do settings."""
         key = settings.CRYPTO_MASTER_KEY.encode('utf-8')
         self.key = key[:32].ljust(32, b'\0')
+        # ECB não guarda estado entre blocos: o mesmo objeto serve para
+        # todas as operações (o lock protege o uso entre threads)
+        self._cipher = AES.new(self.key, AES.MODE_ECB)
+        self._lock = threading.Lock()
+        self.keys = load_versioned_keys()
+        self.current_version = int(getattr(settings, 'CRYPTO_KEY_VERSION', None) or 0)
+        if self.current_version and self.current_version not in self.keys:
+            raise ValueError(f'CRYPTO_KEY_VERSION={self.current_version} não está em CRYPTO_KEYS')
     
     def encrypt(self, raw):
         """
-        Criptografa um texto usando AES-256 em modo ECB.
+        Criptografa um texto com a versão de chave atual (ou ECB legado).
         
         Args:
             raw (str): Texto em claro
         
         Returns:
-            str: Texto criptografado em base64
+            str: Texto criptografado
         """
         if not raw:
             return ""
         
         try:
+            if self.current_version:
+                return self.encrypt_versioned(raw, self.current_version)
             raw_bytes = pad(raw.encode('utf-8'), BLOCK_SIZE)
-            cipher = AES.new(self.key, AES.MODE_ECB)
-            encrypted = cipher.encrypt(raw_bytes)
+            with self._lock:
+                encrypted = self._cipher.encrypt(raw_bytes)
             return base64.b64encode(encrypted).decode('utf-8')
         except Exception as e:
             print(f"❌ Erro ao criptografar: {e}")
             return ""
     
+    def encrypt_versioned(self, raw, version):
+        """
+        Criptografa com AES-256-GCM usando a chave `version` de CRYPTO_KEYS.
+        
+        Returns:
+            str: "enc:v<versão>:<base64>"
+        
+        Raises:
+            KeyError: Versão de chave não configurada
+        """
+        # GCM exige nonce novo a cada operação: um cipher por chamada
+        cipher = AES.new(self.keys[version], AES.MODE_GCM, nonce=get_random_bytes(GCM_NONCE_SIZE))
+        encrypted, tag = cipher.encrypt_and_digest(raw.encode('utf-8'))
+        payload = base64.b64encode(cipher.nonce + tag + encrypted).decode('ascii')
+        return f'enc:v{version}:{payload}'
+    
+    def decrypt_value(self, enc):
+        """
+        Descriptografa sem os fallbacks de decrypt().
+        
+        Raises:
+            ValueError: Valor corrompido, chave errada ou versão desconhecida
+        """
+        match = VERSIONED_PREFIX_RE.match(enc)
+        if match:
+            version = int(match.group(1))
+            if version not in self.keys:
+                raise ValueError(f'Chave de criptografia v{version} não configurada')
+            data = base64.b64decode(enc[match.end():], validate=True)
+            nonce = data[:GCM_NONCE_SIZE]
+            tag = data[GCM_NONCE_SIZE:GCM_NONCE_SIZE + GCM_TAG_SIZE]
+            cipher = AES.new(self.keys[version], AES.MODE_GCM, nonce=nonce)
+            return cipher.decrypt_and_verify(data[GCM_NONCE_SIZE + GCM_TAG_SIZE:], tag).decode('utf-8')
+        
+        enc_bytes = base64.b64decode(enc)
+        with self._lock:
+            decrypted = unpad(self._cipher.decrypt(enc_bytes), BLOCK_SIZE)
+        return decrypted.decode('utf-8')
+    
     def decrypt(self, enc):
         """
-        Descriptografa um texto criptografado.
+        Descriptografa um texto criptografado (legado ou versionado).
         
         Args:
-            enc (str): Texto criptografado em base64
+            enc (str): Texto criptografado
         
         Returns:
             str: Texto descriptografado ou string vazia se houver erro
@@ -58,13 +164,12 @@ class AESCipher:
             return ""
         
         try:
-            enc_bytes = base64.b64decode(enc)
-            cipher = AES.new(self.key, AES.MODE_ECB)
-            decrypted = unpad(cipher.decrypt(enc_bytes), BLOCK_SIZE)
-            return decrypted.decode('utf-8')
+            return self.decrypt_value(enc)
         except Exception as e:
             # Retorna string vazia ao invés de None
             print(f"⚠️ Erro ao descriptografar: {e}")
+            if key_version(enc):
+                return ""
             # Se o texto não está criptografado, retorna ele mesmo
             return enc if len(enc) < 100 else ""
 
@@ -85,6 +190,102 @@ def decrypt_text(encrypted_text):
     return result if result else ""
 
 
+class SecretCache:
+    """
+    Cache em memória de segredos descriptografados, com TTL e limite de
+    entradas (LRU).
+
+    Cada valor fica num bytearray, zerado ao expirar, ser substituído ou
+    descartado. A str devolvida ao chamador é uma cópia imutável e não pode
+    ser zerada; o cache apenas evita manter cópias por mais tempo que o TTL.
+    """
+
+    def __init__(self, timeout=SECRET_CACHE_TIMEOUT, max_entries=SECRET_CACHE_MAX_ENTRIES):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _wipe(entry):
+        buffer = entry[2]
+        buffer[:] = bytes(len(buffer))
+
+    def get(self, key, ciphertext, loader):
+        """
+        Retorna o segredo em cache ou o obtém com `loader(ciphertext)`.
+
+        Args:
+            key (tuple): Identificação do segredo (ex.: modelo, pk, updated_at)
+            ciphertext (str): Valor criptografado atual; se mudou desde que a
+                entrada foi gravada (ex.: set_password sem save), ela é ignorada
+            loader (callable): Função que descriptografa o ciphertext
+
+        Returns:
+            str: Segredo em texto claro ('' não é guardado)
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, cached_ciphertext, buffer = entry
+                if expires_at > now and cached_ciphertext == ciphertext:
+                    self._entries.move_to_end(key)
+                    return buffer.decode('utf-8')
+                self._wipe(self._entries.pop(key))
+
+        secret = loader(ciphertext)
+        if not secret:
+            return secret
+
+        with self._lock:
+            # Remove também as versões antigas (updated_at anterior) já expiradas
+            for stale in [k for k, e in self._entries.items() if k == key or e[0] <= now]:
+                self._wipe(self._entries.pop(stale))
+            self._entries[key] = (now + self.timeout, ciphertext, bytearray(secret.encode('utf-8')))
+            while len(self._entries) > self.max_entries:
+                self._wipe(self._entries.popitem(last=False)[1])
+        return secret
+
+    def evict(self, match=None):
+        """
+        Zera e remove entradas.
+
+        Args:
+            match (callable): Filtro sobre a chave; None = todas
+        """
+        with self._lock:
+            for key in [k for k in self._entries if match is None or match(k)]:
+                self._wipe(self._entries.pop(key))
+
+
+secret_cache = SecretCache()
+
+
+def get_cached_secret(instance, field_name, loader):
+    """
+    Segredo descriptografado de `instance.<field_name>`, em cache por
+    (modelo, pk, updated_at, campo).
+
+    Instâncias ainda não salvas (sem pk/updated_at) não usam o cache.
+
+    Usage:
+        get_cached_secret(ldap_directory, 'bind_password_encrypted', aes.decrypt)
+    """
+    ciphertext = getattr(instance, field_name) or ''
+    updated_at = getattr(instance, 'updated_at', None)
+    if instance.pk is None or updated_at is None:
+        return loader(ciphertext)
+    key = (instance._meta.label_lower, instance.pk, updated_at.isoformat(), field_name)
+    return secret_cache.get(key, ciphertext, loader)
+
+
+def evict_cached_secrets(instance):
+    """Descarta os segredos em cache de uma instância (ex.: após excluí-la)."""
+    label = instance._meta.label_lower
+    secret_cache.evict(lambda key: key[0] == label and key[1] == instance.pk)
+
+
 def test_encryption():
     """
     Testa se a criptografia está funcionando.
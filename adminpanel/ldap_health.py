@@ -0,0 +1,383 @@
+"""
+Saúde e roteamento entre os controladores de domínio (DCs) de um diretório.
+
+Para cada servidor (URL "ldap://host:porta") o processo mantém:
+- latência média (EWMA) das aberturas de conexão e sondas;
+- falhas consecutivas e um período de quarentena com backoff exponencial,
+  durante o qual o servidor só é tentado se todos os outros falharem;
+- marcação de "lento" quando a latência passa de LDAP_SERVER_SLOW_MS e há
+  alternativa mais rápida.
+
+As conexões são abertas por open_with_failover(), que percorre os servidores
+na ordem de ordered_servers() (estratégias FIRST e ROUND_ROBIN, os mesmos
+nomes do ServerPool do ldap3) e registra sucesso/latência ou falha de cada
+tentativa. Uma thread em segundo plano sonda periodicamente os servidores
+conhecidos (inclusive os em quarentena, para detectar a volta).
+
+O estado é por processo: cada worker aprende a saúde dos DCs sozinho.
+
+Todo Server/Connection do LDAP é criado por make_server()/make_connection(),
+o que permite trocar um DC por um substituto em memória (override_servers,
+usado pelo diretório simulado de adminpanel.ldap_standin nos benchmarks).
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from ldap3 import FIRST, NONE, ROUND_ROBIN, Connection, Server
+from ldap3.core.exceptions import (
+    LDAPCommunicationError,
+    LDAPException,
+    LDAPResponseTimeoutError,
+    LDAPStartTLSError,
+)
+
+from core.metrics import LDAP_OPERATION_ERRORS, LDAP_OPERATION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Erros que indicam problema no servidor (e não nas credenciais/consulta)
+SERVER_ERRORS = (LDAPCommunicationError, LDAPResponseTimeoutError, LDAPStartTLSError, OSError)
+
+# Quarentena após falha (segundos): dobra a cada falha consecutiva
+LDAP_SERVER_RETRY_SECONDS = getattr(settings, 'LDAP_SERVER_RETRY_SECONDS', 10)
+LDAP_SERVER_MAX_RETRY_SECONDS = getattr(settings, 'LDAP_SERVER_MAX_RETRY_SECONDS', 300)
+
+# Latência (ms) a partir da qual um servidor é considerado lento
+LDAP_SERVER_SLOW_MS = getattr(settings, 'LDAP_SERVER_SLOW_MS', 500)
+
+# Intervalo (segundos) das sondas em segundo plano; 0 desativa
+LDAP_HEALTH_PROBE_INTERVAL = getattr(settings, 'LDAP_HEALTH_PROBE_INTERVAL', 30)
+
+# Timeout (segundos) de cada sonda
+LDAP_HEALTH_PROBE_TIMEOUT = getattr(settings, 'LDAP_HEALTH_PROBE_TIMEOUT', 2)
+
+# Peso da amostra mais recente na média de latência
+LATENCY_SMOOTHING = 0.3
+
+STRATEGY_CHOICES = [
+    (FIRST, 'Primeiro disponível'),
+    (ROUND_ROBIN, 'Round-robin'),
+]
+
+
+# ============================================
+# Criação de Server/Connection (com substitutos)
+# ============================================
+
+# URL -> (Server, fábrica de Connection) dos servidores substituídos
+_server_overrides = {}
+
+
+def make_server(url, **kwargs):
+    """Server do ldap3 para a URL (o substituto, se houver um registrado)."""
+    override = _server_overrides.get(url)
+    if override:
+        return override[0]
+    return Server(url, **kwargs)
+
+
+def make_connection(server, **kwargs):
+    """
+    Connection do ldap3 para o servidor (pela fábrica do substituto, se houver).
+
+    Abertura do socket, START_TLS, bind e buscas da conexão são medidos em
+    core.metrics (ldap_operation_seconds). Com auto_bind, o bind feito na
+    criação conta como 'bind' (inclui a abertura do socket).
+    """
+    override = _server_overrides.get(server.name)
+    factory = override[1] if override else Connection
+    if not kwargs.get('auto_bind'):
+        return _instrument(factory(server, **kwargs))
+    with _measure('bind', server.name):
+        conn = factory(server, **kwargs)
+    return _instrument(conn)
+
+
+# Métodos medidos: rebind chama bind, e paged_search chama search por página
+_MEASURED_METHODS = {'open': 'connect', 'start_tls': 'start_tls', 'bind': 'bind', 'search': 'search'}
+
+
+@contextmanager
+def _measure(operation, server_name):
+    try:
+        with LDAP_OPERATION_SECONDS.time(operation=operation, server=server_name):
+            yield
+    except Exception:
+        LDAP_OPERATION_ERRORS.inc(operation=operation, server=server_name)
+        raise
+
+
+def _instrument(conn):
+    """Substitui os métodos medidos da conexão por versões cronometradas."""
+    for method_name, operation in _MEASURED_METHODS.items():
+        setattr(conn, method_name, _measured(getattr(conn, method_name), operation, conn.server.name))
+    return conn
+
+
+def _measured(method, operation, server_name):
+    def wrapper(*args, **kwargs):
+        with _measure(operation, server_name):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def override_servers(servers):
+    """
+    Substitui servidores LDAP durante o bloco.
+
+    Args:
+        servers (dict): {url: (Server, fábrica)}; a fábrica recebe o Server e
+            os kwargs de Connection e retorna a conexão
+
+    Usage:
+        with override_servers({url: (server, factory)}):
+            get_group_members(ldap_config, group_dn)
+    """
+    with _lock:
+        previous = {url: _server_overrides.get(url) for url in servers}
+        _server_overrides.update(servers)
+    try:
+        yield
+    finally:
+        with _lock:
+            for url, override in previous.items():
+                if override is None:
+                    _server_overrides.pop(url, None)
+                else:
+                    _server_overrides[url] = override
+
+
+class ServerHealth:
+    """Estado de saúde de um servidor LDAP."""
+
+    def __init__(self, url):
+        self.url = url
+        self.latency_ms = None
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+        self.last_error = ''
+        self.last_checked = None
+
+    @property
+    def is_available(self):
+        """False enquanto o servidor está em quarentena."""
+        return time.monotonic() >= self.down_until
+
+    @property
+    def is_slow(self):
+        return self.latency_ms is not None and self.latency_ms > LDAP_SERVER_SLOW_MS
+
+    def record_success(self, latency_ms):
+        if self.consecutive_failures:
+            logger.info(f"✅ Servidor LDAP voltou: {self.url} ({latency_ms:.0f} ms)")
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+        self.last_error = ''
+        self.last_checked = time.time()
+        if self.latency_ms is None:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms += LATENCY_SMOOTHING * (latency_ms - self.latency_ms)
+
+    def record_failure(self, error):
+        self.consecutive_failures += 1
+        quarantine = min(
+            LDAP_SERVER_RETRY_SECONDS * 2 ** (self.consecutive_failures - 1),
+            LDAP_SERVER_MAX_RETRY_SECONDS,
+        )
+        self.down_until = time.monotonic() + quarantine
+        self.last_error = str(error) or type(error).__name__
+        self.last_checked = time.time()
+        logger.warning(
+            f"⚠️ Servidor LDAP indisponível: {self.url} "
+            f"({self.consecutive_failures} falha(s), nova tentativa em {quarantine}s): {self.last_error}"
+        )
+
+    def to_dict(self):
+        return {
+            'url': self.url,
+            'available': self.is_available,
+            'slow': self.is_slow,
+            'latency_ms': round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error,
+        }
+
+
+_health = {}
+_rotation = {}
+_lock = threading.Lock()
+
+
+def get_health(url):
+    """Estado de saúde do servidor (criado na primeira consulta)."""
+    with _lock:
+        health = _health.get(url)
+        if health is None:
+            health = _health[url] = ServerHealth(url)
+        return health
+
+
+def record_success(url, latency_ms):
+    health = get_health(url)
+    with _lock:
+        health.record_success(latency_ms)
+
+
+def record_failure(url, error):
+    health = get_health(url)
+    with _lock:
+        health.record_failure(error)
+
+
+def ordered_servers(urls, strategy=FIRST, rotation_key=None):
+    """
+    Ordem em que os servidores devem ser tentados.
+
+    Disponíveis e rápidos primeiro (na ordem da estratégia), depois os
+    lentos e, por último, os em quarentena (o que sai dela antes, primeiro).
+
+    Args:
+        urls (list[str]): Servidores na ordem configurada
+        strategy (str): FIRST ou ROUND_ROBIN
+        rotation_key (str): Chave do rodízio (ex.: código do país)
+
+    Returns:
+        list[str]: URLs ordenadas
+    """
+    urls = list(urls)
+    if strategy == ROUND_ROBIN and len(urls) > 1:
+        with _lock:
+            offset = _rotation.get(rotation_key, 0)
+            _rotation[rotation_key] = (offset + 1) % len(urls)
+        urls = urls[offset:] + urls[:offset]
+
+    states = [get_health(url) for url in urls]
+    available = [s for s in states if s.is_available]
+    fast = [s.url for s in available if not s.is_slow]
+    slow = sorted((s for s in available if s.is_slow), key=lambda s: s.latency_ms)
+    down = sorted((s for s in states if not s.is_available), key=lambda s: s.down_until)
+    return fast + [s.url for s in slow] + [s.url for s in down]
+
+
+def open_with_failover(urls, open_one, strategy=FIRST, rotation_key=None):
+    """
+    Abre uma conexão no primeiro servidor saudável que responder.
+
+    Args:
+        urls (list[str]): Servidores do diretório
+        open_one (callable): Recebe a URL e retorna a conexão aberta
+        strategy (str): FIRST ou ROUND_ROBIN
+        rotation_key (str): Chave do rodízio
+
+    Returns:
+        Conexão retornada por open_one
+
+    Raises:
+        Exception: Erro do último servidor, se nenhum responder
+        LDAPException: Nenhum servidor configurado
+    """
+    if not urls:
+        raise LDAPException(f"Nenhum servidor LDAP configurado ({rotation_key or 'diretório'})")
+    last_error = None
+    for url in ordered_servers(urls, strategy, rotation_key):
+        started = time.monotonic()
+        try:
+            conn = open_one(url)
+        except SERVER_ERRORS as e:
+            record_failure(url, e)
+            last_error = e
+            continue
+        record_success(url, (time.monotonic() - started) * 1000)
+        return conn
+    raise last_error
+
+
+def probe_server(url, use_tls=False, timeout=LDAP_HEALTH_PROBE_TIMEOUT):
+    """
+    Sonda ativa: abre um socket (e START_TLS, se configurado) sem bind.
+
+    Returns:
+        dict: Estado do servidor após a sonda (ver ServerHealth.to_dict)
+    """
+    started = time.monotonic()
+    conn = None
+    try:
+        conn = make_connection(make_server(url, get_info=NONE, connect_timeout=timeout), receive_timeout=timeout)
+        conn.open(read_server_info=False)
+        if use_tls:
+            conn.start_tls(read_server_info=False)
+    except SERVER_ERRORS as e:
+        record_failure(url, e)
+    else:
+        record_success(url, (time.monotonic() - started) * 1000)
+    finally:
+        if conn is not None:
+            try:
+                conn.unbind()
+            except Exception:
+                pass
+    return get_health(url).to_dict()
+
+
+def probe_directory(ldap_config):
+    """
+    Sonda todos os servidores de um diretório.
+
+    Returns:
+        list[dict]: Estado de cada servidor, na ordem configurada
+    """
+    return [probe_server(url, ldap_config.use_tls) for url in ldap_config.get_connection_strings()]
+
+
+# ============================================
+# Sondas em segundo plano
+# ============================================
+
+_probe_targets = {}
+_probe_thread = None
+
+
+def watch_servers(key, urls, use_tls=False):
+    """
+    Inclui os servidores de um diretório nas sondas periódicas e inicia a
+    thread de sondas (uma por processo) na primeira chamada.
+
+    Args:
+        key (str): Identificação do diretório (ex.: código do país)
+        urls (list[str]): Servidores do diretório
+    """
+    global _probe_thread
+    if not LDAP_HEALTH_PROBE_INTERVAL:
+        return
+    with _lock:
+        _probe_targets[key] = (list(urls), use_tls)
+        if _probe_thread is None or not _probe_thread.is_alive():
+            _probe_thread = threading.Thread(target=_probe_loop, name='ldap-health-probe', daemon=True)
+            _probe_thread.start()
+
+
+def unwatch_servers(key):
+    with _lock:
+        _probe_targets.pop(key, None)
+
+
+def _probe_loop():
+    while True:
+        time.sleep(LDAP_HEALTH_PROBE_INTERVAL)
+        with _lock:
+            targets = list(_probe_targets.values())
+        for urls, use_tls in targets:
+            # Só diretórios com mais de um DC precisam de roteamento
+            if len(urls) < 2:
+                continue
+            for url in urls:
+                try:
+                    probe_server(url, use_tls)
+                except Exception as e:
+                    logger.error(f"❌ Erro na sonda LDAP {url}: {e}")
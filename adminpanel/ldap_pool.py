@@ -0,0 +1,279 @@
+"""
+Pool de conexões LDAP por país.
+
+Mantém, para cada LdapDirectory ativo:
+- um objeto Server reaproveitado (DSE/schema lidos apenas uma vez);
+- conexões "quentes" autenticadas com a conta de serviço, usadas nas buscas;
+- sockets de curta duração reaproveitados apenas para validar credenciais
+  de usuários (rebind), evitando um novo handshake TCP/TLS a cada login.
+
+Os pools são indexados pelo código do país e recriados automaticamente
+quando o `updated_at` da configuração muda.
+
+Com vários DCs configurados (LdapDirectory.backup_servers), cada nova
+conexão é aberta no servidor escolhido por adminpanel.ldap_health
+(failover, estratégia FIRST/ROUND_ROBIN e desvio de servidores lentos ou
+em quarentena).
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from queue import LifoQueue, Empty, Full
+
+from django.conf import settings
+from ldap3 import ALL, NONE
+from ldap3.core.exceptions import LDAPException, LDAPBindError
+
+from adminpanel.ldap_health import (
+    SERVER_ERRORS,
+    get_health,
+    make_connection,
+    make_server,
+    open_with_failover,
+    record_failure,
+    unwatch_servers,
+    watch_servers,
+)
+
+logger = logging.getLogger(__name__)
+
+# Conexões de serviço mantidas abertas por país
+POOL_SIZE = getattr(settings, 'LDAP_POOL_SIZE', 4)
+
+# Sockets reaproveitados para bind de usuários por país
+BIND_POOL_SIZE = getattr(settings, 'LDAP_BIND_POOL_SIZE', 4)
+
+# Tempo máximo (segundos) que uma conexão ociosa permanece no pool
+IDLE_TIMEOUT = getattr(settings, 'LDAP_POOL_IDLE_TIMEOUT', 300)
+
+# Timeouts de rede (segundos)
+CONNECT_TIMEOUT = getattr(settings, 'LDAP_CONNECT_TIMEOUT', 5)
+RECEIVE_TIMEOUT = getattr(settings, 'LDAP_RECEIVE_TIMEOUT', 15)
+
+
+class LdapConnectionPool:
+    """
+    Pool de conexões para um único LdapDirectory (um país).
+    """
+
+    def __init__(self, ldap_config):
+        """
+        Args:
+            ldap_config (LdapDirectory): Configuração do AD do país
+        """
+        self.country_code = ldap_config.country_code
+        self.version = ldap_config.updated_at
+        self.bind_user_dn = ldap_config.bind_user_dn
+        self.use_tls = ldap_config.use_tls
+        self._bind_password = ldap_config.get_password()
+
+        # DCs do diretório (principal + adicionais) e estratégia de escolha
+        self.urls = ldap_config.get_connection_strings()
+        self.strategy = ldap_config.server_pool_strategy
+
+        # Servidores das conexões de serviço: leem DSE/schema na primeira conexão
+        self.search_servers = {
+            url: make_server(url, get_info=ALL, connect_timeout=CONNECT_TIMEOUT) for url in self.urls
+        }
+
+        # Servidores dos binds de usuário: nunca leem schema
+        self.bind_servers = {
+            url: make_server(url, get_info=NONE, connect_timeout=CONNECT_TIMEOUT) for url in self.urls
+        }
+
+        self._service_connections = LifoQueue(maxsize=POOL_SIZE)
+        self._bind_connections = LifoQueue(maxsize=BIND_POOL_SIZE)
+        self._closed = False
+
+        watch_servers(self.country_code, self.urls, self.use_tls)
+
+    # ------------------------------------------------------------------
+    # Abertura / descarte de conexões
+    # ------------------------------------------------------------------
+
+    def _open_socket(self, server):
+        """Abre um socket (com START_TLS se configurado), ainda sem bind."""
+        conn = make_connection(server, receive_timeout=RECEIVE_TIMEOUT)
+        conn.open(read_server_info=False)
+        if self.use_tls:
+            try:
+                conn.start_tls(read_server_info=False)
+            except LDAPException:
+                self._discard(conn)
+                raise
+        return conn
+
+    def _open(self, servers):
+        """Abre um socket no DC escolhido pelo roteamento (com failover)."""
+        return open_with_failover(
+            self.urls,
+            lambda url: self._open_socket(servers[url]),
+            strategy=self.strategy,
+            rotation_key=self.country_code,
+        )
+
+    def _open_service_connection(self):
+        """Abre e autentica uma nova conexão com a conta de serviço."""
+        conn = self._open(self.search_servers)
+        read_info = conn.server.info is None
+        if not conn.rebind(user=self.bind_user_dn, password=self._bind_password, read_server_info=read_info):
+            self._discard(conn)
+            raise LDAPBindError(f"Bind da conta de serviço falhou ({self.country_code})")
+        logger.info(f"🔌 Nova conexão de serviço LDAP: {self.country_code} ({conn.server.name})")
+        return conn
+
+    @staticmethod
+    def _discard(conn):
+        """Fecha uma conexão ignorando erros de socket."""
+        try:
+            conn.unbind()
+        except Exception:
+            pass
+
+    def _checkout(self, queue):
+        """Retira uma conexão ociosa válida do pool, ou None."""
+        while True:
+            try:
+                conn, last_used = queue.get_nowait()
+            except Empty:
+                return None
+            if conn.closed or time.monotonic() - last_used > IDLE_TIMEOUT:
+                self._discard(conn)
+                continue
+            # Servidor entrou em quarentena depois que a conexão foi aberta
+            if not get_health(conn.server.name).is_available:
+                self._discard(conn)
+                continue
+            return conn
+
+    def _checkin(self, queue, conn):
+        """Devolve uma conexão ao pool (ou fecha se o pool estiver cheio/fechado)."""
+        if self._closed or conn.closed:
+            self._discard(conn)
+            return
+        try:
+            queue.put_nowait((conn, time.monotonic()))
+        except Full:
+            self._discard(conn)
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def service_connection(self):
+        """
+        Fornece uma conexão autenticada com a conta de serviço.
+
+        Usage:
+            with pool.service_connection() as conn:
+                conn.search(...)
+        """
+        conn = self._checkout(self._service_connections) or self._open_service_connection()
+        try:
+            yield conn
+        except BaseException as e:
+            # Qualquer erro no bloco (LDAP, banco, código do chamador, GeneratorExit)
+            # deixa a conexão em estado desconhecido: não volta para o pool
+            if isinstance(e, SERVER_ERRORS):
+                record_failure(conn.server.name, e)
+            self._discard(conn)
+            raise
+        else:
+            self._checkin(self._service_connections, conn)
+
+    def check_credentials(self, user_dn, password):
+        """
+        Valida as credenciais de um usuário fazendo bind num socket reaproveitado.
+
+        Args:
+            user_dn (str): DN ou UPN do usuário
+            password (str): Senha
+
+        Returns:
+            bool: True se o bind foi aceito pelo servidor
+        """
+        # Bind com senha vazia é aceito pelo AD como bind anônimo
+        if not password:
+            return False
+
+        # Um socket reaproveitado pode ter caído: nesse caso, tenta uma vez
+        # num socket novo (que já passa pelo failover entre DCs)
+        conn = self._checkout(self._bind_connections)
+        reused = conn is not None
+        while True:
+            conn = conn or self._open(self.bind_servers)
+            try:
+                bound = conn.rebind(user=user_dn, password=password, read_server_info=False)
+            except LDAPException as e:
+                self._discard(conn)
+                if not isinstance(e, SERVER_ERRORS):
+                    raise
+                record_failure(conn.server.name, e)
+                if not reused:
+                    raise
+                conn, reused = None, False
+                continue
+
+            self._checkin(self._bind_connections, conn)
+            return bool(bound)
+
+    def close(self):
+        """Fecha todas as conexões ociosas do pool."""
+        self._closed = True
+        unwatch_servers(self.country_code)
+        for queue in (self._service_connections, self._bind_connections):
+            while True:
+                try:
+                    conn, _ = queue.get_nowait()
+                except Empty:
+                    break
+                self._discard(conn)
+
+
+# ============================================
+# Registro global de pools (por país)
+# ============================================
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(ldap_config):
+    """
+    Retorna o pool do país, recriando-o se a configuração foi alterada.
+
+    Args:
+        ldap_config (LdapDirectory): Configuração do AD do país
+
+    Returns:
+        LdapConnectionPool: Pool de conexões do país
+    """
+    with _pools_lock:
+        pool = _pools.get(ldap_config.country_code)
+        if pool is None or pool.version != ldap_config.updated_at:
+            if pool is not None:
+                logger.info(f"♻️ Configuração LDAP alterada, recriando pool: {ldap_config.country_code}")
+                pool.close()
+            pool = LdapConnectionPool(ldap_config)
+            _pools[ldap_config.country_code] = pool
+        return pool
+
+
+def close_pool(country_code):
+    """Fecha e remove o pool de um país."""
+    with _pools_lock:
+        pool = _pools.pop(country_code, None)
+    if pool is not None:
+        pool.close()
+
+
+def close_all_pools():
+    """Fecha todos os pools (ex.: em testes ou no shutdown do worker)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,313 @@
+"""
+Diretório AD simulado em memória, para medir o código LDAP sem um DC.
+
+Baseado na estratégia MOCK_SYNC do ldap3: as entradas ficam no próprio
+objeto Server e todas as conexões abertas para ele (pool de login,
+ADConnection da sincronização, resolução de membros) enxergam os mesmos
+dados. O que o MOCK_SYNC não faz e o AD faz é completado aqui:
+- RootDSE (highestCommittedUSN/dsServiceName), lido pela sincronização;
+- ranged retrieval de `member` (faixas de STANDIN_RANGE_STEP valores); como
+  no AD, a leitura simples de `member` de um grupo maior devolve só
+  `member;range=0-1499`;
+- bind por UPN (usuario@dominio), como o backend de login faz;
+- exclusão como no AD (delete): o objeto vira tombstone em CN=Deleted
+  Objects, só aparece nas buscas com o controle SHOW_DELETED e sai do
+  `member` dos grupos.
+
+O MOCK_SYNC compara cada filtro de igualdade com todas as entradas; aqui os
+atributos de INDEXED_ATTRIBUTES têm índice, como no AD, para que o custo
+medido seja o do nosso código e não o da varredura do mock.
+
+Filtros por uSNChanged (>=) funcionam: todo objeto gravado recebe o próximo
+USN, então as sincronizações completa e incremental podem ser exercitadas.
+
+Usage:
+    directory = StandInDirectory(ldap_config.get_connection_string(), 'DC=bench,DC=local')
+    directory.populate(users=10000)
+    with directory.installed():
+        get_group_members(ldap_config, directory.group_dns[0])
+"""
+
+import random
+import re
+from collections import defaultdict
+
+from ldap3 import MOCK_SYNC, NONE, Connection, Server
+from ldap3.core.exceptions import LDAPBindError
+from ldap3.operation.search import MATCH_EQUAL
+from ldap3.strategy.mockSync import MockSyncStrategy
+from ldap3.utils.conv import ldap_escape_to_bytes
+from ldap3.utils.dn import safe_dn
+
+from adminpanel.ldap_health import override_servers
+
+# Senha de todos os usuários e da conta de serviço simulados
+STANDIN_PASSWORD = 'Bench-Passw0rd!'
+
+# Faixa máxima devolvida por leitura de `member` (MaxValRange do AD)
+STANDIN_RANGE_STEP = 1500
+
+# Atributos indexados para filtros de igualdade
+INDEXED_ATTRIBUTES = ['distinguishedName', 'sAMAccountName', 'userPrincipalName', 'objectCategory', 'objectClass', 'cn']
+
+# OID do controle LDAP_SERVER_SHOW_DELETED
+SHOW_DELETED_OID = '1.2.840.113556.1.4.417'
+
+_RANGE_ATTRIBUTE_RE = re.compile(r'^member;range=(\d+)-(\*|\d+)$', re.IGNORECASE)
+
+
+class StandInStrategy(MockSyncStrategy):
+    """MOCK_SYNC com RootDSE, ranged retrieval de `member` e índices."""
+
+    def mock_search(self, request, controls):
+        # O MOCK_SYNC só entende controles já codificados: o SHOW_DELETED
+        # (tupla oid/criticidade/valor) é tratado aqui
+        self._show_deleted = False
+        kept = []
+        for control in controls or []:
+            if isinstance(control, tuple):
+                self._show_deleted = self._show_deleted or control[0] == SHOW_DELETED_OID
+            else:
+                kept.append(control)
+        return super().mock_search(request, kept)
+
+    def _execute_search(self, request):
+        responses, result = self._search(request)
+        # Sem SHOW_DELETED, o AD não devolve tombstones
+        if not getattr(self, '_show_deleted', False):
+            deleted = self.connection.server.standin.deleted_dns
+            responses = [response for response in responses if response['object'] not in deleted]
+        return responses, result
+
+    def _search(self, request):
+        standin = self.connection.server.standin
+        # Sem NOT no filtro, o conjunto de "não encontrados" nunca é usado
+        self._negated = '!' in request['filter']
+        self._candidates = self._candidate_set = None
+
+        if request['base'] == '':
+            return [{'object': '', 'attributes': [
+                {'type': name, 'vals': [str(value).encode('utf-8')]}
+                for name, value in standin.root_dse().items()
+            ]}], _success()
+
+        ranged = [name for name in request['attributes'] if _RANGE_ATTRIBUTE_RE.match(name)]
+        if not ranged:
+            # Leitura simples: acima de MaxValRange o AD troca `member` pela primeira faixa
+            responses, result = super()._execute_search(request)
+            for response in responses:
+                response['attributes'] = [
+                    _slice_member(attribute, 0, '*')
+                    if attribute['type'].lower() == 'member' and len(attribute['vals']) > STANDIN_RANGE_STEP
+                    else attribute
+                    for attribute in response['attributes']
+                ]
+            return responses, result
+
+        request = dict(request, attributes=[
+            name for name in request['attributes'] if name not in ranged
+        ] + ['member'])
+        responses, result = super()._execute_search(request)
+        start, end = _RANGE_ATTRIBUTE_RE.match(ranged[0]).groups()
+        for response in responses:
+            response['attributes'] = [
+                _slice_member(attribute, int(start), end) if attribute['type'].lower() == 'member' else attribute
+                for attribute in response['attributes']
+            ]
+        return responses, result
+
+    def evaluate_filter_node(self, node, candidates):
+        attribute = (node.assertion or {}).get('attr', '').lower() if node.tag == MATCH_EQUAL else None
+        index = self.connection.server.standin.index.get(attribute)
+        if index is None:
+            return super().evaluate_filter_node(node, candidates)
+
+        if self._candidates is not candidates:
+            self._candidates, self._candidate_set = candidates, set(candidates)
+        value = ldap_escape_to_bytes(node.assertion['value']).decode('utf-8').lower()
+        node.matched = index.get(value, set()) & self._candidate_set
+        node.unmatched = self._candidate_set - node.matched if self._negated else set()
+        return None
+
+
+def _success():
+    return {'resultCode': 0, 'matchedDN': '', 'diagnosticMessage': '', 'referral': None}
+
+
+def _slice_member(attribute, start, end):
+    """Recorta `member` como o AD: no máximo STANDIN_RANGE_STEP valores por faixa."""
+    values = attribute['vals']
+    last = len(values) - 1 if end == '*' else int(end)
+    last = min(last, start + STANDIN_RANGE_STEP - 1)
+    if last >= len(values) - 1:
+        return {'type': f'member;range={start}-*', 'vals': values[start:]}
+    return {'type': f'member;range={start}-{last}', 'vals': values[start:last + 1]}
+
+
+class StandInDirectory:
+    """
+    Um DC simulado, com usuários e grupos gerados.
+
+    Args:
+        url (str): URL que o diretório substitui (LdapDirectory.get_connection_string())
+        base_dn (str): Base do domínio, ex.: 'DC=bench,DC=local'
+        seed (int): Semente do gerador (massas reproduzíveis)
+    """
+
+    def __init__(self, url, base_dn, seed=42):
+        self.url = url
+        self.base_dn = base_dn
+        # Domínio (componentes DC=): base_dn pode ser uma OU dentro dele
+        self.naming_context = ','.join(
+            part.strip() for part in base_dn.split(',') if part.strip().upper().startswith('DC=')
+        )
+        self.domain = '.'.join(part.split('=', 1)[1] for part in self.naming_context.split(','))
+        self.deleted_dns = set()
+        self.service_dn = f'CN=svc-bench,OU=Service,{base_dn}'
+        self.highest_usn = 0
+        self.user_dns = []
+        self.usernames = []
+        self.group_dns = []
+        self.random = random.Random(seed)
+        self.index = {name.lower(): defaultdict(set) for name in INDEXED_ATTRIBUTES}
+
+        self.server = Server(url, get_info=NONE)
+        self.server.standin = self
+        self._loader = self.connect(self.server)
+
+    def connect(self, server, **kwargs):
+        """Fábrica de conexões registrada em override_servers."""
+        kwargs.pop('client_strategy', None)
+        conn = Connection(server, client_strategy=MOCK_SYNC, **kwargs)
+        # A Connection guarda métodos da estratégia já vinculados: em vez de
+        # substituí-la, troca a classe da instância (buscas passam pela subclasse)
+        conn.strategy.__class__ = StandInStrategy
+        # O ldap3 ignora auto_bind no MOCK_SYNC: faz o bind como um DC faria
+        if kwargs.get('auto_bind') and not conn.bind():
+            raise LDAPBindError(conn.last_error or 'invalid credentials')
+        return conn
+
+    def installed(self):
+        """Context manager: conexões para `url` passam a usar este diretório."""
+        return override_servers({self.url: (self.server, self.connect)})
+
+    def root_dse(self):
+        return {
+            'highestCommittedUSN': self.highest_usn,
+            'dsServiceName': f'CN=NTDS Settings,CN=BENCH-DC,CN=Servers,{self.naming_context}',
+            'defaultNamingContext': self.naming_context,
+        }
+
+    def member_dns(self, group_dn):
+        """Membros atuais de um grupo (todos os valores, sem faixas)."""
+        entry = self.server.dit.get(safe_dn(group_dn), {})
+        return [value.decode('utf-8') for value in entry.get('member', [])]
+
+    def _add(self, dn, attributes):
+        self.highest_usn += 1
+        attributes.setdefault('distinguishedName', dn)
+        attributes['uSNChanged'] = str(self.highest_usn)
+        self._loader.strategy.add_entry(dn, attributes)
+
+        key = safe_dn(dn)
+        for name, values in self.server.dit[key].items():
+            index = self.index.get(name.lower())
+            if index is not None:
+                for value in values:
+                    index[value.decode('utf-8').lower()].add(key)
+
+    def delete(self, dn):
+        """
+        Exclui um objeto como o AD: remove a entrada (e o UPN e as
+        associações em `member`) e grava o tombstone em CN=Deleted Objects,
+        com isDeleted, lastKnownParent e sAMAccountName preservado.
+
+        Returns:
+            str: DN do tombstone
+        """
+        key = safe_dn(dn)
+        entry = self.server.dit[key]
+        kept = {
+            name: [value.decode('utf-8') for value in entry[name]]
+            for name in ('objectClass', 'objectCategory', 'sAMAccountName') if name in entry
+        }
+
+        del self.server.dit[key]
+        for index in self.index.values():
+            for keys in index.values():
+                keys.discard(key)
+        if 'sAMAccountName' in kept:
+            self.server.dit.pop(f"{kept['sAMAccountName'][0]}@{self.domain}", None)
+        for group_dn in self.group_dns:
+            group = self.server.dit.get(safe_dn(group_dn))
+            if group and 'member' in group:
+                group['member'] = [value for value in group['member'] if safe_dn(value.decode('utf-8')) != key]
+
+        rdn, parent = dn.split(',', 1)
+        tombstone = f'{rdn}\\0ADEL:{self.highest_usn + 1:08d},CN=Deleted Objects,{self.naming_context}'
+        self._add(tombstone, dict(kept, isDeleted='TRUE', lastKnownParent=parent))
+        self.deleted_dns.add(safe_dn(tombstone))
+        return tombstone
+
+    def populate(self, users, groups=None, group_size=100, big_group_size=0):
+        """
+        Gera a conta de serviço, `users` usuários e os grupos.
+
+        Args:
+            users (int): Quantidade de usuários
+            groups (int): Grupos comuns (padrão: 1 a cada 100 usuários)
+            group_size (int): Membros de cada grupo comum (sorteados)
+            big_group_size (int): Membros de um grupo extra, o primeiro de
+                `group_dns` (0 = sem grupo grande)
+        """
+        self._add(self.service_dn, {
+            'objectClass': ['top', 'person', 'user'],
+            'objectCategory': 'service',
+            'sAMAccountName': 'svc-bench',
+            'userPassword': STANDIN_PASSWORD,
+        })
+
+        for n in range(users):
+            username = f'bench{n:06d}'
+            dn = f'CN=Bench User {n:06d},OU=Users,{self.base_dn}'
+            attributes = {
+                'objectClass': ['top', 'person', 'organizationalPerson', 'user'],
+                'objectCategory': 'person',
+                'sAMAccountName': username,
+                'userPrincipalName': f'{username}@{self.domain}',
+                'displayName': f'Bench User {n:06d}',
+                'givenName': 'Bench',
+                'sn': f'User {n:06d}',
+                'mail': f'{username}@{self.domain}',
+                'department': f'Department {n % 50:02d}',
+                'title': 'Analyst',
+                # 1 em cada 20 desabilitado (ACCOUNTDISABLE)
+                'userAccountControl': '514' if n % 20 == 0 else '512',
+                'userPassword': STANDIN_PASSWORD,
+            }
+            self._add(dn, attributes)
+            # O AD aceita bind por UPN; o MOCK_SYNC procura a identidade no dit
+            self.server.dit[f'{username}@{self.domain}'] = self.server.dit[dn]
+            self.user_dns.append(dn)
+            self.usernames.append(username)
+
+        if big_group_size:
+            self._add_group('Bench Big Group', self.user_dns[:big_group_size])
+
+        if groups is None:
+            groups = max(1, users // 100)
+        for n in range(groups):
+            size = min(group_size, len(self.user_dns))
+            self._add_group(f'Bench Group {n:05d}', self.random.sample(self.user_dns, size))
+
+    def _add_group(self, name, members):
+        dn = f'CN={name},OU=Groups,{self.base_dn}'
+        self._add(dn, {
+            'objectClass': ['top', 'group'],
+            'cn': name,
+            'name': name,
+            'sAMAccountName': name.replace(' ', '-'),
+            'description': f'{len(members)} membros',
+            'member': members,
+        })
+        self.group_dns.append(dn)
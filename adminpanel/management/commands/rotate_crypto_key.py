@@ -0,0 +1,177 @@
+"""
+Regrava as senhas criptografadas com uma nova versão de chave.
+Uso: python manage.py rotate_crypto_key [--to-version N] [--batch-size 200] [--dry-run] [--checkpoint arquivo.json]
+
+Passos para trocar a chave:
+1. Adicione a nova chave em CRYPTO_KEYS (mantendo as antigas) e aponte
+   CRYPTO_KEY_VERSION para ela: novas gravações já usam a versão nova.
+2. Rode este comando: os valores antigos (legado ou outras versões) são
+   lidos, descriptografados e regravados em lotes, cada um na sua transação
+   com as linhas travadas (SELECT ... FOR UPDATE).
+3. Quando o comando terminar sem falhas, as chaves antigas podem sair de
+   CRYPTO_KEYS.
+
+O comando pode ser interrompido e executado de novo: valores que já estão
+na versão de destino são ignorados e, com --checkpoint, cada coluna continua
+a partir do último pk gravado.
+"""
+
+import json
+import os
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from adminpanel.encryption import AESCipher, key_version
+
+# Colunas criptografadas: (modelo, campo, aceita texto plano legado)
+ENCRYPTED_FIELDS = [
+    ('adminpanel.LdapDirectory', 'bind_password_encrypted', False),
+    ('adminpanel.SmtpConfiguration', 'password_encrypted', False),
+    ('adminpanel.LdapConfig', 'bind_password_encrypted', False),
+    ('adminpanel.SmtpConfig', 'password_encrypted', False),
+    # Gravadas sem criptografia até o formulário passar a criptografar
+    ('access_control.SystemDefaultConfig', 'ad_bind_password', True),
+    ('access_control.SystemDefaultConfig', 'smtp_password', True),
+]
+
+
+class Command(BaseCommand):
+    help = 'Recriptografa as senhas de LDAP/SMTP com uma nova versão de chave'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--to-version',
+            type=int,
+            help='Versão de destino em CRYPTO_KEYS (padrão: CRYPTO_KEY_VERSION)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Linhas por transação (padrão: 200)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Apenas descriptografa e conta, sem gravar',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            type=str,
+            help='Arquivo JSON com o último pk processado por coluna (retomada)',
+        )
+
+    def handle(self, *args, **options):
+        cipher = AESCipher()
+        version = options.get('to_version') or cipher.current_version
+        if not version:
+            raise CommandError('Informe --to-version ou configure CRYPTO_KEY_VERSION.')
+        if version not in cipher.keys:
+            raise CommandError(f'A versão {version} não está em CRYPTO_KEYS.')
+
+        dry_run = options['dry_run']
+        mode = ' (dry-run)' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(f"🔐 Rotação de chave para v{version}{mode}"))
+
+        checkpoint_path = options.get('checkpoint')
+        checkpoint = self._load_checkpoint(checkpoint_path, version)
+
+        failures = 0
+        for label, field, plaintext_allowed in ENCRYPTED_FIELDS:
+            model = apps.get_model(label)
+            column = f'{label}.{field}'
+            # Dry-run não grava: sempre percorre a coluna inteira
+            start_after = None if dry_run else checkpoint['columns'].get(column)
+
+            result = self._rotate_column(
+                cipher, model, field, plaintext_allowed, version,
+                options['batch_size'], dry_run, start_after,
+                on_batch=lambda last_pk, column=column: self._save_checkpoint(
+                    checkpoint_path, checkpoint, column, last_pk, dry_run
+                ),
+            )
+            failures += len(result['failed'])
+
+            self.stdout.write(
+                f"   {column}: {result['rotated']} regravados, "
+                f"{result['current']} já em v{version}, {result['empty']} vazios, "
+                f"{result['plaintext']} em texto plano"
+            )
+            for pk, error in result['failed']:
+                self.stdout.write(self.style.ERROR(f"   ❌ {column} pk={pk}: {error}"))
+
+        if failures:
+            raise CommandError(f'{failures} valor(es) não puderam ser descriptografados; as chaves antigas ainda são necessárias.')
+        self.stdout.write(self.style.SUCCESS('✅ Rotação concluída' + mode))
+
+    def _rotate_column(self, cipher, model, field, plaintext_allowed, version,
+                       batch_size, dry_run, start_after, on_batch):
+        """
+        Percorre a coluna em lotes por pk; cada lote numa transação.
+
+        Returns:
+            dict: {'rotated', 'current', 'empty', 'plaintext': int, 'failed': [(pk, erro)]}
+        """
+        result = {'rotated': 0, 'current': 0, 'empty': 0, 'plaintext': 0, 'failed': []}
+        manager = model._base_manager
+        last_pk = start_after
+
+        while True:
+            with transaction.atomic():
+                queryset = manager.order_by('pk')
+                if last_pk is not None:
+                    queryset = queryset.filter(pk__gt=last_pk)
+                if not dry_run:
+                    queryset = queryset.select_for_update()
+                rows = list(queryset.values_list('pk', field)[:batch_size])
+                if not rows:
+                    break
+
+                to_update = []
+                for pk, value in rows:
+                    if not value:
+                        result['empty'] += 1
+                        continue
+                    if key_version(value) == version:
+                        result['current'] += 1
+                        continue
+                    try:
+                        plain = cipher.decrypt_value(value)
+                    except Exception as e:
+                        if not plaintext_allowed or key_version(value):
+                            result['failed'].append((pk, str(e) or type(e).__name__))
+                            continue
+                        plain = value
+                        result['plaintext'] += 1
+                    to_update.append(model(pk=pk, **{field: cipher.encrypt_versioned(plain, version)}))
+
+                if to_update and not dry_run:
+                    manager.bulk_update(to_update, [field])
+                result['rotated'] += len(to_update)
+                last_pk = rows[-1][0]
+
+            on_batch(last_pk)
+
+        return result
+
+    def _load_checkpoint(self, path, version):
+        if not path or not os.path.exists(path):
+            return {'version': version, 'columns': {}}
+        with open(path, encoding='utf-8') as handle:
+            checkpoint = json.load(handle)
+        if checkpoint.get('version') != version:
+            # Checkpoint de outra rotação: recomeça do início
+            return {'version': version, 'columns': {}}
+        self.stdout.write(f"↪️  Retomando a partir de {path}")
+        return checkpoint
+
+    def _save_checkpoint(self, path, checkpoint, column, last_pk, dry_run):
+        if not path or dry_run:
+            return
+        checkpoint['columns'][column] = last_pk
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump(checkpoint, handle)
+        os.replace(tmp_path, path)
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0004_rename_default_sender_smtpconfiguration_from_email_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ldapdirectory',
+            name='backup_servers',
+            field=models.TextField(blank=True, help_text='Outros DCs do domínio, um por linha: host ou host:porta (porta e SSL acima quando omitidos)', verbose_name='Servidores Adicionais'),
+        ),
+        migrations.AddField(
+            model_name='ldapdirectory',
+            name='server_pool_strategy',
+            field=models.CharField(choices=[('FIRST', 'Primeiro disponível'), ('ROUND_ROBIN', 'Round-robin')], default='FIRST', help_text='Primeiro disponível: usa o servidor principal e só troca se ele falhar', max_length=20, verbose_name='Estratégia entre Servidores'),
+        ),
+    ]
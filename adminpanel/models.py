@@ -5,7 +5,10 @@ Gerencia configurações de LDAP, SMTP, SSL e outras configurações do sistema.
 
 from django.db import models
 from django.conf import settings
-from adminpanel.encryption import AESCipher
+from ldap3 import FIRST
+
+from adminpanel.encryption import AESCipher, evict_cached_secrets, get_cached_secret
+from adminpanel.ldap_health import STRATEGY_CHOICES
 
 # Instância global do cipher
 aes = AESCipher()
@@ -126,6 +129,20 @@ class LdapDirectory(models.Model):
         verbose_name="Porta",
         help_text="389 para LDAP padrão, 636 para LDAPS (SSL)"
     )
+    
+    # Controladores de domínio adicionais (failover)
+    backup_servers = models.TextField(
+        blank=True,
+        verbose_name="Servidores Adicionais",
+        help_text="Outros DCs do domínio, um por linha: host ou host:porta (porta e SSL acima quando omitidos)"
+    )
+    server_pool_strategy = models.CharField(
+        max_length=20,
+        choices=STRATEGY_CHOICES,
+        default=FIRST,
+        verbose_name="Estratégia entre Servidores",
+        help_text="Primeiro disponível: usa o servidor principal e só troca se ele falhar"
+    )
     base_dn = models.CharField(
         max_length=300,
         verbose_name="Base DN",
@@ -254,10 +271,11 @@ class LdapDirectory(models.Model):
     def get_password(self):
         """
         Retorna a senha descriptografada.
-        Usa o sistema AESCipher existente.
+        Usa o sistema AESCipher existente, com cache em memória por
+        (modelo, pk, updated_at).
         """
         try:
-            decrypted = aes.decrypt(self.bind_password_encrypted or '')
+            decrypted = get_cached_secret(self, 'bind_password_encrypted', aes.decrypt)
             return decrypted if decrypted else ''
         except Exception as e:
             print(f"❌ Erro ao descriptografar senha do AD: {str(e)}")
@@ -284,6 +302,11 @@ class LdapDirectory(models.Model):
         
         super().save(*args, **kwargs)
     
+    def delete(self, *args, **kwargs):
+        """Remove a senha descriptografada do cache em memória."""
+        evict_cached_secrets(self)
+        return super().delete(*args, **kwargs)
+    
     def __str__(self):
         return f"{self.get_country_code_display()} - {self.name}"
     
@@ -293,6 +316,30 @@ class LdapDirectory(models.Model):
         protocol = 'ldaps' if self.use_ssl else 'ldap'
         return f"{protocol}://{server}:{self.port}"
     
+    def get_connection_strings(self):
+        """
+        Retorna as URLs de todos os DCs: o principal e os adicionais.
+        
+        Returns:
+            list[str]: URLs no formato protocolo://host:porta, sem repetições
+        """
+        protocol = 'ldaps' if self.use_ssl else 'ldap'
+        urls = [self.get_connection_string()]
+        for line in self.backup_servers.replace(',', '\n').splitlines():
+            server = line.strip()
+            if not server:
+                continue
+            if '://' in server:
+                protocol_part, server = server.split('://', 1)
+            else:
+                protocol_part = protocol
+            if ':' not in server:
+                server = f"{server}:{self.port}"
+            url = f"{protocol_part}://{server}"
+            if url not in urls:
+                urls.append(url)
+        return urls
+    
     def get_user_search_base(self):
         """Retorna a base de busca de usuários."""
         return self.user_search_base or self.base_dn
@@ -412,9 +459,9 @@ class SmtpConfiguration(models.Model):
         self.password_encrypted = aes.encrypt(raw_password)
     
     def get_password(self):
-        """Retorna a senha descriptografada."""
+        """Retorna a senha descriptografada (em cache por pk/updated_at)."""
         try:
-            decrypted = aes.decrypt(self.password_encrypted or '')
+            decrypted = get_cached_secret(self, 'password_encrypted', aes.decrypt)
             return decrypted if decrypted else ''
         except Exception as e:
             print(f"❌ Erro ao descriptografar senha SMTP: {str(e)}")
@@ -440,6 +487,11 @@ class SmtpConfiguration(models.Model):
         
         super().save(*args, **kwargs)
     
+    def delete(self, *args, **kwargs):
+        """Remove a senha descriptografada do cache em memória."""
+        evict_cached_secrets(self)
+        return super().delete(*args, **kwargs)
+    
     def __str__(self):
         status = "🟢" if self.is_active else "⚪"
         return f"{status} {self.name}"
\ No newline at end of file
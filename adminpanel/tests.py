@@ -1,3 +1,418 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from io import StringIO
 
-# Create your tests here.
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from ldap3 import FIRST, ROUND_ROBIN
+from ldap3.core.exceptions import LDAPCommunicationError, LDAPException
+
+from adminpanel.encryption import AESCipher, SecretCache, aes, key_version, secret_cache
+from adminpanel import ldap_health
+from adminpanel.ldap_health import (
+    LDAP_SERVER_RETRY_SECONDS,
+    get_health,
+    open_with_failover,
+    ordered_servers,
+    record_failure,
+    record_success,
+)
+from adminpanel.ldap_pool import close_pool, get_pool
+from adminpanel.ldap_standin import STANDIN_PASSWORD, STANDIN_RANGE_STEP, StandInDirectory
+from adminpanel.models import LdapDirectory, SmtpConfiguration
+from ldap_advanced_utils import iter_member_dns
+
+
+class StandInDirectoryTestCase(TestCase):
+    """Base dos testes que usam o AD simulado (adminpanel.ldap_standin)."""
+
+    country_code = 'BR'
+    base_dn = 'DC=test,DC=local'
+    users = 20
+
+    def setUp(self):
+        self.directory = LdapDirectory(
+            country_code=self.country_code,
+            name='Teste',
+            ldap_server='test-dc.invalid',
+            port=389,
+            base_dn=self.base_dn,
+            search_filter='(sAMAccountName={username})',
+            is_active=True,
+        )
+        self.standin = StandInDirectory(self.directory.get_connection_string(), self.directory.base_dn)
+        self.populate()
+        self.directory.bind_user_dn = self.standin.service_dn
+        self.directory.set_password(STANDIN_PASSWORD)
+        self.directory.save()
+
+        installed = self.standin.installed()
+        installed.__enter__()
+        self.addCleanup(installed.__exit__, None, None, None)
+        self.addCleanup(close_pool, self.country_code)
+
+    def populate(self):
+        self.standin.populate(self.users)
+
+
+class ServiceConnectionTests(StandInDirectoryTestCase):
+
+    def test_connection_returns_to_pool_after_success(self):
+        pool = get_pool(self.directory)
+        with pool.service_connection() as conn:
+            pass
+        self.assertEqual(pool._service_connections.qsize(), 1)
+        self.assertFalse(conn.closed)
+
+    def test_non_ldap_error_discards_connection(self):
+        pool = get_pool(self.directory)
+        with self.assertRaises(KeyError):
+            with pool.service_connection() as conn:
+                raise KeyError('erro do chamador')
+        self.assertEqual(pool._service_connections.qsize(), 0)
+        self.assertTrue(conn.closed)
+
+    def test_warm_connection_is_reused(self):
+        pool = get_pool(self.directory)
+        with pool.service_connection() as first:
+            pass
+        with pool.service_connection() as second:
+            pass
+        self.assertIs(first, second)
+
+    def test_idle_connection_expires(self):
+        pool = get_pool(self.directory)
+        with pool.service_connection() as first:
+            pass
+        with mock.patch('adminpanel.ldap_pool.IDLE_TIMEOUT', -1):
+            with pool.service_connection() as second:
+                pass
+        self.assertIsNot(first, second)
+        self.assertTrue(first.closed)
+
+    def test_pool_is_kept_per_country_until_directory_changes(self):
+        pool = get_pool(self.directory)
+        with pool.service_connection() as conn:
+            pass
+        self.assertIs(get_pool(self.directory), pool)
+
+        self.directory.save()
+        rebuilt = get_pool(self.directory)
+
+        self.assertIsNot(rebuilt, pool)
+        self.assertTrue(conn.closed)
+        self.assertEqual(rebuilt.search_servers.keys(), pool.search_servers.keys())
+
+
+class CheckCredentialsTests(StandInDirectoryTestCase):
+
+    def test_valid_and_invalid_passwords(self):
+        pool = get_pool(self.directory)
+        user_dn = self.standin.user_dns[1]
+
+        self.assertTrue(pool.check_credentials(user_dn, STANDIN_PASSWORD))
+        self.assertFalse(pool.check_credentials(user_dn, 'senha-errada'))
+        # Senha vazia seria um bind anônimo aceito pelo AD
+        self.assertFalse(pool.check_credentials(user_dn, ''))
+
+    def test_bind_socket_is_reused(self):
+        pool = get_pool(self.directory)
+        with mock.patch.object(pool, '_open', wraps=pool._open) as open_socket:
+            pool.check_credentials(self.standin.user_dns[1], STANDIN_PASSWORD)
+            pool.check_credentials(self.standin.user_dns[2], STANDIN_PASSWORD)
+
+        self.assertEqual(open_socket.call_count, 1)
+        self.assertEqual(pool._bind_connections.qsize(), 1)
+
+    def test_dropped_bind_socket_is_replaced(self):
+        pool = get_pool(self.directory)
+        pool.check_credentials(self.standin.user_dns[1], STANDIN_PASSWORD)
+        conn, _ = pool._bind_connections.queue[0]
+        conn.unbind()
+
+        self.assertTrue(pool.check_credentials(self.standin.user_dns[1], STANDIN_PASSWORD))
+        self.assertEqual(pool._bind_connections.qsize(), 1)
+
+
+class StandInRangeTests(StandInDirectoryTestCase):
+    users = STANDIN_RANGE_STEP + 100
+
+    def populate(self):
+        self.standin.populate(self.users, groups=1, big_group_size=self.users)
+
+    def test_plain_member_read_returns_first_range(self):
+        with get_pool(self.directory).service_connection() as conn:
+            conn.search(self.standin.group_dns[0], '(objectClass=group)', search_scope='BASE', attributes=['member'])
+            # Como no AD: `member` vem vazio e só a primeira faixa é devolvida
+            sizes = {name: len(values) for name, values in conn.response[0]['raw_attributes'].items()}
+            self.assertEqual(sizes, {'member': 0, f'member;range=0-{STANDIN_RANGE_STEP - 1}': STANDIN_RANGE_STEP})
+
+            self.assertEqual(len(list(iter_member_dns(conn, self.standin.group_dns[0]))), self.users)
+
+
+@override_settings(CRYPTO_KEYS={1: 'chave-antiga', 2: 'chave-nova'}, CRYPTO_KEY_VERSION=2)
+class RotateCryptoKeyTests(TestCase):
+    column = 'adminpanel.LdapDirectory.bind_password_encrypted'
+
+    def directory(self, country_code, encrypted):
+        return LdapDirectory.objects.create(
+            country_code=country_code,
+            name=country_code,
+            ldap_server='dc.invalid',
+            base_dn='DC=test,DC=local',
+            bind_password_encrypted=encrypted,
+        )
+
+    def rotate(self, **options):
+        call_command('rotate_crypto_key', stdout=StringIO(), **options)
+
+    def stored(self, directory):
+        directory.refresh_from_db()
+        return directory.bind_password_encrypted
+
+    def test_legacy_and_old_versions_are_rewritten(self):
+        legacy = self.directory('BR', aes.encrypt('senha-legada'))
+        old = self.directory('AR', AESCipher().encrypt_versioned('senha-v1', 1))
+        empty = self.directory('MX', '')
+
+        self.rotate()
+
+        cipher = AESCipher()
+        self.assertEqual(key_version(self.stored(legacy)), 2)
+        self.assertEqual(cipher.decrypt_value(self.stored(legacy)), 'senha-legada')
+        self.assertEqual(cipher.decrypt_value(self.stored(old)), 'senha-v1')
+        self.assertEqual(self.stored(empty), '')
+
+    def test_dry_run_writes_nothing(self):
+        legacy = self.directory('BR', aes.encrypt('senha-legada'))
+        before = self.stored(legacy)
+
+        self.rotate(dry_run=True)
+
+        self.assertEqual(self.stored(legacy), before)
+
+    def test_unknown_version_fails_without_blocking_other_rows(self):
+        # Gravado com uma chave que já saiu de CRYPTO_KEYS
+        with override_settings(CRYPTO_KEYS={9: 'chave-removida'}, CRYPTO_KEY_VERSION=9):
+            unknown = AESCipher().encrypt_versioned('senha-v9', 9)
+        broken = self.directory('BR', unknown)
+        legacy = self.directory('AR', aes.encrypt('senha-legada'))
+
+        with self.assertRaises(CommandError):
+            self.rotate()
+
+        self.assertEqual(self.stored(broken), unknown)
+        self.assertEqual(key_version(self.stored(legacy)), 2)
+
+    def test_checkpoint_resumes_after_last_pk(self):
+        done = self.directory('BR', aes.encrypt('senha-br'))
+        pending = self.directory('AR', aes.encrypt('senha-ar'))
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        with open(path, 'w', encoding='utf-8') as checkpoint:
+            json.dump({'version': 2, 'columns': {self.column: done.pk}}, checkpoint)
+
+        self.rotate(checkpoint=path, batch_size=1)
+
+        self.assertEqual(key_version(self.stored(done)), 0)
+        self.assertEqual(key_version(self.stored(pending)), 2)
+        with open(path, encoding='utf-8') as checkpoint:
+            self.assertEqual(json.load(checkpoint)['columns'][self.column], pending.pk)
+
+    def test_unknown_target_version_is_refused(self):
+        with self.assertRaises(CommandError):
+            self.rotate(to_version=3)
+
+
+class ServerRoutingTests(SimpleTestCase):
+    urls = ['ldap://dc1.invalid:389', 'ldap://dc2.invalid:389', 'ldap://dc3.invalid:389']
+
+    def setUp(self):
+        # Estado de saúde e rodízio são por processo: cada teste começa limpo
+        for state in (ldap_health._health, ldap_health._rotation):
+            patcher = mock.patch.dict(state, clear=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def opener(self, down=()):
+        attempts = []
+
+        def open_one(url):
+            attempts.append(url)
+            if url in down:
+                raise LDAPCommunicationError(f'{url} fora do ar')
+            return url
+        return open_one, attempts
+
+    def test_failover_skips_unreachable_server(self):
+        open_one, attempts = self.opener(down={self.urls[0]})
+
+        self.assertEqual(open_with_failover(self.urls, open_one), self.urls[1])
+        self.assertEqual(attempts, self.urls[:2])
+        self.assertFalse(get_health(self.urls[0]).is_available)
+        self.assertTrue(get_health(self.urls[1]).is_available)
+
+    def test_quarantined_server_is_tried_last(self):
+        record_failure(self.urls[0], LDAPCommunicationError('timeout'))
+
+        self.assertEqual(ordered_servers(self.urls), self.urls[1:] + self.urls[:1])
+
+        # Se todos os outros falharem, o servidor em quarentena ainda é tentado
+        open_one, attempts = self.opener(down=set(self.urls[1:]))
+        self.assertEqual(open_with_failover(self.urls, open_one), self.urls[0])
+        self.assertEqual(attempts, self.urls[1:] + self.urls[:1])
+        self.assertTrue(get_health(self.urls[0]).is_available)
+
+    def test_quarantine_doubles_and_clears_on_success(self):
+        health = get_health(self.urls[0])
+        record_failure(self.urls[0], LDAPCommunicationError('timeout'))
+        first = health.down_until
+        record_failure(self.urls[0], LDAPCommunicationError('timeout'))
+
+        self.assertAlmostEqual(health.down_until - first, LDAP_SERVER_RETRY_SECONDS, delta=1)
+        self.assertEqual(health.consecutive_failures, 2)
+
+        record_success(self.urls[0], 5)
+        self.assertTrue(health.is_available)
+        self.assertEqual(health.consecutive_failures, 0)
+
+    def test_slow_servers_come_after_fast_ones(self):
+        record_success(self.urls[0], ldap_health.LDAP_SERVER_SLOW_MS * 4)
+        record_success(self.urls[1], ldap_health.LDAP_SERVER_SLOW_MS * 2)
+
+        self.assertEqual(ordered_servers(self.urls, FIRST), [self.urls[2], self.urls[1], self.urls[0]])
+
+    def test_round_robin_rotates_per_key(self):
+        firsts = [ordered_servers(self.urls, ROUND_ROBIN, 'BR')[0] for _ in range(4)]
+
+        self.assertEqual(firsts, self.urls + self.urls[:1])
+        self.assertEqual(ordered_servers(self.urls, ROUND_ROBIN, 'AR')[0], self.urls[0])
+
+    def test_all_servers_down_raises_last_error(self):
+        open_one, attempts = self.opener(down=set(self.urls))
+
+        with self.assertRaisesMessage(LDAPCommunicationError, self.urls[2]):
+            open_with_failover(self.urls, open_one)
+        self.assertEqual(attempts, self.urls)
+
+    def test_without_servers_raises_ldap_error(self):
+        open_one, attempts = self.opener()
+
+        with self.assertRaises(LDAPException):
+            open_with_failover([], open_one, rotation_key='BR')
+        self.assertEqual(attempts, [])
+
+
+class SecretCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = SecretCache(timeout=60, max_entries=2)
+        self.loader = mock.Mock(side_effect=lambda ciphertext: f'plain:{ciphertext}')
+        patcher = mock.patch('adminpanel.encryption.time.monotonic', return_value=1000.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hit_does_not_call_loader(self):
+        self.assertEqual(self.cache.get('a', 'c1', self.loader), 'plain:c1')
+        self.assertEqual(self.cache.get('a', 'c1', self.loader), 'plain:c1')
+
+        self.assertEqual(self.loader.call_count, 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.get('a', 'c1', self.loader)
+        self.cache.get('b', 'c2', self.loader)
+        self.cache.get('a', 'c1', self.loader)
+        self.cache.get('c', 'c3', self.loader)
+
+        self.assertEqual(list(self.cache._entries), ['a', 'c'])
+
+    def test_evicted_buffer_is_wiped(self):
+        self.cache.get('a', 'c1', self.loader)
+        buffer = self.cache._entries['a'][2]
+
+        self.cache.evict()
+
+        self.assertEqual(bytes(buffer), bytes(len(buffer)))
+        self.assertEqual(len(self.cache._entries), 0)
+
+    def test_entry_expires_after_timeout(self):
+        self.cache.get('a', 'c1', self.loader)
+        self.clock.return_value = 1061.0
+
+        self.cache.get('a', 'c1', self.loader)
+
+        self.assertEqual(self.loader.call_count, 2)
+
+    def test_changed_ciphertext_is_reloaded(self):
+        self.cache.get('a', 'c1', self.loader)
+
+        self.assertEqual(self.cache.get('a', 'c2', self.loader), 'plain:c2')
+        self.assertEqual(self.loader.call_count, 2)
+
+    def test_empty_secret_is_not_cached(self):
+        self.cache.get('a', '', mock.Mock(return_value=''))
+
+        self.assertEqual(len(self.cache._entries), 0)
+
+
+class CachedSecretModelTests(TestCase):
+
+    def setUp(self):
+        secret_cache.evict()
+        self.addCleanup(secret_cache.evict)
+        self.directory = LdapDirectory.objects.create(
+            country_code='BR',
+            name='BR',
+            ldap_server='dc.invalid',
+            base_dn='DC=test,DC=local',
+            bind_password_encrypted=aes.encrypt('senha-do-bind'),
+        )
+        self.smtp = SmtpConfiguration.objects.create(
+            name='SMTP',
+            host='smtp.invalid',
+            username='envio@test.local',
+            password_encrypted=aes.encrypt('senha-smtp'),
+            from_email='envio@test.local',
+        )
+
+    def cached_keys(self, instance):
+        return [key for key in secret_cache._entries
+                if key[0] == instance._meta.label_lower and key[1] == instance.pk]
+
+    def test_password_is_decrypted_once(self):
+        with mock.patch('adminpanel.models.aes.decrypt', wraps=aes.decrypt) as decrypt:
+            self.assertEqual(self.directory.get_password(), 'senha-do-bind')
+            self.assertEqual(LdapDirectory.objects.get(pk=self.directory.pk).get_password(), 'senha-do-bind')
+
+        self.assertEqual(decrypt.call_count, 1)
+
+    def test_update_invalidates_cached_password(self):
+        self.directory.get_password()
+
+        self.directory.set_password('senha-nova-do-bind')
+        self.directory.save()
+
+        self.assertEqual(LdapDirectory.objects.get(pk=self.directory.pk).get_password(), 'senha-nova-do-bind')
+
+    def test_unsaved_password_change_is_not_masked_by_cache(self):
+        self.directory.get_password()
+
+        self.directory.set_password('senha-nao-salva')
+
+        self.assertEqual(self.directory.get_password(), 'senha-nao-salva')
+
+    def test_delete_evicts_cached_passwords(self):
+        self.directory.get_password()
+        self.smtp.get_password()
+        self.assertEqual(len(self.cached_keys(self.directory)), 1)
+        self.assertEqual(len(self.cached_keys(self.smtp)), 1)
+        directory_pk, smtp_pk = self.directory.pk, self.smtp.pk
+
+        self.directory.delete()
+        self.smtp.delete()
+
+        self.assertEqual([key for key in secret_cache._entries if key[1] in (directory_pk, smtp_pk)], [])
@@ -0,0 +1,431 @@
+"""
+Métricas em memória, expostas no formato texto do Prometheus.
+
+Contadores, gauges e histogramas são agregados no próprio processo:
+registrar um evento custa um lock e algumas somas, sem I/O. O endpoint
+/metrics/ (core.views.metrics) serializa o estado atual.
+
+Vários processos (workers do gunicorn, run_sync_worker): com METRICS_DIR
+configurado, uma thread de cada processo grava o seu estado em
+METRICS_DIR/<pid>-<token>.json a cada METRICS_FLUSH_INTERVAL segundos e o
+/metrics/ soma os arquivos de todos os processos do host. Os arquivos de
+processos encerrados continuam somando contadores e histogramas, para que
+não diminuam; os gauges deles são ignorados (valor instantâneo de um
+processo que não existe mais). Limpe o diretório ao (re)iniciar o serviço.
+Sem METRICS_DIR, cada processo expõe apenas os próprios valores.
+
+Métricas que vêm do banco (ex.: sincronizações do AD, em ADSyncJob) são
+lidas no momento da coleta por funções registradas com register_collector.
+
+Rótulos devem ter poucos valores possíveis (país, DC, nome da view): nunca
+usuário, DN ou URL completa, ou o número de séries cresce sem limite.
+
+Usage:
+    LOGIN_ATTEMPTS.inc(country='BR', outcome='success')
+
+    with LDAP_OPERATION_SECONDS.time(operation='search', server=url):
+        conn.search(...)
+"""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Diretório compartilhado pelos processos do host (vazio = métricas por processo)
+METRICS_DIR = getattr(settings, 'METRICS_DIR', '')
+
+# Intervalo (segundos) entre as gravações do estado de cada processo em METRICS_DIR
+METRICS_FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+
+# Intervalos de gravação sem atualizar o arquivo após os quais os gauges dele são ignorados
+METRICS_GAUGE_STALE_INTERVALS = getattr(settings, 'METRICS_GAUGE_STALE_INTERVALS', 3)
+
+# Limites (segundos) dos histogramas de latência
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Limites do histograma de queries por requisição
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Metric:
+    """Base das métricas: valores indexados pela tupla de rótulos."""
+
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _changed(self):
+        _flusher.mark_dirty()
+
+    def snapshot(self):
+        """Cópia dos valores: [[rótulos], valor] (serializável em JSON)."""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merge(self, items):
+        """Soma os valores de um snapshot de outro processo."""
+        with self._lock:
+            for key, value in items:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0) + value
+
+    def empty_copy(self):
+        """Métrica igual, sem valores (usada na agregação entre processos)."""
+        copy = object.__new__(type(self))
+        copy.__dict__.update(self.__dict__)
+        copy._values = {}
+        copy._lock = threading.Lock()
+        return copy
+
+    def _label_text(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def samples(self):
+        """Linhas de exposição desta métrica (sem HELP/TYPE)."""
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{self._label_text(key)} {_format(value)}' for key, value in items]
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}'] + self.samples()
+
+
+class Counter(Metric):
+    """Valor que só cresce (eventos, linhas processadas)."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._changed()
+
+
+class Gauge(Metric):
+    """Valor instantâneo (última taxa, último horário)."""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+        self._changed()
+
+    def merge(self, items):
+        # Um valor instantâneo não se soma entre processos: vale o maior
+        with self._lock:
+            for key, value in items:
+                key = tuple(key)
+                self._values[key] = max(self._values.get(key, value), value)
+
+
+class Histogram(Metric):
+    """Distribuição de valores em faixas cumulativas (le), com soma e contagem."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [contagem por faixa (+Inf no fim), soma]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+        self._changed()
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+
+    def merge(self, items):
+        with self._lock:
+            for key, (counts, total) in items:
+                state = self._values.setdefault(tuple(key), [[0] * (len(self.buckets) + 1), 0.0])
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+
+    @contextmanager
+    def time(self, **labels):
+        """Observa a duração do bloco em segundos (inclusive se ele falhar)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format(bound)
+                lines.append(f'{self.name}_bucket{self._label_text(key, [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{self._label_text(key)} {_format(total)}')
+            lines.append(f'{self.name}_count{self._label_text(key)} {cumulative}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+# ============================================
+# Registro
+# ============================================
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _register(cls, name, *args, **kwargs):
+    """Retorna a métrica `name`, criando-a na primeira chamada."""
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Métrica {name} já registrada como {metric.kind}")
+        return metric
+
+
+def counter(name, help_text, labelnames=()):
+    return _register(Counter, name, help_text, labelnames)
+
+
+def gauge(name, help_text, labelnames=()):
+    return _register(Gauge, name, help_text, labelnames)
+
+
+def histogram(name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram, name, help_text, labelnames, buckets=buckets)
+
+
+_collectors = []
+
+
+def register_collector(func):
+    """
+    Registra uma função chamada a cada coleta, que devolve métricas (Metric)
+    montadas na hora, ex.: a partir do banco. Pode ser usada como decorator.
+    """
+    if func not in _collectors:
+        _collectors.append(func)
+    return func
+
+
+class _Flusher:
+    """Grava periodicamente o estado deste processo em METRICS_DIR."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._started = False
+        # Distingue processos com o mesmo pid em reinícios do serviço
+        self._token = uuid.uuid4().hex[:8]
+        # Após um fork (workers do gunicorn) a thread do processo pai não existe
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._started = False
+
+    @property
+    def path(self):
+        return os.path.join(METRICS_DIR, f'{os.getpid()}-{self._token}.json')
+
+    def mark_dirty(self):
+        if not METRICS_DIR:
+            return
+        self._dirty = True
+        if not self._started:
+            with self._lock:
+                if not self._started:
+                    self._started = True
+                    threading.Thread(target=self._run, name='metrics-flush', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        """
+        Grava o estado, se mudou desde a última gravação (escrita atômica).
+        Sem mudanças, só atualiza o mtime do arquivo: é ele que indica aos
+        demais processos que os gauges deste ainda valem.
+        """
+        if not METRICS_DIR:
+            return
+        if not self._dirty:
+            try:
+                os.utime(self.path)
+            except OSError:
+                # Nenhum evento ainda (sem arquivo) ou diretório indisponível
+                pass
+            return
+        self._dirty = False
+        with _registry_lock:
+            metrics = list(_registry.values())
+        data = {metric.name: metric.snapshot() for metric in metrics}
+        path = self.path
+        try:
+            with open(f'{path}.tmp', 'w') as handle:
+                json.dump(data, handle)
+            os.replace(f'{path}.tmp', path)
+        except OSError as e:
+            self._dirty = True
+            logger.warning(f"⚠️ Falha ao gravar métricas em {METRICS_DIR}: {str(e)}")
+
+
+_flusher = _Flusher()
+# Grava o que mudou desde a última gravação periódica
+atexit.register(_flusher.flush)
+
+
+def _is_live(path, now):
+    """
+    True se o processo que grava `path` (<pid>-<token>.json) ainda existe e
+    atualizou o arquivo nos últimos METRICS_GAUGE_STALE_INTERVALS intervalos.
+    """
+    try:
+        if now - os.path.getmtime(path) > METRICS_FLUSH_INTERVAL * METRICS_GAUGE_STALE_INTERVALS:
+            return False
+        pid = int(os.path.basename(path).split('-', 1)[0])
+    except (OSError, ValueError):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Processo existe, mas de outro usuário
+        pass
+    return True
+
+
+def _aggregate(metrics):
+    """
+    Soma o estado gravado por todos os processos em METRICS_DIR. Gauges de
+    processos encerrados ou parados (ver _is_live) ficam de fora.
+    """
+    _flusher.flush()
+    now = time.time()
+    merged = {metric.name: metric.empty_copy() for metric in metrics}
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+        try:
+            with open(path) as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            # Arquivo removido ou sendo substituído: entra na próxima coleta
+            continue
+        live = _is_live(path, now)
+        for name, items in data.items():
+            metric = merged.get(name)
+            if metric is None or (metric.kind == 'gauge' and not live):
+                continue
+            metric.merge(items)
+    # Este processo pode não ter gravado ainda (nenhum evento desde o início)
+    if not os.path.exists(_flusher.path):
+        for metric in metrics:
+            merged[metric.name].merge(metric.snapshot())
+    return list(merged.values())
+
+
+def render_metrics():
+    """
+    Serializa todas as métricas registradas (somadas entre os processos, com
+    METRICS_DIR) e as dos coletores.
+
+    Returns:
+        str: Texto no formato de exposição do Prometheus (version 0.0.4)
+    """
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda metric: metric.name)
+    if METRICS_DIR:
+        metrics = _aggregate(metrics)
+
+    for collector in _collectors:
+        try:
+            metrics.extend(collector())
+        except Exception as e:
+            logger.error(f"❌ Coletor de métricas {collector.__name__} falhou: {str(e)}")
+
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ============================================
+# Métricas da aplicação
+# ============================================
+
+# LDAP: abertura de socket, bind e busca, por DC (ldap_health.make_connection)
+LDAP_OPERATION_SECONDS = histogram(
+    'ldap_operation_seconds', 'Duração das operações LDAP', ['operation', 'server']
+)
+LDAP_OPERATION_ERRORS = counter(
+    'ldap_operation_errors_total', 'Operações LDAP que lançaram exceção', ['operation', 'server']
+)
+
+# Login de colaboradores (accounts.backends)
+LOGIN_ATTEMPTS = counter(
+    'auth_login_attempts_total', 'Tentativas de login LDAP por resultado', ['country', 'outcome']
+)
+LOGIN_SECONDS = histogram(
+    'auth_login_seconds', 'Duração do login LDAP', ['country']
+)
+
+# Sincronização do AD: lidas de ADSyncJob na coleta (access_control.jobs.sync_job_metrics)
+
+# Requisições HTTP e banco de dados por view (core.middleware.MetricsMiddleware)
+REQUEST_SECONDS = histogram(
+    'http_request_seconds', 'Duração das requisições por view', ['view']
+)
+REQUEST_DB_QUERIES = histogram(
+    'http_request_db_queries', 'Queries executadas por requisição', ['view'], buckets=QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = histogram(
+    'http_request_db_seconds', 'Tempo em queries por requisição', ['view']
+)
@@ -0,0 +1,38 @@
+"""
+Middleware de métricas das requisições.
+"""
+import time
+
+from .metrics import REQUEST_DB_QUERIES, REQUEST_DB_SECONDS, REQUEST_SECONDS
+from .querycount import QueryRecorder, check_query_budget, get_query_budget
+
+
+class MetricsMiddleware:
+    """
+    Registra, por view (nome da rota), a duração da requisição, a quantidade
+    de queries e o tempo gasto no banco (core.metrics).
+    Não depende de DEBUG: as queries são contadas com execute_wrapper.
+
+    Também confere o orçamento de queries da view (core.querycount) e deixa
+    o relatório em `request.query_report`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with recorder.installed():
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else '<unresolved>'
+        REQUEST_SECONDS.observe(elapsed, view=view)
+        REQUEST_DB_QUERIES.observe(recorder.count, view=view)
+        REQUEST_DB_SECONDS.observe(recorder.seconds, view=view)
+
+        request.query_report = recorder.report(view, get_query_budget(request))
+        check_query_budget(request.query_report)
+        return response
@@ -0,0 +1,277 @@
+"""
+Contagem de queries por requisição, detecção de N+1 e orçamentos por view.
+
+O QueryRecorder (execute_wrapper do Django, sem depender de DEBUG) conta as
+queries, soma o tempo gasto no banco e agrupa o SQL por "impressão digital"
+(literais e listas de IN normalizados): a mesma impressão repetida muitas
+vezes numa requisição é o sintoma de um N+1.
+
+As views declaram o seu orçamento com @query_budget. O MetricsMiddleware
+(core.middleware) grava o QueryReport em `request.query_report` e registra
+um aviso quando a view estoura o orçamento ou repete uma query
+QUERY_N_PLUS_ONE_THRESHOLD vezes; com QUERY_BUDGET_ENFORCE a requisição
+falha com QueryBudgetExceeded (desenvolvimento/CI).
+
+Nos testes, assert_query_budget(response) falha quando a view chamada pelo
+Client estourou o orçamento declarado, e assert_max_queries() limita um
+trecho de código qualquer.
+
+Usage:
+    @query_budget(max_queries=12, max_duplicates=2)
+    @login_required
+    @country_admin_required
+    def country_supplier_permissions(request):
+        ...
+
+    # Num TestCase
+    response = self.client.get(reverse('access_control:country_supplier_permissions'))
+    assert_query_budget(response)
+
+    with assert_max_queries(3):
+        get_country_stats('BR')
+"""
+
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Repetições da mesma query numa requisição que já indicam N+1 (sem orçamento declarado)
+QUERY_N_PLUS_ONE_THRESHOLD = getattr(settings, 'QUERY_N_PLUS_ONE_THRESHOLD', 10)
+
+# Estourar o orçamento falha a requisição (QueryBudgetExceeded) em vez de só registrar aviso
+QUERY_BUDGET_ENFORCE = getattr(settings, 'QUERY_BUDGET_ENFORCE', False)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)', re.IGNORECASE)
+_SPACES_RE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Uma view (ou trecho de código) executou mais queries que o orçamento."""
+
+
+def fingerprint(sql):
+    """
+    Normaliza o SQL para agrupar queries iguais com parâmetros diferentes.
+
+    Literais viram '?' e listas de IN de qualquer tamanho viram IN (...).
+
+    Args:
+        sql (str): SQL como enviado ao driver (com placeholders %s)
+
+    Returns:
+        str: Impressão digital da query
+    """
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACES_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """
+    execute_wrapper que conta as queries, soma o tempo no banco e guarda o SQL.
+
+    Usage:
+        recorder = QueryRecorder()
+        with recorder.installed():
+            ...
+        recorder.report()
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        # SQL bruto -> repetições (a normalização só acontece em report())
+        self._statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+            self._statements[sql] += 1
+
+    @contextmanager
+    def installed(self):
+        """Registra o recorder em todas as conexões de banco durante o bloco."""
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def report(self, view=None, budget=None):
+        """
+        Returns:
+            QueryReport: Resumo das queries gravadas
+        """
+        fingerprints = Counter()
+        for sql, count in self._statements.items():
+            fingerprints[fingerprint(sql)] += count
+        return QueryReport(view, self.count, self.seconds, fingerprints, budget)
+
+
+class QueryReport:
+    """
+    Queries de uma requisição (ou trecho de código) e o orçamento aplicado.
+
+    Attributes:
+        view (str): Nome da rota (ex.: 'access_control:country_supplier_permissions')
+        count (int): Queries executadas
+        seconds (float): Tempo total no banco
+        fingerprints (Counter): Impressão digital -> repetições
+        budget (QueryBudget): Orçamento declarado, ou None
+    """
+
+    def __init__(self, view, count, seconds, fingerprints, budget=None):
+        self.view = view
+        self.count = count
+        self.seconds = seconds
+        self.fingerprints = fingerprints
+        self.budget = budget
+
+    @property
+    def duplicates(self):
+        """Queries repetidas, da mais repetida para a menos: [(impressão, vezes)]."""
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count > 1]
+
+    @property
+    def max_repeats(self):
+        """Maior número de execuções de uma mesma query."""
+        return max(self.fingerprints.values(), default=0)
+
+    def violations(self):
+        """
+        Returns:
+            list[str]: Motivos do estouro (vazia se dentro do orçamento). Sem
+                max_duplicates, acusa a query repetida QUERY_N_PLUS_ONE_THRESHOLD vezes
+        """
+        problems = []
+        budget = self.budget or QueryBudget()
+
+        if budget.max_queries is not None and self.count > budget.max_queries:
+            problems.append(f"{self.count} queries (orçamento: {budget.max_queries})")
+
+        # Repetições além da primeira execução de cada query
+        if budget.max_duplicates is not None:
+            if self.max_repeats - 1 > budget.max_duplicates:
+                problems.append(
+                    f"query repetida {self.max_repeats} vezes (orçamento: {budget.max_duplicates} repetições)"
+                )
+        elif self.max_repeats >= QUERY_N_PLUS_ONE_THRESHOLD:
+            problems.append(f"query repetida {self.max_repeats} vezes (possível N+1)")
+        return problems
+
+    def describe(self, limit=5):
+        """Texto com o resumo e as queries mais repetidas (mensagens de log/teste)."""
+        lines = [f"{self.view or 'bloco'}: {self.count} queries em {self.seconds * 1000:.1f} ms"]
+        for sql, count in self.duplicates[:limit]:
+            lines.append(f"  {count}x {sql[:300]}")
+        return '\n'.join(lines)
+
+
+class QueryBudget:
+    """Orçamento de uma view: máximo de queries e de repetições da mesma query."""
+
+    def __init__(self, max_queries=None, max_duplicates=None):
+        self.max_queries = max_queries
+        self.max_duplicates = max_duplicates
+
+    def __repr__(self):
+        return f"QueryBudget(max_queries={self.max_queries}, max_duplicates={self.max_duplicates})"
+
+
+def query_budget(max_queries=None, max_duplicates=None):
+    """
+    Declara o orçamento de queries de uma view.
+
+    Deve ser o decorator mais externo: os decorators de permissão de
+    access_control.views não copiam atributos da função decorada.
+
+    Args:
+        max_queries (int): Máximo de queries por requisição (None = sem limite)
+        max_duplicates (int): Máximo de repetições de uma mesma query, além da
+            primeira execução (0 = nenhuma query repetida)
+    """
+    budget = QueryBudget(max_queries, max_duplicates)
+
+    def decorator(view_func):
+        view_func.query_budget = budget
+        return view_func
+    return decorator
+
+
+def get_query_budget(request):
+    """Orçamento declarado na view resolvida para a requisição, ou None."""
+    match = getattr(request, 'resolver_match', None)
+    return getattr(match.func, 'query_budget', None) if match else None
+
+
+def check_query_budget(report):
+    """
+    Registra (ou, com QUERY_BUDGET_ENFORCE, lança) o estouro de orçamento.
+
+    Raises:
+        QueryBudgetExceeded: Se QUERY_BUDGET_ENFORCE e houver violação
+    """
+    problems = report.violations()
+    if not problems:
+        return
+    message = f"{'; '.join(problems)}\n{report.describe()}"
+    if QUERY_BUDGET_ENFORCE:
+        raise QueryBudgetExceeded(message)
+    logger.warning(f"⚠️ Orçamento de queries excedido: {message}")
+
+
+# ============================================
+# Helpers de teste
+# ============================================
+
+def assert_query_budget(response):
+    """
+    Falha se a requisição feita pelo Client de testes estourou o orçamento.
+
+    Args:
+        response: Resposta do django.test.Client (precisa do MetricsMiddleware)
+
+    Returns:
+        QueryReport: Relatório da requisição (para asserts adicionais)
+
+    Raises:
+        QueryBudgetExceeded: Se a view excedeu o orçamento ou tem N+1
+    """
+    report = getattr(response.wsgi_request, 'query_report', None)
+    if report is None:
+        raise AssertionError("Requisição sem query_report: core.middleware.MetricsMiddleware está ativo?")
+    problems = report.violations()
+    if problems:
+        raise QueryBudgetExceeded(f"{'; '.join(problems)}\n{report.describe()}")
+    return report
+
+
+@contextmanager
+def assert_max_queries(max_queries=None, max_duplicates=None):
+    """
+    Falha se o bloco executar mais queries que o orçamento.
+
+    Usage:
+        with assert_max_queries(3, max_duplicates=0) as recorder:
+            ...
+    """
+    recorder = QueryRecorder()
+    with recorder.installed():
+        yield recorder
+    report = recorder.report(budget=QueryBudget(max_queries, max_duplicates))
+    problems = report.violations()
+    if problems:
+        raise QueryBudgetExceeded(f"{'; '.join(problems)}\n{report.describe()}")
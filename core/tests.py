@@ -1,3 +1,177 @@
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
 from django.test import TestCase
+from django.utils import timezone
+
+from access_control.jobs import AD_SYNC_METRICS_WINDOW
+from access_control.models import ADSyncJob
+from core import metrics
+from core.metrics import render_metrics
+from core.querycount import QueryBudgetExceeded, assert_max_queries, fingerprint
+
+
+class MetricsAggregationTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        patcher = mock.patch.object(metrics, 'METRICS_DIR', self.directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sample(self, text, line_start):
+        return [line for line in text.splitlines() if line.startswith(line_start)]
+
+    def test_values_of_other_processes_are_summed(self):
+        labels = {'country': 'ZZ', 'outcome': 'success'}
+        before = metrics.LOGIN_ATTEMPTS.snapshot()
+        local = dict((tuple(key), value) for key, value in before).get(('ZZ', 'success'), 0)
+
+        with open(os.path.join(self.directory.name, '999-other.json'), 'w') as handle:
+            json.dump({
+                'auth_login_attempts_total': [[['ZZ', 'success'], 5]],
+                'auth_login_seconds': [[['ZZ'], [[1] + [0] * len(metrics.LATENCY_BUCKETS), 0.004]]],
+            }, handle)
+        metrics.LOGIN_ATTEMPTS.inc(**labels)
+        metrics.LOGIN_SECONDS.observe(0.02, country='ZZ')
+
+        text = render_metrics()
+
+        self.assertEqual(
+            self.sample(text, 'auth_login_attempts_total{country="ZZ"'),
+            [f'auth_login_attempts_total{{country="ZZ",outcome="success"}} {local + 6}'],
+        )
+        self.assertIn('auth_login_seconds_bucket{country="ZZ",le="0.005"} 1', text)
+        self.assertIn('auth_login_seconds_count{country="ZZ"} 2', text)
+        # O estado deste processo foi gravado para os demais
+        self.assertEqual(len(os.listdir(self.directory.name)), 2)
+
+    @staticmethod
+    def kill_only_this_process(pid, signal):
+        if pid != os.getpid():
+            raise ProcessLookupError(pid)
+
+    def write_gauge(self, gauge, filename, value, age=0):
+        path = os.path.join(self.directory.name, filename)
+        with open(path, 'w') as handle:
+            json.dump({gauge.name: [[['ZZ'], value]]}, handle)
+        if age:
+            modified = time.time() - age
+            os.utime(path, (modified, modified))
+
+    def test_gauges_of_dead_or_stale_processes_are_ignored(self):
+        gauge = metrics.gauge('test_aggregation_gauge', 'Gauge de teste', ['country'])
+        self.addCleanup(metrics._registry.pop, gauge.name)
+        gauge.set(1, country='ZZ')
+        stale_age = metrics.METRICS_FLUSH_INTERVAL * metrics.METRICS_GAUGE_STALE_INTERVALS + 1
+
+        with mock.patch('core.metrics.os.kill', side_effect=self.kill_only_this_process):
+            self.write_gauge(gauge, '999-dead.json', 7)
+            self.assertIn('test_aggregation_gauge{country="ZZ"} 1', render_metrics())
+
+        self.write_gauge(gauge, f'{os.getpid()}-stale.json', 8, age=stale_age)
+        self.assertIn('test_aggregation_gauge{country="ZZ"} 1', render_metrics())
+
+        self.write_gauge(gauge, f'{os.getpid()}-live.json', 9)
+        self.assertIn('test_aggregation_gauge{country="ZZ"} 9', render_metrics())
+
+    def test_counters_of_dead_processes_keep_counting(self):
+        before = dict((tuple(key), value) for key, value in metrics.LOGIN_ATTEMPTS.snapshot())
+        with open(os.path.join(self.directory.name, '999-dead.json'), 'w') as handle:
+            json.dump({'auth_login_attempts_total': [[['ZZ', 'failure'], 4]]}, handle)
+
+        with mock.patch('core.metrics.os.kill', side_effect=self.kill_only_this_process):
+            text = render_metrics()
+
+        expected = before.get(('ZZ', 'failure'), 0) + 4
+        self.assertIn(f'auth_login_attempts_total{{country="ZZ",outcome="failure"}} {expected}', text)
+
+    def test_idle_flush_refreshes_mtime(self):
+        metrics.LOGIN_ATTEMPTS.inc(country='ZZ', outcome='success')
+        metrics._flusher.flush()
+        path = metrics._flusher.path
+        os.utime(path, (0, 0))
+
+        metrics._flusher.flush()
+
+        self.assertGreater(os.path.getmtime(path), 0)
+
+
+class SyncJobMetricsTests(TestCase):
+
+    def test_sync_metrics_come_from_jobs(self):
+        finished = timezone.now()
+        ADSyncJob.objects.create(
+            country_code='BR', job_type='all', status='success',
+            started_at=finished - timedelta(seconds=40), finished_at=finished,
+            result={'users': {'mode': 'incremental', 'created': 2, 'updated': 3, 'unchanged': 5},
+                    'groups': {'created': 1, 'updated': 0, 'unchanged': 9}},
+        )
+        ADSyncJob.objects.create(country_code='BR', job_type='users', status='failed', finished_at=finished)
+        ADSyncJob.objects.create(country_code='AR', job_type='users')
+
+        with self.assertNumQueries(3):
+            text = render_metrics()
+
+        self.assertIn('ad_sync_jobs_recent{country="BR",job_type="all",status="success"} 1', text)
+        self.assertIn('ad_sync_jobs_recent{country="BR",job_type="users",status="failed"} 1', text)
+        self.assertIn('ad_sync_last_duration_seconds{country="BR",job_type="all"} 40.0', text)
+        self.assertIn('ad_sync_last_rows{country="BR",kind="users",mode="incremental"} 10', text)
+        self.assertIn('ad_sync_last_rows{country="BR",kind="groups",mode="full"} 10', text)
+        self.assertIn('ad_sync_jobs_active{country="AR",status="pending"} 1', text)
+
+    def test_jobs_outside_the_window_are_not_read(self):
+        old = timezone.now() - AD_SYNC_METRICS_WINDOW - timedelta(hours=1)
+        ADSyncJob.objects.create(
+            country_code='AR', job_type='all', status='success', started_at=old, finished_at=old,
+            result={'users': {'created': 1}},
+        )
+        ADSyncJob.objects.create(country_code='BR', job_type='all', status='success', finished_at=timezone.now())
+
+        text = render_metrics()
+
+        self.assertIn('ad_sync_jobs_recent{country="BR",job_type="all",status="success"} 1', text)
+        self.assertNotIn('country="AR"', text)
+
+
+class FingerprintTests(TestCase):
+
+    def test_literals_become_placeholders(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE name = 'O''Brien' AND id = 42 AND score > 1.5"),
+            "SELECT * FROM t WHERE name = ? AND id = ? AND score > ?",
+        )
+
+    def test_in_lists_of_any_size_match(self):
+        short = fingerprint('SELECT * FROM t WHERE id IN (%s, %s)')
+        long = fingerprint('SELECT * FROM t WHERE id IN (%s,%s,%s,%s)')
+
+        self.assertEqual(short, 'SELECT * FROM t WHERE id IN (...)')
+        self.assertEqual(short, long)
+
+    def test_whitespace_is_collapsed(self):
+        self.assertEqual(
+            fingerprint('  SELECT *\n  FROM t\tWHERE id = %s  '),
+            'SELECT * FROM t WHERE id = %s',
+        )
+
+    def test_identifiers_with_digits_are_kept(self):
+        self.assertEqual(fingerprint('SELECT col1 FROM t2'), 'SELECT col1 FROM t2')
+
+
+class MaxQueriesTests(TestCase):
+
+    def test_repeated_query_exceeds_duplicate_budget(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with assert_max_queries(max_duplicates=1):
+                for pk in range(3):
+                    ADSyncJob.objects.filter(pk=pk).exists()
 
-# Create your tests here.
+    def test_block_within_budget(self):
+        with assert_max_queries(2):
+            ADSyncJob.objects.filter(pk=1).exists()
@@ -1,3 +1,29 @@
-from django.shortcuts import render
+"""
+Views gerais do projeto.
+"""
 
-# Create your views here.
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+from .metrics import render_metrics
+
+# Token do coletor (header "Authorization: Bearer <token>"); vazio = só superusuários logados
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', '')
+
+
+@require_GET
+def metrics(request):
+    """
+    Endpoint de coleta do Prometheus: métricas de todos os processos do host
+    (com METRICS_DIR) e as de sincronização do AD, lidas do banco.
+
+    Acesso com o token METRICS_TOKEN ou por um superusuário autenticado.
+    """
+    header = request.headers.get('Authorization', '')
+    token_ok = bool(METRICS_TOKEN) and constant_time_compare(header, f'Bearer {METRICS_TOKEN}')
+    if not token_ok and not request.user.is_superuser:
+        return HttpResponseForbidden()
+
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
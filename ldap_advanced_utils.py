@@ -3,12 +3,47 @@ Utilitários avançados para Active Directory - SupplyConnect
 Funções para listar Grupos, OUs (Organizational Units) e Usuários do AD
 """
 
-from ldap3 import Server, Connection, ALL, SUBTREE
+from ldap3 import ALL, SUBTREE, BASE
 from ldap3.core.exceptions import LDAPException
+from ldap3.utils.conv import escape_filter_chars
+from ldap3.utils.dn import parse_dn
 import logging
+import re
+import time
+from contextlib import contextmanager
+
+from adminpanel.ldap_health import make_connection, make_server, open_with_failover, probe_directory
+from adminpanel.ldap_pool import CONNECT_TIMEOUT, RECEIVE_TIMEOUT
 
 logger = logging.getLogger(__name__)
 
+# Controle LDAP_SERVER_SHOW_DELETED_OID (permite ler tombstones do AD)
+SHOW_DELETED_CONTROL = ('1.2.840.113556.1.4.417', True, None)
+
+# Tamanho de página das buscas paginadas (deve ser <= MaxPageSize do AD)
+PAGE_SIZE = 500
+
+# Quantidade de DNs por filtro OR na resolução de membros de grupos
+MEMBER_BATCH_SIZE = 100
+
+# Tamanho da faixa pedida em buscas com ranged retrieval (member;range=...)
+MEMBER_RANGE_STEP = 1500
+
+# Atributos lidos para cada membro de grupo
+MEMBER_ATTRIBUTES = ['cn', 'name', 'mail', 'sAMAccountName']
+
+# Atributos de usuário lidos na sincronização
+AD_USER_ATTRIBUTES = [
+    "sAMAccountName",
+    "displayName",
+    "givenName",
+    "sn",
+    "mail",
+    "department",
+    "title",
+    "userAccountControl",
+]
+
 
 class ADConnection:
     """
@@ -33,24 +68,29 @@ class ADConnection:
         Returns:
             bool: True se conectou com sucesso, False caso contrário
         """
-        try:
-            # Criar servidor
-            self.server = Server(
-                self.ldap_config.ldap_server,
-                port=self.ldap_config.port,
-                get_info=ALL,
-                use_ssl=self.ldap_config.use_ssl
-            )
-            
-            # Criar conexão
-            self.connection = Connection(
-                self.server,
+        password = self.ldap_config.get_password()
+        
+        def open_one(url):
+            server = make_server(url, get_info=ALL, connect_timeout=CONNECT_TIMEOUT)
+            return make_connection(
+                server,
                 user=self.ldap_config.bind_user_dn,
-                password=self.ldap_config.get_password(),
-                auto_bind=True
+                password=password,
+                auto_bind=True,
+                receive_timeout=RECEIVE_TIMEOUT
             )
+        
+        try:
+            # Primeiro DC saudável (failover entre os servidores do diretório)
+            self.connection = open_with_failover(
+                self.ldap_config.get_connection_strings(),
+                open_one,
+                strategy=self.ldap_config.server_pool_strategy,
+                rotation_key=self.ldap_config.country_code
+            )
+            self.server = self.connection.server
             
-            logger.info(f"✅ Conectado ao AD: {self.ldap_config.ldap_server}")
+            logger.info(f"✅ Conectado ao AD: {self.server.name}")
             return True
             
         except LDAPException as e:
@@ -73,9 +113,150 @@ class ADConnection:
         self.disconnect()
 
 
+@contextmanager
+def directory_connection(ldap_config, connection=None):
+    """
+    Conexão com o AD para uma ou mais buscas.
+
+    Usa `connection` quando informada (o chamador a fecha); senão abre uma
+    nova com ADConnection, fechada ao final do bloco.
+
+    Usage:
+        with directory_connection(ldap_config) as conn:
+            highest_usn, server_name = get_sync_watermark(ldap_config, conn)
+            users = iter_ad_users(ldap_config, highest_usn, connection=conn)
+    """
+    if connection is not None:
+        yield connection
+        return
+    with ADConnection(ldap_config) as ad:
+        if not ad.connection:
+            raise LDAPException("Não foi possível conectar ao servidor AD")
+        yield ad.connection
+
+
+def _attr(attributes, name, default=''):
+    """
+    Lê um atributo de uma resposta de paged_search como string.
+    Atributos multivalorados retornam o primeiro valor; ausentes retornam `default`.
+    """
+    value = attributes.get(name)
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else None
+    if value is None or value == '':
+        return default
+    return str(value)
+
+
+def _attr_list(attributes, name):
+    """Lê um atributo multivalorado de uma resposta de paged_search como lista de strings."""
+    value = attributes.get(name)
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+def paged_search(connection, search_base, search_filter, attributes, search_scope=SUBTREE,
+                 controls=None, page_size=PAGE_SIZE):
+    """
+    Busca paginada (controle Simple Paged Results) em forma de gerador.
+
+    O AD trunca buscas não paginadas em MaxPageSize (1000 por padrão);
+    aqui as páginas são pedidas sob demanda e cada entrada é entregue
+    assim que a página chega, sem materializar o resultado completo.
+
+    Yields:
+        tuple: (dn: str, attributes: dict)
+    """
+    for item in connection.extend.standard.paged_search(
+        search_base=search_base,
+        search_filter=search_filter,
+        search_scope=search_scope,
+        attributes=attributes,
+        controls=controls,
+        paged_size=page_size,
+        generator=True
+    ):
+        # Ignora referências (searchResRef)
+        if item.get('type') != 'searchResEntry':
+            continue
+        yield item['dn'], item['attributes']
+
+
+def batched(iterable, size):
+    """
+    Agrupa um iterável em listas de até `size` itens.
+
+    Usage:
+        for batch in batched(iter_ad_users(config), 500):
+            ...
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_ad_groups(ldap_config, search_base=None):
+    """
+    Percorre todos os grupos do Active Directory com busca paginada.
+    
+    Args:
+        ldap_config: Configuração do LDAP (objeto LdapDirectory)
+        search_base: Base DN para busca (opcional, usa base_dn se não especificado)
+    
+    Grupos com mais de MaxValRange (1500) membros vêm com `member` vazio e
+    só a primeira faixa (`member;range=0-1499`); só nesses casos todos os
+    DNs são lidos com ranged retrieval. Sem `member`, o grupo está vazio.
+
+    Yields:
+        dict: {'dn': '...', 'name': '...', 'description': '...', 'member_count': 0, 'members': [...]}
+    """
+    with ADConnection(ldap_config) as ad:
+        if not ad.connection:
+            raise LDAPException("Não foi possível conectar ao servidor AD")
+        
+        # Define base de busca
+        base = search_base or ldap_config.base_dn
+        
+        # Atributos que queremos retornar
+        attributes = [
+            'cn',              # Nome comum
+            'name',            # Nome
+            'description',     # Descrição
+            'distinguishedName',  # DN completo
+            'member',          # Membros do grupo
+            'objectClass',     # Classes do objeto
+            'sAMAccountName'   # Nome da conta SAM
+        ]
+        
+        # objectClass=group para grupos do AD
+        for dn, attrs in paged_search(ad.connection, base, '(objectClass=group)', attributes):
+            members = _attr_list(attrs, 'member')
+            if any(_RANGE_RE.match(name) for name in attrs):
+                # O gerador da busca paginada guarda a página atual: outra
+                # busca na mesma conexão não interfere nele
+                members = list(iter_member_dns(ad.connection, dn))
+            yield {
+                'dn': _attr(attrs, 'distinguishedName', dn),
+                'name': _attr(attrs, 'cn') or _attr(attrs, 'name'),
+                'sam_account': _attr(attrs, 'sAMAccountName'),
+                'description': _attr(attrs, 'description'),
+                'member_count': len(members),
+                'members': members
+            }
+
+
 def list_ad_groups(ldap_config, search_base=None):
     """
     Lista todos os grupos do Active Directory.
+    Para diretórios grandes prefira `iter_ad_groups`, que não carrega tudo em memória.
     
     Args:
         ldap_config: Configuração do LDAP (objeto LdapDirectory)
@@ -88,49 +269,8 @@ def list_ad_groups(ldap_config, search_base=None):
     groups = []
     
     try:
-        with ADConnection(ldap_config) as ad:
-            if not ad.connection:
-                return groups
-            
-            # Define base de busca
-            base = search_base or ldap_config.base_dn
-            
-            # Filtro para buscar grupos
-            # objectClass=group para grupos do AD
-            search_filter = '(objectClass=group)'
-            
-            # Atributos que queremos retornar
-            attributes = [
-                'cn',              # Nome comum
-                'name',            # Nome
-                'description',     # Descrição
-                'distinguishedName',  # DN completo
-                'member',          # Membros do grupo
-                'objectClass',     # Classes do objeto
-                'sAMAccountName'   # Nome da conta SAM
-            ]
-            
-            # Realizar busca
-            ad.connection.search(
-                search_base=base,
-                search_filter=search_filter,
-                search_scope=SUBTREE,
-                attributes=attributes
-            )
-            
-            # Processar resultados
-            for entry in ad.connection.entries:
-                group_info = {
-                    'dn': str(entry.distinguishedName),
-                    'name': str(entry.cn) if hasattr(entry, 'cn') else str(entry.name),
-                    'sam_account': str(entry.sAMAccountName) if hasattr(entry, 'sAMAccountName') else '',
-                    'description': str(entry.description) if hasattr(entry, 'description') else '',
-                    'member_count': len(entry.member) if hasattr(entry, 'member') else 0,
-                    'members': [str(m) for m in entry.member] if hasattr(entry, 'member') else []
-                }
-                groups.append(group_info)
-            
-            logger.info(f"✅ Encontrados {len(groups)} grupos no AD")
+        groups = list(iter_ad_groups(ldap_config, search_base))
+        logger.info(f"✅ Encontrados {len(groups)} grupos no AD")
     
     except LDAPException as e:
         logger.error(f"❌ Erro ao listar grupos do AD: {str(e)}")
@@ -140,6 +280,47 @@ def list_ad_groups(ldap_config, search_base=None):
     return groups
 
 
+def iter_organizational_units(ldap_config, search_base=None):
+    """
+    Percorre todas as Organizational Units (OUs) do Active Directory com busca paginada.
+    
+    Args:
+        ldap_config: Configuração do LDAP (objeto LdapDirectory)
+        search_base: Base DN para busca (opcional, usa base_dn se não especificado)
+    
+    Yields:
+        dict: {'dn': '...', 'name': '...', 'description': '...', 'path': '...', 'level': 0}
+    """
+    with ADConnection(ldap_config) as ad:
+        if not ad.connection:
+            raise LDAPException("Não foi possível conectar ao servidor AD")
+        
+        # Define base de busca
+        base = search_base or ldap_config.base_dn
+        
+        # Atributos que queremos retornar
+        attributes = [
+            'ou',              # Nome da OU
+            'name',            # Nome
+            'description',     # Descrição
+            'distinguishedName'  # DN completo
+        ]
+        
+        for entry_dn, attrs in paged_search(ad.connection, base, '(objectClass=organizationalUnit)', attributes):
+            # Extrair caminho hierárquico da OU
+            dn = _attr(attrs, 'distinguishedName', entry_dn)
+            path_parts = dn.split(',')
+            path = ' > '.join([p.split('=')[1] for p in path_parts if p.startswith('OU=')])
+            
+            yield {
+                'dn': dn,
+                'name': _attr(attrs, 'ou') or _attr(attrs, 'name'),
+                'description': _attr(attrs, 'description'),
+                'path': path,
+                'level': len([p for p in path_parts if p.startswith('OU=')])
+            }
+
+
 def list_organizational_units(ldap_config, search_base=None):
     """
     Lista todas as Organizational Units (OUs) do Active Directory.
@@ -155,52 +336,12 @@ def list_organizational_units(ldap_config, search_base=None):
     ous = []
     
     try:
-        with ADConnection(ldap_config) as ad:
-            if not ad.connection:
-                return ous
-            
-            # Define base de busca
-            base = search_base or ldap_config.base_dn
-            
-            # Filtro para buscar OUs
-            search_filter = '(objectClass=organizationalUnit)'
-            
-            # Atributos que queremos retornar
-            attributes = [
-                'ou',              # Nome da OU
-                'name',            # Nome
-                'description',     # Descrição
-                'distinguishedName'  # DN completo
-            ]
-            
-            # Realizar busca
-            ad.connection.search(
-                search_base=base,
-                search_filter=search_filter,
-                search_scope=SUBTREE,
-                attributes=attributes
-            )
-            
-            # Processar resultados
-            for entry in ad.connection.entries:
-                # Extrair caminho hierárquico da OU
-                dn = str(entry.distinguishedName)
-                path_parts = dn.split(',')
-                path = ' > '.join([p.split('=')[1] for p in path_parts if p.startswith('OU=')])
-                
-                ou_info = {
-                    'dn': dn,
-                    'name': str(entry.ou) if hasattr(entry, 'ou') else str(entry.name),
-                    'description': str(entry.description) if hasattr(entry, 'description') else '',
-                    'path': path,
-                    'level': len([p for p in path_parts if p.startswith('OU=')])
-                }
-                ous.append(ou_info)
-            
-            # Ordenar por nível hierárquico
-            ous.sort(key=lambda x: (x['level'], x['name']))
-            
-            logger.info(f"✅ Encontradas {len(ous)} OUs no AD")
+        ous = list(iter_organizational_units(ldap_config, search_base))
+        
+        # Ordenar por nível hierárquico
+        ous.sort(key=lambda x: (x['level'], x['name']))
+        
+        logger.info(f"✅ Encontradas {len(ous)} OUs no AD")
     
     except LDAPException as e:
         logger.error(f"❌ Erro ao listar OUs do AD: {str(e)}")
@@ -229,28 +370,172 @@ def get_ou_users_count(ldap_config, ou_dn):
             # Filtro para buscar usuários
             search_filter = '(&(objectClass=user)(objectCategory=person))'
             
-            # Buscar apenas na OU específica (SCOPE_ONELEVEL = apenas nível atual)
-            ad.connection.search(
-                search_base=ou_dn,
-                search_filter=search_filter,
-                search_scope=SUBTREE,
-                attributes=['cn']
-            )
-            
-            return len(ad.connection.entries)
+            # Busca paginada: contagens acima de 1000 não são truncadas
+            return sum(1 for _ in paged_search(ad.connection, ou_dn, search_filter, ['cn']))
     
     except Exception as e:
         logger.error(f"❌ Erro ao contar usuários na OU: {str(e)}")
         return 0
 
 
-def get_group_members(ldap_config, group_dn):
+class DNCache:
+    """
+    Cache de curta duração DN -> valor, compartilhado entre chamadas de uma
+    mesma sincronização (um usuário costuma estar em vários grupos): atributos
+    do AD em get_group_members, id do ADUser em reconcile_memberships.
+
+    Usage:
+        cache = DNCache(ttl=300)
+        for group in groups:
+            members = get_group_members(config, group['dn'], cache=cache)
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._data = {}
+
+    @staticmethod
+    def _key(dn):
+        # DNs do AD não diferenciam maiúsculas/minúsculas
+        return dn.lower()
+
+    def get(self, dn):
+        item = self._data.get(self._key(dn))
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[self._key(dn)]
+            return None
+        return value
+
+    def set(self, dn, value):
+        self._data[self._key(dn)] = (value, time.monotonic() + self.ttl)
+
+    def __len__(self):
+        return len(self._data)
+
+
+_RANGE_RE = re.compile(r'^member;range=(\d+)-(\*|\d+)$', re.IGNORECASE)
+
+
+def iter_member_dns(connection, group_dn, step=MEMBER_RANGE_STEP):
+    """
+    Percorre os DNs do atributo `member` de um grupo usando ranged retrieval.
+
+    O AD devolve no máximo MaxValRange (1500) valores por leitura, no atributo
+    `member;range=0-1499`; as faixas seguintes são pedidas até o fim ('*').
+
+    Yields:
+        str: DN de cada membro
+    """
+    start = 0
+    requested = f'member;range={start}-{start + step - 1}'
+    while True:
+        connection.search(
+            search_base=group_dn,
+            search_filter='(objectClass=group)',
+            search_scope=BASE,
+            attributes=[requested]
+        )
+        if not connection.response:
+            return
+
+        attributes = connection.response[0].get('raw_attributes') or {}
+        ranged_name = None
+        for name in attributes:
+            if name.lower() == 'member' or _RANGE_RE.match(name):
+                ranged_name = name
+                break
+
+        values = attributes.get(ranged_name) if ranged_name else None
+        if not values:
+            # Servidor sem suporte a faixas: uma última leitura do atributo inteiro
+            if start == 0 and requested != 'member':
+                requested = 'member'
+                continue
+            return
+
+        for value in values:
+            yield value.decode('utf-8') if isinstance(value, bytes) else str(value)
+
+        match = _RANGE_RE.match(ranged_name)
+        # Sem faixa (grupo pequeno) ou última faixa ('*'): terminou
+        if not match or match.group(2) == '*':
+            return
+        start = int(match.group(2)) + 1
+        requested = f'member;range={start}-{start + step - 1}'
+
+
+def _member_info(dn, attrs):
+    return {
+        'dn': dn,
+        'name': _attr(attrs, 'cn'),
+        'username': _attr(attrs, 'sAMAccountName'),
+        'email': _attr(attrs, 'mail')
+    }
+
+
+def resolve_member_dns(connection, ldap_config, member_dns, cache=None):
+    """
+    Resolve vários DNs de uma vez, com buscas paginadas filtradas por
+    (|(distinguishedName=...)(distinguishedName=...)) em lotes.
+
+    DNs fora da base de busca (ex.: foreign security principals) são
+    resolvidos individualmente como último recurso.
+
+    Returns:
+        dict: {dn_em_minúsculas: {'dn', 'name', 'username', 'email'}}
+    """
+    cache = cache if cache is not None else DNCache()
+    resolved = {}
+    pending = []
+
+    for dn in member_dns:
+        cached = cache.get(dn)
+        if cached is not None:
+            resolved[dn.lower()] = cached
+        else:
+            pending.append(dn)
+
+    for chunk in batched(pending, MEMBER_BATCH_SIZE):
+        search_filter = '(|' + ''.join(
+            f'(distinguishedName={escape_filter_chars(dn)})' for dn in chunk
+        ) + ')'
+        for dn, attrs in paged_search(connection, ldap_config.base_dn, search_filter, MEMBER_ATTRIBUTES):
+            info = _member_info(dn, attrs)
+            cache.set(dn, info)
+            resolved[dn.lower()] = info
+
+    # Último recurso: DNs que não estão sob base_dn
+    for dn in pending:
+        if dn.lower() in resolved:
+            continue
+        connection.search(
+            search_base=dn,
+            search_filter='(objectClass=*)',
+            search_scope=BASE,
+            attributes=MEMBER_ATTRIBUTES
+        )
+        if connection.response and connection.response[0].get('type') == 'searchResEntry':
+            info = _member_info(dn, connection.response[0]['attributes'])
+            cache.set(dn, info)
+            resolved[dn.lower()] = info
+
+    return resolved
+
+
+def get_group_members(ldap_config, group_dn, cache=None):
     """
     Lista todos os membros de um grupo específico.
     
+    Os DNs são lidos com ranged retrieval (grupos com mais de 1500 membros)
+    e resolvidos em lote, em vez de uma busca por membro.
+    
     Args:
         ldap_config: Configuração do LDAP
         group_dn: Distinguished Name do grupo
+        cache: DNCache compartilhado entre chamadas (opcional)
     
     Returns:
         list: Lista de membros [{'dn': '...', 'name': '...', 'email': '...'}]
@@ -262,40 +547,17 @@ def get_group_members(ldap_config, group_dn):
             if not ad.connection:
                 return members
             
-            # Buscar o grupo específico
-            ad.connection.search(
-                search_base=group_dn,
-                search_filter='(objectClass=group)',
-                search_scope=SUBTREE,
-                attributes=['member']
-            )
-            
-            if not ad.connection.entries:
+            member_dns = list(iter_member_dns(ad.connection, group_dn))
+            if not member_dns:
                 return members
             
-            # Pegar lista de membros
-            entry = ad.connection.entries[0]
-            if not hasattr(entry, 'member'):
-                return members
+            resolved = resolve_member_dns(ad.connection, ldap_config, member_dns, cache)
             
-            # Para cada membro, buscar suas informações
-            for member_dn in entry.member:
-                ad.connection.search(
-                    search_base=str(member_dn),
-                    search_filter='(objectClass=*)',
-                    search_scope=SUBTREE,
-                    attributes=['cn', 'name', 'mail', 'sAMAccountName']
-                )
-                
-                if ad.connection.entries:
-                    member_entry = ad.connection.entries[0]
-                    member_info = {
-                        'dn': str(member_dn),
-                        'name': str(member_entry.cn) if hasattr(member_entry, 'cn') else '',
-                        'username': str(member_entry.sAMAccountName) if hasattr(member_entry, 'sAMAccountName') else '',
-                        'email': str(member_entry.mail) if hasattr(member_entry, 'mail') else ''
-                    }
-                    members.append(member_info)
+            # Mantém a ordem do atributo member
+            for dn in member_dns:
+                info = resolved.get(dn.lower())
+                if info:
+                    members.append(dict(info, dn=dn))
     
     except Exception as e:
         logger.error(f"❌ Erro ao listar membros do grupo: {str(e)}")
@@ -320,7 +582,8 @@ def test_ad_connection(ldap_config):
             
             # Buscar informações do servidor
             server_info = {
-                'host': ldap_config.ldap_server,
+                'host': ad.server.name,
+                'servers': probe_directory(ldap_config),
                 'port': ldap_config.port,
                 'ssl': ldap_config.use_ssl,
                 'base_dn': ldap_config.base_dn
@@ -340,83 +603,169 @@ def test_ad_connection(ldap_config):
     except Exception as e:
         return False, f"❌ Erro ao testar conexão: {str(e)}", {}
     
-def list_ad_users(ldap_config):
+def get_sync_watermark(ldap_config, connection=None):
     """
-    Lista todos os usuários ATIVOS do Active Directory.
+    Lê a marca d'água atual do controlador de domínio (RootDSE).
+
+    O uSNChanged é local a cada DC, por isso também retornamos o
+    dsServiceName: se o DC mudar, a marca d'água salva não vale mais. As
+    buscas que usam a marca d'água devem rodar na mesma conexão (mesmo DC).
 
     Args:
         ldap_config: Instância de LdapDirectory com as configurações.
+        connection: Conexão já aberta (opcional, ver directory_connection).
 
     Returns:
-        Lista de dicionários com informações dos usuários, incluindo status de atividade.
+        tuple: (highest_usn: int, server_name: str)
     """
-    from ldap3 import Server, Connection, ALL, SUBTREE
+    with directory_connection(ldap_config, connection) as conn:
+        conn.search(
+            search_base='',
+            search_filter='(objectClass=*)',
+            search_scope=BASE,
+            attributes=['highestCommittedUSN', 'dsServiceName']
+        )
 
-    users = []
+        if not conn.entries:
+            raise LDAPException("RootDSE não retornou highestCommittedUSN")
 
+        entry = conn.entries[0]
+        return int(entry.highestCommittedUSN.value), str(entry.dsServiceName.value or '')
+
+
+def _user_attributes_to_dict(dn, attrs):
+    """Converte os atributos LDAP de um usuário no dicionário usado pela sincronização."""
+    # Alguns atributos podem não existir
     try:
-        # Conectar ao servidor AD
-        server = Server(
-            ldap_config.ldap_server,
-            port=int(ldap_config.port),
-            get_info=ALL
-        )
+        uac_value = int(_attr(attrs, 'userAccountControl', 512))
+    except (TypeError, ValueError):
+        uac_value = 512  # padrão: ativo
 
-        conn = Connection(
-            server,
-            user=ldap_config.bind_user_dn,
-            password=ldap_config.get_password(),
-            auto_bind=True
-        )
+    return {
+        "dn": dn,
+        "username": _attr(attrs, 'sAMAccountName'),
+        "email": _attr(attrs, 'mail'),
+        "first_name": _attr(attrs, 'givenName'),
+        "last_name": _attr(attrs, 'sn'),
+        "display_name": _attr(attrs, 'displayName'),
+        "department": _attr(attrs, 'department'),
+        "title": _attr(attrs, 'title'),
+        "user_account_control": uac_value,
+    }
+
+
+def iter_ad_users(ldap_config, changed_since_usn=None, connection=None):
+    """
+    Percorre os usuários do Active Directory com busca paginada.
 
-        # Definir o DN base da pesquisa
-        search_base = ldap_config.base_dn
+    Args:
+        ldap_config: Instância de LdapDirectory com as configurações.
+        changed_since_usn: Se informado, retorna apenas usuários com
+            uSNChanged maior que este valor (sincronização incremental).
+        connection: Conexão já aberta (opcional, ver directory_connection).
 
+    Yields:
+        dict: Informações do usuário, incluindo userAccountControl.
+    """
+    with directory_connection(ldap_config, connection) as conn:
         # Filtro: somente pessoas (sem computadores)
         search_filter = "(objectCategory=person)"
+        if changed_since_usn is not None:
+            search_filter = f"(&{search_filter}(uSNChanged>={int(changed_since_usn) + 1}))"
 
-        # Buscar usuários e atributos desejados
-        conn.search(
-            search_base=search_base,
-            search_filter=search_filter,
-            search_scope=SUBTREE,
-            attributes=[
-                "sAMAccountName",
-                "displayName",
-                "givenName",
-                "sn",
-                "mail",
-                "department",
-                "title",
-                "userAccountControl",
-            ],
-        )
+        for dn, attrs in paged_search(conn, ldap_config.base_dn, search_filter, AD_USER_ATTRIBUTES):
+            yield _user_attributes_to_dict(dn, attrs)
 
-        for entry in conn.entries:
-            # Alguns atributos podem não existir, por isso usamos try/except ou getattr
-            try:
-                uac_value = int(entry.userAccountControl.value)
-            except Exception:
-                uac_value = 512  # padrão: ativo
-
-            user_data = {
-                "dn": str(entry.entry_dn),
-                "username": str(entry.sAMAccountName.value) if entry.sAMAccountName else "",
-                "email": str(entry.mail.value) if entry.mail else "",
-                "first_name": str(entry.givenName.value) if entry.givenName else "",
-                "last_name": str(entry.sn.value) if entry.sn else "",
-                "display_name": str(entry.displayName.value) if entry.displayName else "",
-                "department": str(entry.department.value) if entry.department else "",
-                "title": str(entry.title.value) if entry.title else "",
-                "user_account_control": uac_value,  # ✅ agora corretamente lido
-            }
 
-            users.append(user_data)
+def list_ad_users(ldap_config, changed_since_usn=None):
+    """
+    Lista os usuários do Active Directory.
+    Para diretórios grandes prefira `iter_ad_users`, que não carrega tudo em memória.
 
-        conn.unbind()
+    Args:
+        ldap_config: Instância de LdapDirectory com as configurações.
+        changed_since_usn: Se informado, retorna apenas usuários com
+            uSNChanged maior que este valor (sincronização incremental).
 
+    Returns:
+        Lista de dicionários com informações dos usuários, incluindo status de atividade.
+    """
+    try:
+        return list(iter_ad_users(ldap_config, changed_since_usn))
     except Exception as e:
         print(f"❌ Erro ao listar usuários do AD: {e}")
         raise
 
-    return users
+
+def _dn_key(dn):
+    """DN normalizado para comparação: [(atributo, valor)] em minúsculas."""
+    return [(attr.lower(), value.lower()) for attr, value, _ in parse_dn(dn, escape=False, strip=True)]
+
+
+def is_dn_under(dn, base_dn):
+    """True se `dn` é `base_dn` ou está abaixo dele (comparação sem caixa/espaços)."""
+    try:
+        dn_key, base_key = _dn_key(dn), _dn_key(base_dn)
+    except LDAPException:
+        return False
+    return len(dn_key) >= len(base_key) and dn_key[len(dn_key) - len(base_key):] == base_key
+
+
+def get_default_naming_context(connection, base_dn):
+    """
+    Naming context do domínio (RootDSE defaultNamingContext).
+
+    Sem resposta do RootDSE, usa os componentes DC= de `base_dn`.
+    """
+    connection.search(
+        search_base='',
+        search_filter='(objectClass=*)',
+        search_scope=BASE,
+        attributes=['defaultNamingContext']
+    )
+    if connection.entries and 'defaultNamingContext' in connection.entries[0]:
+        value = connection.entries[0].defaultNamingContext.value
+        if value:
+            return str(value)
+    return ','.join(part.strip() for part in base_dn.split(',') if part.strip().upper().startswith('DC='))
+
+
+def list_deleted_ad_users(ldap_config, changed_since_usn, connection=None):
+    """
+    Lista usuários removidos do AD (tombstones) desde uma marca d'água.
+
+    O DN de um objeto excluído é alterado pelo AD (CN=...\\0ADEL:<guid>) e
+    ele passa para CN=Deleted Objects na raiz do domínio, por isso a busca
+    parte do naming context do domínio (e não de base_dn, que pode ser uma
+    OU) e só são considerados os tombstones cujo lastKnownParent está dentro
+    de base_dn. O vínculo com o banco é feito pelo sAMAccountName, que é
+    preservado no tombstone.
+
+    Args:
+        ldap_config: Instância de LdapDirectory com as configurações.
+        changed_since_usn: Marca d'água da última sincronização (do mesmo DC).
+        connection: Conexão já aberta (opcional, ver directory_connection).
+
+    Returns:
+        list: Lista de sAMAccountNames removidos
+    """
+    usernames = []
+
+    with directory_connection(ldap_config, connection) as conn:
+        naming_context = get_default_naming_context(conn, ldap_config.base_dn)
+        search_filter = (
+            f"(&(isDeleted=TRUE)(objectClass=user)(!(objectClass=computer))"
+            f"(uSNChanged>={int(changed_since_usn) + 1}))"
+        )
+        for _, attrs in paged_search(conn, naming_context, search_filter,
+                                     ['sAMAccountName', 'lastKnownParent'], controls=[SHOW_DELETED_CONTROL]):
+            # Tombstones de outras OUs do domínio não pertencem a este diretório
+            parent = _attr(attrs, 'lastKnownParent')
+            if parent and not is_dn_under(parent, ldap_config.base_dn):
+                continue
+            username = _attr(attrs, 'sAMAccountName')
+            if username:
+                usernames.append(username)
+
+    logger.info(f"🗑️ Encontrados {len(usernames)} usuários removidos do AD")
+    return usernames
@@ -11,6 +11,18 @@ SECRET_KEY = os.getenv("DJANGO_SECRET_KEY", "unsafe-dev-key")
 DEBUG = os.getenv("DJANGO_DEBUG", "False").lower() == "true"
 ALLOWED_HOSTS = [h.strip() for h in os.getenv("ALLOWED_HOSTS", "127.0.0.1,localhost").split(",") if h.strip()]
 CRYPTO_MASTER_KEY = os.getenv("CRYPTO_MASTER_KEY")
+# Chaves versionadas ("versão:chave,versão:chave") e versão usada nas novas gravações.
+# Sem CRYPTO_KEY_VERSION, as senhas continuam no formato legado (CRYPTO_MASTER_KEY).
+CRYPTO_KEYS = os.getenv("CRYPTO_KEYS", "")
+CRYPTO_KEY_VERSION = os.getenv("CRYPTO_KEY_VERSION", "")
+# Token do Prometheus em /metrics/ (vazio: só superusuários logados)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Diretório local onde os processos do host (gunicorn, run_sync_worker) gravam as
+# métricas para o /metrics/ somá-las (vazio: cada processo expõe só as suas).
+# Limpe-o ao reiniciar o serviço.
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+# Views acima do orçamento de queries (@query_budget) falham em vez de só gerar aviso (CI/dev)
+QUERY_BUDGET_ENFORCE = os.getenv("QUERY_BUDGET_ENFORCE", "False").lower() == "true"
 
 # === Aplicativos instalados ===
 INSTALLED_APPS = [
@@ -20,6 +32,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",  # pg_trgm (busca de usuários/grupos do AD)
     # --- Apps externos ---
     "rest_framework",
     "corsheaders",
@@ -38,12 +51,14 @@ INSTALLED_APPS = [
 # === Middleware ===
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "core.middleware.MetricsMiddleware",  # Duração e queries por view (/metrics/)
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.locale.LocaleMiddleware",  # Middleware de idioma
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "access_control.middleware.AuthorizationContextMiddleware",
     "accounts.middleware.UserLanguageMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
@@ -87,6 +102,27 @@ DATABASES = {
     }
 }
 
+# === Cache compartilhado entre os workers ===
+# Contenção de login (accounts.throttle) e invalidação do contexto de
+# autorização (access_control.authz) precisam de um cache visto por todos os
+# processos. Com REDIS_URL usa o Redis (pacote redis); sem ele, a tabela
+# django_cache do PostgreSQL (python manage.py createcachetable).
+REDIS_URL = os.getenv("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "django_cache",
+        }
+    }
+
 # === Autenticação ===
 AUTH_USER_MODEL = "accounts.User"
 
@@ -3,6 +3,7 @@ from django.urls import path, include
 from django.conf.urls.i18n import i18n_patterns
 from django.views.generic import RedirectView
 from access_control import views as access_views  # ← NOVA LINHA
+from core import views as core_views
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -10,6 +11,7 @@ urlpatterns = [
     path("login/", RedirectView.as_view(pattern_name='accounts:home_choice'), name='login'),
     path("logout/", RedirectView.as_view(pattern_name='accounts:logout'), name='logout_redirect'),
     path("admin-login/", access_views.admin_login, name='admin_login'),  # ← NOVA LINHA (sem idioma!)
+    path("metrics/", core_views.metrics, name='metrics'),  # Coleta do Prometheus (sem idioma)
 ]
 
 urlpatterns += i18n_patterns(